@@ -1,30 +1,31 @@
+import argparse
 import asyncio
+import importlib.util
 import os
 import base64
 import io
+import time
+
+import numpy as np
 
-from openai import AsyncAzureOpenAI
 from openai.helpers import LocalAudioPlayer
 
 from dotenv import load_dotenv
 
+from audio_result import AudioResult, apply_stream_chunk
+from audio_tee import AudioTee
+from audio_writer import AtomicAudioWriter
+from endpoint_pool import pool_from_env
+from segment_cache import SegmentCache, segment_key
+
 load_dotenv()
 
-client = AsyncAzureOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
-)
+# One or more Azure OpenAI endpoints (see AZURE_OPENAI_ENDPOINTS)
+endpoint_pool = pool_from_env()
 
-async def main() -> None:
-    try:
-        # Try gpt-audio model approach first
-        response = await client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
-            messages=[
-                {
-                    "role": "user", 
-                    "content": """Voice Affect: Soft, gentle, soothing; embody tranquility.
+VOICE = "coral"
+
+PROMPT = """Voice Affect: Soft, gentle, soothing; embody tranquility.
 
 Tone: Calm, reassuring, peaceful; convey genuine warmth and serenity.
 
@@ -39,14 +40,33 @@ Pauses: Use thoughtful pauses, especially between breathing instructions and vis
 Text to speak: Hello, and welcome to your moment of mindfulness. I'm so glad you're here. Let's begin by closing your eyes and taking a deep, calming breath. Breathe in slowly through your nose, and exhale softly, releasing any tension.
 
 Imagine your thoughts as soft clouds drifting across the sky—observe them without attachment, letting your mind become clear and peaceful."""
+
+# The parts of PROMPT the cache entry is keyed by
+INSTRUCTIONS, _, TEXT = PROMPT.partition("\n\nText to speak: ")
+# The whole clip is one entry: a single stream cannot be cut into the
+# per-sentence segments the soundboard looks up, so the sample keeps its
+# entries in a directory of its own
+CACHE_DIR = os.getenv("SAMPLE_CACHE_DIR", os.path.join(".cache", "async-sample"))
+
+async def main() -> None:
+    try:
+        # Try gpt-audio model approach first
+        async with endpoint_pool.alease(stream=False) as endpoint:
+            response = await endpoint.async_client().chat.completions.create(
+                model=endpoint.deployment,
+                messages=[
+                    {
+                        "role": "user", 
+                        "content": PROMPT
+                    }
+                ],
+                modalities=["text", "audio"],
+                audio={
+                    "voice": VOICE,
+                    "format": "mp3"
                 }
-            ],
-            modalities=["text", "audio"],
-            audio={
-                "voice": "coral",
-                "format": "mp3"
-            }
-        )
+            )
+            endpoint.record_completion()
         
         # Extract and save audio data
         if hasattr(response, 'choices') and response.choices:
@@ -70,5 +90,113 @@ Imagine your thoughts as soft clouds drifting across the sky—observe them with
         print(f"gpt-audio approach failed: {e}")
         print("Please check your gpt-audio deployment configuration.")
 
+async def play_chunks(chunks):
+    """Play 16-bit PCM chunks on the default output device as they arrive"""
+    async def buffers():
+        carry = b""
+        async for chunk in chunks:
+            # Deltas are not guaranteed to end on a sample boundary
+            data = carry + chunk
+            usable = len(data) - len(data) % 2
+            carry = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=np.int16)
+    await LocalAudioPlayer().play_stream(buffers())
+
+async def write_chunks(chunks, path):
+    with AtomicAudioWriter(path, audio_format="pcm16") as writer:
+        async for chunk in chunks:
+            # Off the event loop, so a slow disk cannot delay playback
+            await asyncio.to_thread(writer.write, chunk)
+
+async def cache_chunks(chunks, cache, key, result):
+    audio = bytearray()
+    async for chunk in chunks:
+        audio += chunk
+    # The tts-1 fallback is never used here, so the clip is the styled rendering
+    await asyncio.to_thread(cache.put, key, bytes(audio), {
+        "transcript": result.transcript,
+        "model": result.model,
+        "fallback": False,
+        "usage": result.usage,
+        "render_seconds": result.chunks[-1].elapsed if result.chunks else 0.0,
+    })
+
+async def stream_main(output_path="speech.wav", play=True, use_cache=True) -> None:
+    """Request the audio once and tee the stream to the speakers, a file and the cache"""
+    cache = SegmentCache(CACHE_DIR) if use_cache else None
+    key = segment_key(VOICE, INSTRUCTIONS, TEXT, "pcm16")
+    cached = cache.get(key) if cache is not None else None
+    result = AudioResult(voice=VOICE, format="pcm16", keep_audio=False)
+
+    async def upstream():
+        result.started_at = time.perf_counter()
+        if cached is not None:
+            print("Serving from cache")
+            audio = cached[0]
+            for offset in range(0, len(audio), 9600):
+                yield audio[offset:offset + 9600]
+            return
+        async with endpoint_pool.alease() as endpoint:
+            stream = await endpoint.async_client().chat.completions.create(
+                model=endpoint.deployment,
+                messages=[{"role": "user", "content": PROMPT}],
+                modalities=["text", "audio"],
+                audio={"voice": VOICE, "format": "pcm16"},
+                stream=True,
+            )
+            async for chunk in stream:
+                audio = apply_stream_chunk(result, chunk)
+                if audio:
+                    endpoint.record_ttfb()
+                    yield audio
+
+    tee = AudioTee()
+    if play:
+        if importlib.util.find_spec("sounddevice") is None:
+            print("Playback disabled: install openai[voice_helpers] for sounddevice")
+        else:
+            # Playback sets the pace; file and cache sinks trail it independently
+            tee.add_sink("playback", play_chunks)
+    if output_path:
+        tee.add_sink("file", lambda chunks: write_chunks(chunks, output_path))
+    if cache is not None and cached is None:
+        # Best effort: a cache that falls behind is dropped rather than buffered
+        tee.add_sink("cache", lambda chunks: cache_chunks(chunks, cache, key, result),
+                     policy="detach", max_chunks=256)
+
+    try:
+        await tee.run(upstream())
+    finally:
+        # Also when the upstream failed, to show how far each sink got
+        print_stats(tee, output_path)
+
+def print_stats(tee, output_path):
+    stats = tee.stats()
+    first = [s["first_chunk"] for s in stats.values() if s["first_chunk"] is not None]
+    ttfa = stats["playback"]["first_chunk"] if "playback" in stats else min(first, default=None)
+    total = max((s["finished"] for s in stats.values() if s["finished"] is not None), default=0.0)
+    print(f"Time to first audio: {ttfa:.3f}s" if ttfa is not None else "No audio received")
+    if tee.upstream_done_at is None:
+        print(f"Upstream failed after {total:.3f}s")
+    else:
+        print(f"End to end: {total:.3f}s (upstream finished at {tee.upstream_done_at - tee.started_at:.3f}s)")
+    for name, s in stats.items():
+        status = "detached" if s["detached"] else f"error: {s['error']}" if s["error"] else "ok"
+        print(f"  {name:<9} {s['chunks']:>5} chunks {s['bytes']:>9} bytes  max lag {s['max_lag']:>3}  {status}")
+    # An aborted stream leaves the previous file in place
+    if output_path and "file" in stats and not stats["file"]["error"] and tee.upstream_done_at is not None:
+        print(f"Audio saved to: {output_path}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Azure OpenAI gpt-audio async sample")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the audio and play, save and cache it at the same time")
+    parser.add_argument("--output", default="speech.wav", help="file to save the streamed audio to")
+    parser.add_argument("--no-play", action="store_true", help="do not play the audio")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the segment cache")
+    args = parser.parse_args()
+    if args.stream:
+        asyncio.run(stream_main(args.output, play=not args.no_play, use_cache=not args.no_cache))
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,543 @@
+"""Bandwidth-efficient delivery of finished clips to the browser.
+
+Clips are stored under the SHA-256 of their bytes and served from
+/audio/<id> with a strong ETag, Last-Modified and a year-long immutable
+Cache-Control (the URL changes whenever the content does), so a replay
+costs a 304 or nothing at all. Single byte ranges are supported, so a
+player seeks without downloading what comes before. When ffmpeg is
+installed, every clip also gets a low-bitrate Opus variant for mobile
+clients and Save-Data users, picked by negotiation (see negotiate()).
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+
+PREFIX = "/audio"
+CHUNK_SIZE = 64 * 1024
+MAX_CLIPS = 500
+# Speech stays intelligible well below music bitrates
+OPUS_BITRATE = "32k"
+TRANSCODE_TIMEOUT_SECONDS = 60
+# The URL of a clip changes with its content, so responses never go stale
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Request headers the bare clip URL is negotiated on
+VARY = "Accept, Save-Data, Sec-CH-UA-Mobile"
+
+MEDIA_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".ogg": "audio/ogg"}
+OPUS_MEDIA_TYPE = "audio/ogg; codecs=opus"
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+MOBILE_USER_AGENT = re.compile(r"Mobi|Android|iPhone|iPad", re.IGNORECASE)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a Range header, or None to send the whole file.
+
+    Only single ranges are honoured: a multi-range or malformed header is
+    ignored, as RFC 9110 allows. Raises RangeNotSatisfiable for a range
+    starting past the end.
+    """
+    match = RANGE.match((header or "").strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last n bytes
+        length = int(last)
+        if not length:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    if end < start:
+        return None
+    return start, end
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak, so W/"x" matches "x")"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+@dataclass
+class Delivery:
+    """How to answer one request for a file: status, headers and byte range"""
+    status: int
+    headers: dict = field(default_factory=dict)
+    start: int = 0
+    end: int = -1
+
+    @property
+    def length(self):
+        return self.end - self.start + 1
+
+
+def prepare(path, etag, media_type, headers):
+    """Apply conditional and Range request headers to a stored file.
+
+    headers is the request's (case-insensitive) header mapping. Returns a
+    Delivery with status 200, 206, 304 or 416.
+    """
+    stat = os.stat(path)
+    size, modified = stat.st_size, int(stat.st_mtime)
+    response = {
+        "ETag": etag,
+        "Last-Modified": http_date(modified),
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Delivery(304, response)
+    else:
+        # If-Modified-Since only counts without If-None-Match
+        since = parse_http_date(headers.get("if-modified-since"))
+        if since is not None and modified <= since:
+            return Delivery(304, response)
+
+    response["Content-Type"] = media_type
+    byte_range = None
+    if_range = headers.get("if-range")
+    # A range is only valid against the copy the client has part of
+    if if_range is None or if_range == etag or parse_http_date(if_range) == modified:
+        try:
+            byte_range = parse_range(headers.get("range"), size)
+        except RangeNotSatisfiable:
+            response["Content-Range"] = f"bytes */{size}"
+            response["Content-Length"] = "0"
+            return Delivery(416, response)
+    if byte_range is None:
+        response["Content-Length"] = str(size)
+        return Delivery(200, response, 0, size - 1)
+    start, end = byte_range
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    return Delivery(206, response, start, end)
+
+
+def iter_file(path, start, end, chunk_size=CHUNK_SIZE):
+    """Bytes start..end (inclusive) of path, chunk by chunk"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def prefers_small(headers):
+    """True for clients that should get the low-bitrate variant"""
+    return (headers.get("save-data", "").strip().lower() == "on"
+            or headers.get("sec-ch-ua-mobile", "").strip() == "?1"
+            or bool(MOBILE_USER_AGENT.search(headers.get("user-agent", ""))))
+
+
+def negotiate(headers, variants):
+    """Pick the variant to serve for the bare clip URL.
+
+    Opus goes to clients that prefer small responses and say they can play
+    it in Accept; everyone else gets the original. Browsers send a bare
+    "*/*" for media, so the player page names variants explicitly instead
+    (see player_html()) and lets the browser skip what it cannot play.
+    """
+    accept = headers.get("accept", "").lower()
+    if "opus" in variants and prefers_small(headers) and ("opus" in accept or "audio/ogg" in accept):
+        return "opus"
+    return "original"
+
+
+class OpusTranscoder:
+    """Re-encode clips as low-bitrate Ogg Opus with ffmpeg"""
+
+    def __init__(self, bitrate=OPUS_BITRATE):
+        self.binary = shutil.which("ffmpeg")
+        self.bitrate = bitrate
+
+    def is_available(self):
+        return self.binary is not None
+
+    @property
+    def tag(self):
+        # Part of the variant's file name and ETag, so a new bitrate is a new variant
+        return f"opus-{self.bitrate}"
+
+    def transcode(self, source, output_path):
+        subprocess.run([self.binary, "-nostdin", "-loglevel", "error", "-y", "-i", source,
+                        "-c:a", "libopus", "-b:a", self.bitrate, "-application", "voip", "-f", "ogg", output_path],
+                       check=True, timeout=TRANSCODE_TIMEOUT_SECONDS,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class ClipStore:
+    """Finished clips on disk, content-addressed, with their Opus variants.
+
+    add() copies a clip in and returns its id; the Opus variant is encoded
+    in the background straight away, so it is usually ready before the
+    browser asks for it. A variant that is not smaller than the original
+    is dropped. The oldest clips beyond max_clips are deleted.
+    """
+
+    def __init__(self, directory, max_clips=MAX_CLIPS, transcoder=None):
+        self.directory = directory
+        self.max_clips = max_clips
+        self.transcoder = transcoder if transcoder is not None and transcoder.is_available() else None
+        self.stats = Counter()
+        self._clips = OrderedDict()  # id -> original's extension
+        self._variants = {}  # (id, variant) -> path, or a Future while encoding
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="transcode") if self.transcoder else None
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            clip_id, ext = os.path.splitext(entry.name)
+            if ext in MEDIA_TYPES and "." not in clip_id:
+                entries.append((entry.stat().st_mtime, clip_id, ext))
+        for _, clip_id, ext in sorted(entries):
+            self._clips[clip_id] = ext
+            variant_path = self._variant_path(clip_id)
+            if variant_path is not None and os.path.exists(variant_path):
+                self._variants[clip_id, "opus"] = variant_path
+
+    @property
+    def variants(self):
+        return ("original", "opus") if self.transcoder else ("original",)
+
+    def _original_path(self, clip_id):
+        return os.path.join(self.directory, clip_id + self._clips[clip_id])
+
+    def _variant_path(self, clip_id):
+        if self.transcoder is None:
+            return None
+        return os.path.join(self.directory, f"{clip_id}.{self.transcoder.tag}.ogg")
+
+    def add(self, path):
+        """Store the clip at path and return its id"""
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        clip_id = hasher.hexdigest()[:32]
+        ext = os.path.splitext(path)[1].lower()
+        with self._lock:
+            if clip_id in self._clips:
+                self._clips.move_to_end(clip_id)
+                return clip_id
+        target = os.path.join(self.directory, clip_id + ext)
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+        with self._lock:
+            self._clips[clip_id] = ext
+            if self._executor is not None:
+                self._variants[clip_id, "opus"] = self._executor.submit(self._transcode, clip_id)
+            evicted = []
+            while len(self._clips) > self.max_clips:
+                evicted.append(self._clips.popitem(last=False))
+                self._variants.pop((evicted[-1][0], "opus"), None)
+        for old_id, old_ext in evicted:
+            for old_path in (os.path.join(self.directory, old_id + old_ext), self._variant_path(old_id)):
+                if old_path is not None and os.path.exists(old_path):
+                    os.remove(old_path)
+        return clip_id
+
+    def _transcode(self, clip_id):
+        with self._lock:
+            # add() may evict the clip before or while it is encoded
+            if clip_id not in self._clips:
+                return None
+            source = self._original_path(clip_id)
+        output_path = self._variant_path(clip_id)
+        tmp_path = f"{output_path}.tmp"
+        started_at = time.perf_counter()
+        try:
+            self.transcoder.transcode(source, tmp_path)
+            with self._lock:
+                if clip_id not in self._clips:
+                    os.remove(tmp_path)
+                    return None
+                if os.path.getsize(tmp_path) >= os.path.getsize(source):
+                    self.stats["transcodes_dropped"] += 1
+                    os.remove(tmp_path)
+                    return None
+                os.replace(tmp_path, output_path)
+        except (OSError, subprocess.SubprocessError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"Opus transcode of {clip_id} failed: {e}")
+            self.stats["transcode_failures"] += 1
+            return None
+        self.stats["transcodes"] += 1
+        self.stats["transcode_ms"] += int((time.perf_counter() - started_at) * 1000)
+        return output_path
+
+    def has_variant(self, clip_id, variant):
+        """True if clip_id has (or is encoding) the variant"""
+        with self._lock:
+            return (clip_id, variant) in self._variants or (variant == "original" and clip_id in self._clips)
+
+    def get(self, clip_id, variant="original"):
+        """(path, ETag, media type, variant served) of a stored clip, or None.
+
+        Waits for a variant still being encoded; a variant that is missing
+        or failed falls back to the original.
+        """
+        with self._lock:
+            if clip_id not in self._clips:
+                return None
+            self._clips.move_to_end(clip_id)
+            original = self._original_path(clip_id)
+            ext = self._clips[clip_id]
+            variant_path = self._variants.get((clip_id, variant)) if variant != "original" else None
+        if variant_path is not None and not isinstance(variant_path, str):
+            variant_path = variant_path.result()
+            with self._lock:
+                if (clip_id, variant) in self._variants:
+                    if variant_path is None:
+                        del self._variants[clip_id, variant]
+                    else:
+                        self._variants[clip_id, variant] = variant_path
+        if variant_path is not None:
+            return variant_path, f'"{clip_id}.{self.transcoder.tag}"', OPUS_MEDIA_TYPE, variant
+        return original, f'"{clip_id}"', MEDIA_TYPES[ext], "original"
+
+    def record(self, variant, status, queued=0):
+        """Count a response, and the body bytes queued for it, towards the delivery stats.
+
+        Bytes are counted as they are handed to the server, which buffers
+        some ahead of the socket, so a dropped response may have reached
+        the client with less than was queued.
+        """
+        with self._lock:
+            if status:
+                self.stats["requests"] += 1
+                self.stats[f"status_{status}"] += 1
+                self.stats[f"requests_{variant}"] += 1
+            self.stats["bytes_queued"] += queued
+            self.stats[f"bytes_queued_{variant}"] += queued
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+            clips = len(self._clips)
+        return {
+            "clips": clips,
+            "variants": list(self.variants),
+            **stats,
+            # Replays answered without resending the clip
+            "not_modified_ratio": stats.get("status_304", 0) / stats["requests"] if stats.get("requests") else 0.0,
+            "bytes_queued_per_request": stats.get("bytes_queued", 0) / stats["requests"] if stats.get("requests") else 0.0,
+        }
+
+
+def player_html(clip_id, headers=None, prefix=PREFIX, variants=("original",), media_type="audio/mpeg"):
+    """An <audio> element for a stored clip, with one <source> per variant.
+
+    The browser plays the first source it supports; clients that prefer
+    small responses get the Opus variant listed first.
+    """
+    sources = [(f"{prefix}/{clip_id}?variant=original", media_type)]
+    if "opus" in variants:
+        opus = (f"{prefix}/{clip_id}?variant=opus", OPUS_MEDIA_TYPE)
+        if prefers_small(headers or {}):
+            sources.insert(0, opus)
+        else:
+            sources.append(opus)
+    tags = "".join(f'<source src="{src}" type="{kind}">' for src, kind in sources)
+    return f'<audio controls autoplay preload="auto" style="width: 100%">{tags}</audio>'
+
+
+def mount(app, store, prefix=PREFIX):
+    """Add GET and HEAD {prefix}/{clip_id} to a FastAPI app.
+
+    ?variant=original or ?variant=opus picks a variant explicitly (these
+    URLs are what player_html() uses); without it the variant is
+    negotiated from the request headers.
+    """
+    from fastapi import Request, Response
+    from fastapi.responses import StreamingResponse
+    from starlette.concurrency import run_in_threadpool
+
+    async def serve_clip(clip_id: str, request: Request, variant: str = None):
+        if variant is None:
+            variant = negotiate(request.headers, store.variants)
+            vary = {"Vary": VARY}
+        else:
+            vary = {}
+        if variant not in ("original", "opus"):
+            return Response(status_code=400, content="Unknown variant")
+        # Waits for the variant if it is still being encoded
+        found = await run_in_threadpool(store.get, clip_id, variant)
+        if found is None:
+            return Response(status_code=404)
+        path, etag, media_type, variant = found
+        delivery = prepare(path, etag, media_type, request.headers)
+        headers = {**delivery.headers, **vary}
+        if delivery.status not in (200, 206) or request.method == "HEAD":
+            if request.method == "GET":
+                store.record(variant, delivery.status)
+            return Response(status_code=delivery.status, headers=headers)
+        store.record(variant, delivery.status)
+
+        def body():
+            # A seeking player drops the response early; count what was queued
+            queued = 0
+            try:
+                for chunk in iter_file(path, delivery.start, delivery.end):
+                    yield chunk
+                    queued += len(chunk)
+            finally:
+                store.record(variant, None, queued)
+
+        return StreamingResponse(body(), status_code=delivery.status, headers=headers, media_type=media_type)
+
+    app.add_api_route(f"{prefix}/{{clip_id}}", serve_clip, methods=["GET", "HEAD"], include_in_schema=False)
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import socket
+    import statistics
+    import tempfile
+
+    import httpx
+    import uvicorn
+    from fastapi import FastAPI, Response
+
+    from chunk_batching import BYTES_PER_SECOND
+
+    parser = argparse.ArgumentParser(description="Bytes per play and time to playback start, "
+                                                 "with and without the delivery layer")
+    parser.add_argument("--clip", help="audio file to serve (default: synthetic data the size of a 30 s MP3)")
+    parser.add_argument("--duration", type=float, help="length of --clip in seconds (default: estimated as MP3)")
+    parser.add_argument("--plays", type=int, default=5, help="plays of the whole clip")
+    parser.add_argument("--seeks", type=int, default=8, help="seeks in the seek-heavy play")
+    parser.add_argument("--kbps", type=float, default=1600, help="simulated downlink (0 = unthrottled)")
+    parser.add_argument("--startup-seconds", type=float, default=1.0, help="audio a player buffers before it starts")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    clip = args.clip
+    if clip is None:
+        # Delivery is byte-level, so random data of a 30 s MP3's size stands in for one
+        clip = os.path.join(workdir, "clip.mp3")
+        with open(clip, "wb") as f:
+            f.write(random.Random(0).randbytes(int(30 * BYTES_PER_SECOND["mp3"])))
+    duration = args.duration or os.path.getsize(clip) / BYTES_PER_SECOND["mp3"]
+    transcoder = OpusTranscoder()
+    if not transcoder.is_available():
+        print("ffmpeg not found: measuring the original only, without the Opus variant")
+    store = ClipStore(os.path.join(workdir, "clips"), transcoder=transcoder)
+    clip_id = store.add(clip)
+
+    app = FastAPI()
+    mount(app, store)
+
+    @app.get("/baseline/{clip_id}")
+    def baseline(clip_id: str):
+        # How the soundboard's streamed gr.Audio output serves a clip: no validators, no ranges, no-store
+        with open(store.get(clip_id)[0], "rb") as f:
+            return Response(f.read(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+
+    def fetch(client, url, headers, need, read_all):
+        """GET url; returns (status, body bytes received, seconds until `need` bytes had arrived, ETag).
+
+        Reads are paced to the simulated downlink. Unless read_all, the
+        response is dropped once `need` bytes are in, as a player does
+        when the user seeks again.
+        """
+        started_at = time.perf_counter()
+        received, ready = 0, None
+        with client.stream("GET", url, headers=headers) as response:
+            for chunk in response.iter_raw(4 * 1024):
+                received += len(chunk)
+                if args.kbps:
+                    time.sleep(len(chunk) * 8 / (args.kbps * 1000))
+                if ready is None and received >= need:
+                    ready = time.perf_counter() - started_at
+                    if not read_all:
+                        break
+        if ready is None:
+            ready = time.perf_counter() - started_at
+        return response.status_code, received, ready, response.headers.get("etag")
+
+    def scenario(label, url, variant, use_validators, use_ranges):
+        size = os.path.getsize(store.get(clip_id, variant)[0])
+        startup = max(int(args.startup_seconds * size / duration), 1)
+        rng = random.Random(1)
+        with httpx.Client(timeout=60) as client:
+            # Repeated plays of the whole clip. With validators a replay is
+            # revalidated; a browser honouring "immutable" would not even ask
+            etag, total, starts = None, 0, []
+            for _ in range(args.plays):
+                headers = {"If-None-Match": etag} if use_validators and etag else {}
+                status, received, ready, response_etag = fetch(client, url, headers, startup, True)
+                if status == 200:
+                    etag = response_etag
+                total += received
+                starts.append(ready)
+            print(f"{label:<24} {'repeat':<7} {total / args.plays / 1024:>9.1f} {statistics.mean(starts) * 1000:>9.0f}")
+
+            # One play with seeks to random positions, a few seconds from each
+            total, starts = 0, []
+            for _ in range(args.seeks):
+                position = rng.randrange(size - startup)
+                if use_ranges:
+                    _, received, ready, _ = fetch(client, url, {"Range": f"bytes={position}-"}, startup, False)
+                else:
+                    # Without ranges the player reads from the start up to the seek position
+                    _, received, ready, _ = fetch(client, url, {}, position + startup, False)
+                total += received
+                starts.append(ready)
+            print(f"{label:<24} {'seek':<7} {total / args.seeks / 1024:>9.1f} {statistics.mean(starts) * 1000:>9.0f}")
+
+    print(f"clip: {os.path.getsize(clip) / 1024:.0f} KiB, {duration:.0f} s; "
+          f"downlink: {f'{args.kbps:.0f} kbps' if args.kbps else 'unthrottled'}; "
+          f"playback starts after {args.startup_seconds:g} s of audio")
+    print(f"{'delivery':<24} {'play':<7} {'KiB/play':>9} {'start ms':>9}")
+    scenario("baseline (no-store)", f"{base}/baseline/{clip_id}", "original", False, False)
+    scenario("validators + ranges", f"{base}{PREFIX}/{clip_id}?variant=original", "original", True, True)
+    if store.get(clip_id, "opus")[3] == "opus":
+        scenario(f"opus {transcoder.bitrate} + ranges", f"{base}{PREFIX}/{clip_id}?variant=opus", "opus", True, True)
+    print(store.report())
+    server.should_exit = True
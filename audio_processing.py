@@ -0,0 +1,307 @@
+import time
+
+import numpy as np
+
+# gpt-audio returns raw PCM as 16-bit little-endian mono at 24 kHz
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+
+# Defaults tuned for speech: normalize towards a comfortable listening level,
+# treat anything under -45 dBFS as silence and keep a short lead-in so the
+# first consonant is not clipped.
+TARGET_DBFS = -20.0
+PEAK_LIMIT = 0.98
+SILENCE_DBFS = -45.0
+FRAME_MS = 10
+KEEP_MS = 30
+FADE_MS = 15
+LOOKAHEAD_MS = 200
+
+
+def pcm16_to_float(data):
+    """Convert raw PCM16 bytes to float32 samples in [-1.0, 1.0]"""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def float_to_pcm16(samples):
+    """Convert float samples back to raw PCM16 bytes"""
+    clipped = np.clip(samples, -1.0, 1.0)
+    return (clipped * 32767.0).astype("<i2").tobytes()
+
+
+def ms_to_samples(ms, sample_rate=SAMPLE_RATE):
+    return int(sample_rate * ms / 1000)
+
+
+def rms_dbfs(samples):
+    """Return the RMS level of the samples in dBFS (-inf for digital silence)"""
+    if samples.size == 0:
+        return float("-inf")
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    return 20.0 * np.log10(rms) if rms > 0 else float("-inf")
+
+
+def frame_levels(samples, frame_ms=FRAME_MS, sample_rate=SAMPLE_RATE):
+    """Return the per-frame RMS level in dBFS, computed in one vectorized pass"""
+    frame_len = max(ms_to_samples(frame_ms, sample_rate), 1)
+    n_frames = samples.size // frame_len
+    if n_frames == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    with np.errstate(divide="ignore"):
+        return 20.0 * np.log10(rms)
+
+
+def loudness_gain(samples, target_dbfs=TARGET_DBFS, peak_limit=PEAK_LIMIT,
+                  silence_dbfs=SILENCE_DBFS):
+    """Compute the linear gain that brings the voiced frames to target_dbfs.
+
+    Only frames above the silence threshold are measured (a cheap gating step
+    similar to LUFS integration) so long pauses do not inflate the gain. The
+    gain is capped so the loudest sample stays under peak_limit.
+    """
+    levels = frame_levels(samples)
+    voiced = levels[levels > silence_dbfs]
+    if voiced.size == 0:
+        return 1.0
+    # Average the voiced frames in the power domain, not in dB
+    level = 10.0 * np.log10(np.mean(np.power(10.0, voiced / 10.0)))
+    gain = 10.0 ** ((target_dbfs - level) / 20.0)
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    if peak > 0:
+        gain = min(gain, peak_limit / peak)
+    return float(gain)
+
+
+def normalize_loudness(samples, target_dbfs=TARGET_DBFS, peak_limit=PEAK_LIMIT):
+    """Scale the samples so voiced speech sits at target_dbfs"""
+    return samples * loudness_gain(samples, target_dbfs, peak_limit)
+
+
+def first_audible_sample(samples, threshold_dbfs=SILENCE_DBFS, frame_ms=FRAME_MS):
+    """Return the index of the first audible frame, or None if all silent"""
+    levels = frame_levels(samples, frame_ms)
+    audible = np.flatnonzero(levels > threshold_dbfs)
+    if audible.size == 0:
+        return None
+    return int(audible[0]) * ms_to_samples(frame_ms)
+
+
+def last_audible_sample(samples, threshold_dbfs=SILENCE_DBFS, frame_ms=FRAME_MS):
+    """Return the index just past the last audible frame, or None if all silent"""
+    levels = frame_levels(samples, frame_ms)
+    audible = np.flatnonzero(levels > threshold_dbfs)
+    if audible.size == 0:
+        return None
+    return (int(audible[-1]) + 1) * ms_to_samples(frame_ms)
+
+
+def leading_trim(samples, threshold_dbfs=SILENCE_DBFS, keep_ms=KEEP_MS):
+    """Number of samples trim_silence drops from the start (all of them when silent)"""
+    first = first_audible_sample(samples, threshold_dbfs)
+    if first is None:
+        return samples.size
+    return max(first - ms_to_samples(keep_ms), 0)
+
+
+def trim_silence(samples, threshold_dbfs=SILENCE_DBFS, keep_ms=KEEP_MS,
+                 leading=True, trailing=True):
+    """Remove leading and/or trailing silence, keeping keep_ms of padding"""
+    keep = ms_to_samples(keep_ms)
+    start, end = 0, samples.size
+    if leading:
+        start = leading_trim(samples, threshold_dbfs, keep_ms)
+        if start == samples.size:
+            return samples[:0]
+    if trailing:
+        last = last_audible_sample(samples, threshold_dbfs)
+        if last is None:
+            return samples[:0]
+        end = min(last + keep, samples.size)
+    return samples[start:end]
+
+
+def crossfade(a, b, fade_ms=FADE_MS):
+    """Join two sample arrays with an equal-power crossfade"""
+    n = min(ms_to_samples(fade_ms), a.size, b.size)
+    if n == 0:
+        return np.concatenate([a, b])
+    t = np.linspace(0.0, np.pi / 2, n, dtype=np.float32)
+    overlap = a[-n:] * np.cos(t) + b[:n] * np.sin(t)
+    return np.concatenate([a[:-n], overlap, b[n:]])
+
+
+def join_segments(segments, fade_ms=FADE_MS):
+    """Crossfade a list of PCM16 byte segments into one PCM16 buffer"""
+    joined = np.empty(0, dtype=np.float32)
+    for segment in segments:
+        samples = pcm16_to_float(segment)
+        joined = crossfade(joined, samples, fade_ms) if joined.size else samples
+    return float_to_pcm16(joined)
+
+
+def postprocess_pcm16(data, normalize=True, trim=True):
+    """Post-process a complete PCM16 clip (normalize loudness, trim silence)"""
+    samples = pcm16_to_float(data[:len(data) - len(data) % SAMPLE_WIDTH])
+    if trim:
+        samples = trim_silence(samples)
+    if normalize:
+        samples = normalize_loudness(samples)
+    return float_to_pcm16(samples)
+
+
+def leading_trim_bytes(data, trim=True):
+    """Bytes postprocess_pcm16 cuts from the start of data, to shift offsets into it"""
+    if not trim:
+        return 0
+    return leading_trim(pcm16_to_float(data[:len(data) - len(data) % SAMPLE_WIDTH])) * SAMPLE_WIDTH
+
+
+class StreamingPostProcessor:
+    """Incremental post-processing for streamed PCM16 audio.
+
+    Audio is held back until the first audible frame is found (so leading
+    silence is dropped before anything is played), then released with a
+    look-ahead window of lookahead_ms. The loudness gain is estimated from
+    the samples seen so far and smoothed between chunks, and the final
+    window is trimmed of trailing silence on flush().
+
+    trimmed counts the input bytes dropped as leading silence; on_trim, if
+    given, is called with it once the first audible frame is found, so byte
+    offsets into the raw stream can be shifted onto the processed one.
+    """
+
+    def __init__(self, normalize=True, trim=True, lookahead_ms=LOOKAHEAD_MS,
+                 target_dbfs=TARGET_DBFS, smoothing=0.3, on_trim=None):
+        self.normalize = normalize
+        self.trim = trim
+        self.lookahead = ms_to_samples(lookahead_ms)
+        self.target_dbfs = target_dbfs
+        self.smoothing = smoothing
+        self.gain = None
+        self.started = not trim
+        self.trimmed = 0
+        self.on_trim = on_trim
+        self._remainder = b""
+        self._pending = np.empty(0, dtype=np.float32)
+        self._history = np.empty(0, dtype=np.float32)
+
+    def _apply_gain(self, samples):
+        if not self.normalize or samples.size == 0:
+            return samples
+        # Estimate on recent history plus the look-ahead so the gain can
+        # react before a loud passage is released
+        window = np.concatenate([self._history, self._pending])
+        target = loudness_gain(window, self.target_dbfs)
+        if self.gain is None:
+            self.gain = target
+        else:
+            self.gain += self.smoothing * (target - self.gain)
+        # The peak limit is re-checked on what is actually going out
+        peak = float(np.max(np.abs(samples)))
+        gain = min(self.gain, PEAK_LIMIT / peak) if peak > 0 else self.gain
+        return samples * gain
+
+    def feed(self, data):
+        """Add a chunk of PCM16 bytes and return the bytes ready to play"""
+        data = self._remainder + data
+        cut = len(data) - len(data) % SAMPLE_WIDTH
+        self._remainder = data[cut:]
+        self._pending = np.concatenate([self._pending, pcm16_to_float(data[:cut])])
+
+        if not self.started:
+            first = first_audible_sample(self._pending)
+            if first is None:
+                # Still silence: only keep the tail we might want as lead-in
+                keep = min(ms_to_samples(KEEP_MS), self._pending.size)
+                self.trimmed += (self._pending.size - keep) * SAMPLE_WIDTH
+                self._pending = self._pending[self._pending.size - keep:]
+                return b""
+            start = max(first - ms_to_samples(KEEP_MS), 0)
+            self.trimmed += start * SAMPLE_WIDTH
+            self._pending = self._pending[start:]
+            self.started = True
+            if self.on_trim is not None:
+                self.on_trim(self.trimmed)
+
+        release = self._pending.size - self.lookahead
+        if release <= 0:
+            return b""
+        out, self._pending = self._pending[:release], self._pending[release:]
+        out = self._apply_gain(out)
+        self._history = np.concatenate([self._history, out])[-SAMPLE_RATE:]
+        return float_to_pcm16(out)
+
+    def flush(self):
+        """Release whatever is left in the look-ahead window"""
+        if not self.started:
+            return b""
+        tail = self._pending
+        if self.trim:
+            tail = trim_silence(tail, leading=False)
+        self._pending = np.empty(0, dtype=np.float32)
+        return float_to_pcm16(self._apply_gain(tail))
+
+
+def process_stream(chunks, **kwargs):
+    """Wrap an iterable of PCM16 chunks with a StreamingPostProcessor"""
+    processor = StreamingPostProcessor(**kwargs)
+    for chunk in chunks:
+        out = processor.feed(chunk)
+        if out:
+            yield out
+    out = processor.flush()
+    if out:
+        yield out
+
+
+async def aprocess_stream(chunks, **kwargs):
+    """Async variant of process_stream for async chunk generators"""
+    processor = StreamingPostProcessor(**kwargs)
+    async for chunk in chunks:
+        out = processor.feed(chunk)
+        if out:
+            yield out
+    out = processor.flush()
+    if out:
+        yield out
+
+
+def synthetic_speech(seconds, sample_rate=SAMPLE_RATE, lead_silence=0.5, seed=0):
+    """Build a speech-like test signal: modulated tones between short pauses"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate), dtype=np.float32) / sample_rate
+    envelope = (np.sin(2 * np.pi * 3.0 * t) > -0.2).astype(np.float32)
+    signal = 0.1 * envelope * np.sin(2 * np.pi * 180.0 * t) + 0.01 * rng.standard_normal(t.size).astype(np.float32)
+    signal[:int(lead_silence * sample_rate)] = 0.0
+    return float_to_pcm16(signal)
+
+
+def benchmark(seconds=60, chunk_ms=100):
+    """Measure CPU seconds spent per second of audio, batch and streaming"""
+    data = synthetic_speech(seconds)
+    results = {}
+
+    start = time.process_time()
+    postprocess_pcm16(data)
+    results["batch"] = (time.process_time() - start) / seconds
+
+    chunk_bytes = ms_to_samples(chunk_ms) * SAMPLE_WIDTH
+    chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+    start = time.process_time()
+    for _ in process_stream(chunks):
+        pass
+    results["streaming"] = (time.process_time() - start) / seconds
+
+    segment_bytes = len(data) // 10
+    segments = [data[i:i + segment_bytes] for i in range(0, len(data), segment_bytes)]
+    start = time.process_time()
+    join_segments(segments)
+    results["crossfade_join"] = (time.process_time() - start) / seconds
+    return results
+
+
+if __name__ == "__main__":
+    for name, cost in benchmark().items():
+        print(f"{name:>15}: {cost * 1000:.3f} ms CPU per second of audio")
@@ -0,0 +1,155 @@
+import base64
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Bytes per second of raw pcm16 output (24 kHz, mono, 16-bit)
+PCM16_BYTES_PER_SECOND = 24000 * 2
+
+
+@dataclass
+class AudioChunk:
+    """One streamed audio delta and the transcript text that came with it"""
+    byte_offset: int
+    size: int
+    elapsed: float  # seconds since the request was sent
+    transcript: str = ""
+
+
+@dataclass
+class AudioResult:
+    """Audio generated by gpt-audio (or the tts-1 fallback) plus its metadata"""
+    audio: bytearray = field(default_factory=bytearray)
+    transcript: str = ""
+    chunks: List[AudioChunk] = field(default_factory=list)
+    voice: str = ""
+    model: str = ""
+    fallback: bool = False
+    usage: Optional[dict] = None
+    format: str = "mp3"
+    started_at: float = field(default_factory=time.perf_counter)
+    # Set to False when the audio is written straight to disk, so only the
+    # metadata is kept and memory stays flat for long clips
+    keep_audio: bool = True
+    size: int = 0
+    # Bytes of leading silence post-processing cut from the delivered audio;
+    # chunk offsets count from the raw stream, so captions subtract it
+    lead_trim: int = 0
+
+    @property
+    def time_to_first_chunk(self):
+        return self.chunks[0].elapsed if self.chunks else None
+
+    @property
+    def duration(self):
+        """Playback duration in seconds, when it can be derived from the bytes"""
+        if self.format == "pcm16":
+            return self.size / PCM16_BYTES_PER_SECOND
+        return None
+
+    def add_chunk(self, audio_bytes, transcript=""):
+        """Append a streamed audio delta and record when it arrived"""
+        self.chunks.append(AudioChunk(
+            byte_offset=self.size,
+            size=len(audio_bytes),
+            elapsed=time.perf_counter() - self.started_at,
+            transcript=transcript,
+        ))
+        if self.keep_audio:
+            self.audio += audio_bytes
+        self.size += len(audio_bytes)
+        self.transcript += transcript
+
+    def captions(self, duration=None):
+        """Return (start_seconds, text) cues for chunks that carried transcript.
+
+        Start times are exact for pcm16. For compressed formats they are
+        proportional to the byte offset (close enough for constant bitrate
+        MP3) and scaled by duration, the length reported by the player; without
+        it they are fractions of the clip.
+        """
+        total = self.size - self.lead_trim
+        cues = []
+        for chunk in self.chunks:
+            if not chunk.transcript:
+                continue
+            offset = max(chunk.byte_offset - self.lead_trim, 0)
+            if self.format == "pcm16":
+                start = offset / PCM16_BYTES_PER_SECOND
+            else:
+                start = offset / total if total > 0 else 0.0
+                if duration is not None:
+                    start *= duration
+            cues.append((start, chunk.transcript))
+        return cues
+
+    def to_dict(self):
+        """Metadata without the audio buffer, suitable for storing alongside a cache entry"""
+        return {
+            "transcript": self.transcript,
+            "chunks": [vars(chunk) for chunk in self.chunks],
+            "voice": self.voice,
+            "model": self.model,
+            "fallback": self.fallback,
+            "usage": self.usage,
+            "format": self.format,
+            "size": self.size,
+            "lead_trim": self.lead_trim,
+        }
+
+
+def usage_to_dict(usage):
+    """Flatten an SDK usage object into plain dicts"""
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump(exclude_none=True)
+    return dict(usage)
+
+
+def result_from_completion(response, voice, audio_format="mp3", started_at=None):
+    """Build an AudioResult from a non-streaming chat completion.
+
+    Returns None when the response carries no audio.
+    """
+    result = AudioResult(voice=voice, format=audio_format)
+    if started_at is not None:
+        result.started_at = started_at
+    if hasattr(response, 'choices') and response.choices:
+        choice = response.choices[0]
+        if hasattr(choice, 'message') and hasattr(choice.message, 'audio') and choice.message.audio:
+            if hasattr(choice.message.audio, 'data') and choice.message.audio.data:
+                result.add_chunk(
+                    base64.b64decode(choice.message.audio.data),
+                    getattr(choice.message.audio, 'transcript', None) or "",
+                )
+                result.model = getattr(response, 'model', "") or ""
+                result.usage = usage_to_dict(getattr(response, 'usage', None))
+                return result
+    return None
+
+
+def apply_stream_chunk(result, chunk):
+    """Fold one streaming chunk into result and return its decoded audio bytes.
+
+    Returns b"" for chunks without audio (role headers, transcript-only
+    deltas and the trailing usage chunk).
+    """
+    if not result.model:
+        result.model = getattr(chunk, 'model', "") or ""
+    if getattr(chunk, 'usage', None):
+        result.usage = usage_to_dict(chunk.usage)
+    if hasattr(chunk, 'choices') and chunk.choices:
+        choice = chunk.choices[0]
+        if hasattr(choice, 'delta') and hasattr(choice.delta, 'audio') and choice.delta.audio:
+            audio = choice.delta.audio
+            # The SDK exposes unknown delta fields as attributes or dict keys
+            if isinstance(audio, dict):
+                data, transcript = audio.get('data'), audio.get('transcript')
+            else:
+                data, transcript = getattr(audio, 'data', None), getattr(audio, 'transcript', None)
+            audio_bytes = base64.b64decode(data) if data else b""
+            if audio_bytes or transcript:
+                result.add_chunk(audio_bytes, transcript or "")
+            return audio_bytes
+    return b""
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+# What to do when a sink has fallen more than max_chunks behind:
+#   "block"  - the producer waits for it (backpressure on the upstream)
+#   "buffer" - keep queueing; lossless, memory grows with the lag
+#   "detach" - drop the sink; for best-effort consumers such as a cache
+POLICIES = ("block", "buffer", "detach")
+MAX_CHUNKS = 64
+
+_END = object()
+_ABORT = object()
+
+
+class SinkDetached(Exception):
+    """Raised inside a sink's chunk iterator when it fell too far behind"""
+
+
+class StreamAborted(Exception):
+    """Raised inside every sink's chunk iterator when the upstream failed"""
+
+
+class _Sink:
+    def __init__(self, name, consume, policy, max_chunks):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.name = name
+        self.consume = consume
+        self.policy = policy
+        self.max_chunks = max_chunks
+        self.queue = asyncio.Queue(maxsize=max_chunks if policy == "block" else 0)
+        self.chunks = 0
+        self.bytes = 0
+        self.max_lag = 0
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.detached = False
+        self.error = None
+        self.task = None
+
+    async def iter_chunks(self):
+        while True:
+            chunk = await self.queue.get()
+            if chunk is _END:
+                return
+            if chunk is _ABORT:
+                # Raised into the sink, so e.g. a file writer discards its partial file
+                raise StreamAborted(self.name)
+            if self.detached:
+                raise SinkDetached(self.name)
+            if self.first_chunk_at is None:
+                self.first_chunk_at = time.perf_counter()
+            self.chunks += 1
+            self.bytes += len(chunk)
+            yield chunk
+
+    async def run(self):
+        try:
+            await self.consume(self.iter_chunks())
+        except (SinkDetached, StreamAborted):
+            pass
+        except Exception as e:
+            # A failing sink must not take the others down with it
+            self.error = e
+            print(f"Sink {self.name} failed: {e}")
+        finally:
+            self.finished_at = time.perf_counter()
+            # Nobody reads the queue any more: empty it so a producer blocked
+            # on a full "block" queue (a chunk or the end marker) gets through
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    async def offer(self, chunk):
+        if self.error is not None or self.detached or self.task.done():
+            return
+        lag = self.queue.qsize()
+        self.max_lag = max(self.max_lag, lag)
+        if self.policy == "detach" and lag >= self.max_chunks:
+            self.detached = True
+            print(f"Sink {self.name} detached: {lag} chunks behind")
+            # Wake the sink up so it sees it was detached
+            self.queue.put_nowait(chunk)
+            return
+        if self.policy == "block":
+            await self.queue.put(chunk)
+        else:
+            self.queue.put_nowait(chunk)
+
+    def stats(self, started_at):
+        return {
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "max_lag": self.max_lag,
+            "first_chunk": self.first_chunk_at - started_at if self.first_chunk_at else None,
+            "finished": self.finished_at - started_at if self.finished_at else None,
+            "detached": self.detached,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class AudioTee:
+    """Fan one async stream of audio chunks out to several sinks at once.
+
+    Each sink is an async callable consuming an async iterator of chunks; it
+    runs as its own task behind its own queue, so a slow sink (a disk write,
+    a cache insert) never holds up a fast one (playback). How far a sink
+    may fall behind, and what happens then, is set per sink (see POLICIES).
+    """
+
+    def __init__(self):
+        self.sinks = []
+        self.started_at = None
+        self.upstream_done_at = None
+
+    def add_sink(self, name, consume, policy="buffer", max_chunks=MAX_CHUNKS):
+        self.sinks.append(_Sink(name, consume, policy, max_chunks))
+
+    async def run(self, chunks):
+        """Pump chunks to every sink; return per-sink stats once all have finished"""
+        self.started_at = time.perf_counter()
+        for sink in self.sinks:
+            sink.task = asyncio.create_task(sink.run())
+        end = _ABORT
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    for sink in self.sinks:
+                        await sink.offer(chunk)
+            self.upstream_done_at = time.perf_counter()
+            end = _END
+        finally:
+            for sink in self.sinks:
+                if not sink.task.done():
+                    if sink.policy == "block":
+                        await sink.queue.put(end)
+                    else:
+                        sink.queue.put_nowait(end)
+            await asyncio.gather(*(sink.task for sink in self.sinks))
+        return self.stats()
+
+    def stats(self):
+        """Per-sink stats; also available after run() raised"""
+        return {sink.name: sink.stats(self.started_at) for sink in self.sinks}
@@ -0,0 +1,123 @@
+import base64
+import os
+import time
+import tracemalloc
+import wave
+
+# 256 KiB write buffer: large enough to keep syscalls rare, small enough
+# that memory stays flat no matter how long the clip is
+BUFFER_SIZE = 256 * 1024
+
+
+class EmptyAudioError(Exception):
+    """Raised on a clean exit from AtomicAudioWriter when no audio was written"""
+
+
+class AtomicAudioWriter:
+    """Write audio incrementally to a temp name and rename it into place.
+
+    Chunks go through a buffered file next to the destination
+    (<path>.part). On a clean exit the file is optionally fsynced and
+    atomically renamed with os.replace(); on error the partial file is
+    removed, so readers never see a truncated clip. A clean exit without
+    any audio also removes it and raises EmptyAudioError, leaving an
+    existing file at path untouched. pcm16 audio is wrapped in a WAV
+    container whose header is patched on close.
+    """
+
+    def __init__(self, path, audio_format="mp3", fsync=False, buffer_size=BUFFER_SIZE,
+                 sample_rate=24000):
+        self.path = os.fspath(path)
+        self.temp_path = f"{self.path}.part"
+        self.audio_format = audio_format
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self.sample_rate = sample_rate
+        self.bytes_written = 0
+        self.started_at = None
+        self.finished_at = None
+        self._file = None
+        self._wave = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        self._file = open(self.temp_path, "wb", buffering=self.buffer_size)
+        if self.audio_format == "pcm16":
+            self._wave = wave.open(self._file, "wb")
+            self._wave.setnchannels(1)
+            self._wave.setsampwidth(2)
+            self._wave.setframerate(self.sample_rate)
+        return self
+
+    def write(self, chunk):
+        if self._wave is not None:
+            self._wave.writeframesraw(chunk)
+        else:
+            self._file.write(chunk)
+        self.bytes_written += len(chunk)
+
+    def write_base64(self, data):
+        """Decode one base64 delta and write it; deltas are independently encoded"""
+        self.write(base64.b64decode(data))
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._wave is not None:
+                # Patches the RIFF/data sizes in the header
+                self._wave.close()
+            self._file.flush()
+            if self.fsync and exc_type is None:
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+        self.finished_at = time.perf_counter()
+        if exc_type is None and self.bytes_written:
+            os.replace(self.temp_path, self.path)
+            return False
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        if exc_type is None:
+            raise EmptyAudioError(f"No audio data found in response; {self.path} left unchanged")
+        return False
+
+    @property
+    def bytes_per_second(self):
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return self.bytes_written / elapsed if elapsed > 0 else 0.0
+
+
+def _deltas(minutes, delta_bytes=4800, bytes_per_second=16000):
+    """Yield base64 deltas shaped like a gpt-audio MP3 stream"""
+    payload = base64.b64encode(os.urandom(delta_bytes)).decode("ascii")
+    for _ in range(int(minutes * 60 * bytes_per_second / delta_bytes)):
+        yield payload
+
+
+def measure_peak_memory(minutes, path):
+    """Return peak traced memory (bytes) for the buffered and streamed write paths"""
+    tracemalloc.start()
+    # Non-streaming path: one base64 string, one decoded copy, one write
+    data = "".join(_deltas(minutes))
+    with open(path, "wb") as f:
+        f.write(base64.b64decode(data))
+    del data
+    _, buffered = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    with AtomicAudioWriter(path) as writer:
+        for delta in _deltas(minutes):
+            writer.write_base64(delta)
+    _, streamed = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return buffered, streamed, writer.bytes_per_second
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clip.mp3")
+        print(f"{'clip':>8} {'buffered peak':>14} {'streamed peak':>14} {'write MB/s':>11}")
+        for minutes in (1, 5, 10):
+            buffered, streamed, rate = measure_peak_memory(minutes, path)
+            print(f"{minutes:>6} m {buffered / 1e6:>11.1f} MB {streamed / 1e6:>11.2f} MB {rate / 1e6:>11.1f}")
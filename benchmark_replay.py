@@ -0,0 +1,205 @@
+"""Replay-based regression benchmark for the three entry points.
+
+Runs soundboard.py (streaming and file paths), async-streaming-tts-sample.py
+and streaming-tts-to-file-sample.py against recorded fixtures (see replay.py),
+so throughput and latency can be tracked without live Azure access.
+
+    python benchmark_replay.py --fixtures fixtures/recorded --speed 1
+    python benchmark_replay.py --save baseline.json
+    python benchmark_replay.py --baseline baseline.json --tolerance 0.2
+
+Without --fixtures, synthetic fixtures are generated in a temp directory.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import replay
+
+ROOT = Path(__file__).parent
+
+
+def configure_replay(fixtures, speed):
+    os.environ["TTS_REPLAY_DIR"] = str(fixtures)
+    os.environ["TTS_REPLAY_SPEED"] = str(speed)
+    os.environ.pop("TTS_RECORD_DIR", None)
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://replay.invalid/")
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "replay")
+
+
+def load_soundboard(fixtures, speed):
+    """Import soundboard and drop cached clients so new ones use the replay settings"""
+    import soundboard
+    # Clients are created per event loop from the environment, which
+    # configure_replay() has already pointed at the fixtures
+    for endpoint in soundboard.endpoint_pool.endpoints:
+        endpoint.reset_clients()
+    return soundboard
+
+
+def bench_soundboard_streaming(fixtures, speed):
+    soundboard = load_soundboard(fixtures, speed)
+
+    async def run():
+        started_at = time.perf_counter()
+        first, size = None, 0
+        async for chunk in soundboard.generate_streaming_audio("alloy", "Benchmark", "Calm"):
+            if first is None:
+                first = time.perf_counter() - started_at
+            size += len(chunk)
+        return first, time.perf_counter() - started_at, size
+
+    return asyncio.run(run())
+
+
+def bench_soundboard_file(fixtures, speed):
+    soundboard = load_soundboard(fixtures, speed)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f"bench.{soundboard.AUDIO_FILE_EXT}")
+        started_at = time.perf_counter()
+        result = asyncio.run(soundboard.generate_audio_file("Benchmark", output, "alloy", "Calm"))
+        total = time.perf_counter() - started_at
+    return result.time_to_first_chunk, total, result.size
+
+
+# The samples have no timing hooks of their own: their time to first chunk
+# comes from the replay transport (see run_traced)
+
+def bench_async_sample(fixtures, speed):
+    namespace = runpy.run_path(str(ROOT / "async-streaming-tts-sample.py"), run_name="benchmark")
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        asyncio.run(namespace["main"]())
+    total = time.perf_counter() - started_at
+    # The sample saves to a temp file and prints its path
+    size = 0
+    for line in out.getvalue().splitlines():
+        if "saved" in line and ": " in line:
+            path = line.rsplit(": ", 1)[1].strip()
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                os.remove(path)
+    return None, total, size
+
+
+def bench_file_sample(fixtures, speed):
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        namespace = runpy.run_path(str(ROOT / "streaming-tts-to-file-sample.py"), run_name="benchmark")
+    total = time.perf_counter() - started_at
+    path = namespace["speech_file_path"]
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return None, total, size
+
+
+def run_traced(bench, fixtures, speed):
+    """Run one benchmark: (time to first chunk, end to end, bytes, request seconds).
+
+    Request seconds run from the first replayed request to the end of the
+    run, so throughput covers streaming, decoding and writing but not
+    imports or client setup. Entry points that report no time to first
+    chunk get the transport's: from the first request to its first body chunk.
+    """
+    with replay.tracing() as trace:
+        first, total, size = bench(fixtures, speed)
+        finished_at = time.perf_counter()
+    if first is None:
+        first = trace.time_to_first_chunk()
+    return first, total, size, finished_at - trace.started_at if trace.started_at is not None else total
+
+
+ENTRY_POINTS = {
+    "soundboard.generate_streaming_audio": bench_soundboard_streaming,
+    "soundboard.generate_audio_file": bench_soundboard_file,
+    "async-streaming-tts-sample": bench_async_sample,
+    "streaming-tts-to-file-sample": bench_file_sample,
+}
+
+
+def run_benchmarks(fixtures, speed, rounds):
+    results = {}
+    for name, bench in ENTRY_POINTS.items():
+        # Throughput is measured with delays removed so it reflects parsing
+        # and decoding only; latency uses the requested replay speed.
+        configure_replay(fixtures, 0)
+        decode = [run_traced(bench, fixtures, 0) for _ in range(rounds)]
+        configure_replay(fixtures, speed)
+        timed = [run_traced(bench, fixtures, speed) for _ in range(rounds)]
+        size = decode[0][2]
+        decode_time = statistics.median(requests for _, _, _, requests in decode)
+        first = [f for f, _, _, _ in timed if f is not None]
+        results[name] = {
+            "bytes": size,
+            "decode_mb_per_s": size / decode_time / 1e6 if decode_time else 0.0,
+            "time_to_first_chunk": statistics.median(first) if first else None,
+            "end_to_end": statistics.median(t for _, t, _, _ in timed),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions beyond tolerance versus a saved baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["decode_mb_per_s"] and current["decode_mb_per_s"] < previous["decode_mb_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: decode throughput {current['decode_mb_per_s']:.1f} < {previous['decode_mb_per_s']:.1f} MB/s")
+        for metric in ("time_to_first_chunk", "end_to_end"):
+            if previous.get(metric) and current.get(metric) and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {current[metric]:.3f}s > {previous[metric]:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="directory of recorded fixtures (default: synthetic)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor for latency runs")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = args.fixtures or replay.synthesize_fixtures(tmp)
+        # Keep the file sample from overwriting a real speech.mp3
+        speech = ROOT / "speech.mp3"
+        backup = speech.read_bytes() if speech.exists() else None
+        try:
+            results = run_benchmarks(fixtures, args.speed, args.rounds)
+        finally:
+            if backup is not None:
+                speech.write_bytes(backup)
+            elif speech.exists():
+                speech.unlink()
+
+    print(f"{'entry point':<38} {'bytes':>9} {'decode MB/s':>12} {'TTFC s':>8} {'E2E s':>8}")
+    for name, r in results.items():
+        ttfc = f"{r['time_to_first_chunk']:.3f}" if r["time_to_first_chunk"] is not None else "-"
+        print(f"{name:<38} {r['bytes']:>9} {r['decode_mb_per_s']:>12.1f} {ttfc:>8} {r['end_to_end']:>8.3f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import asyncio
+import time
+
+# Rough playback rate used to turn byte counts into seconds. pcm16 is exact
+# (24 kHz, 16-bit mono); the MP3 figure assumes ~128 kbps and only needs to be
+# in the right ballpark for batching decisions.
+BYTES_PER_SECOND = {
+    "pcm16": 48000,
+    "mp3": 16000,
+}
+
+# Tunables: the first batch goes out as soon as it arrives, later batches
+# grow from MIN_BATCH_SECONDS towards MAX_BATCH_SECONDS so the client buffer
+# fills quickly and is then topped up with fewer, larger updates.
+MIN_BATCH_SECONDS = 0.25
+MAX_BATCH_SECONDS = 2.0
+MAX_BATCH_BYTES = 64 * 1024
+GROWTH = 2.0
+# A batch never waits longer than this, or than the audio the client still
+# has queued, whichever is shorter: otherwise a stream arriving at about
+# real time drains the player while a large batch is filling
+MAX_WAIT_SECONDS = 0.3
+
+
+class AdaptiveCoalescer:
+    """Coalesce small audio deltas into fewer UI updates.
+
+    Call add() for every chunk from the model; it returns a batch of bytes
+    when one is ready to send, or None. Call flush() at the end of the stream
+    for whatever is left. stats() reports the update rate and bytes per
+    update so the settings can be tuned.
+
+    Batches grow only while the stream keeps ahead of playback: a batch
+    that has been pending longer than max_wait, or than the client's
+    remaining buffer, is sent as it is. While the upstream stalls no add()
+    comes, so a caller waiting for the next chunk should wake up after
+    seconds_until_due() and call poll() (acoalesce does).
+    """
+
+    def __init__(self, audio_format="mp3", min_seconds=MIN_BATCH_SECONDS,
+                 max_seconds=MAX_BATCH_SECONDS, max_bytes=MAX_BATCH_BYTES,
+                 growth=GROWTH, max_wait=MAX_WAIT_SECONDS, clock=time.perf_counter):
+        self.bytes_per_second = BYTES_PER_SECOND.get(audio_format, BYTES_PER_SECOND["mp3"])
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.growth = growth
+        self.max_wait = max_wait
+        self.clock = clock
+        self.target_seconds = min_seconds
+        self.frame_bytes = 2 if audio_format == "pcm16" else 1
+        self._buffer = bytearray()
+        self._started_at = None
+        self._first_emitted_at = None
+        self._pending_since = None
+        self.chunks_in = 0
+        self.updates = 0
+        self.deadline_flushes = 0
+        self.bytes_out = 0
+        self.first_update_at = None
+
+    def _target_bytes(self):
+        return min(int(self.target_seconds * self.bytes_per_second), self.max_bytes)
+
+    def _client_buffer_seconds(self, now):
+        """Audio sent but not yet played, assuming playback began with the first update"""
+        if self._first_emitted_at is None:
+            return 0.0
+        return self.bytes_out / self.bytes_per_second - (now - self._first_emitted_at)
+
+    def _due_at(self):
+        """When the pending batch must go out, or None if nothing is pending"""
+        if self._pending_since is None or len(self._buffer) < self.frame_bytes:
+            return None
+        if self._first_emitted_at is None:
+            return self._pending_since
+        # The earlier of max_wait and the moment the time pending catches up
+        # with the audio the client still has queued
+        played_out_at = self._first_emitted_at + self.bytes_out / self.bytes_per_second
+        return min(self._pending_since + self.max_wait, (self._pending_since + played_out_at) / 2)
+
+    def _emit(self):
+        # Keep pcm16 batches on sample boundaries
+        cut = len(self._buffer) - len(self._buffer) % self.frame_bytes
+        batch = bytes(self._buffer[:cut])
+        del self._buffer[:cut]
+        if not batch:
+            return None
+        now = self.clock()
+        if self.first_update_at is None:
+            self.first_update_at = now - self._started_at
+            self._first_emitted_at = now
+        self._pending_since = now if self._buffer else None
+        self.updates += 1
+        self.bytes_out += len(batch)
+        return batch
+
+    def add(self, chunk):
+        """Buffer a chunk and return a batch when one is due"""
+        now = self.clock()
+        if self._started_at is None:
+            self._started_at = now
+        if self._pending_since is None:
+            self._pending_since = now
+        self.chunks_in += 1
+        self._buffer += chunk
+        if self.updates == 0:
+            # Send the very first audio immediately for low latency
+            return self._emit()
+        if len(self._buffer) >= self._target_bytes():
+            self.target_seconds = min(self.target_seconds * self.growth, self.max_seconds)
+            return self._emit()
+        if now >= self._due_at():
+            # The stream is not keeping ahead of playback: send what there is, without growing
+            self.deadline_flushes += 1
+            return self._emit()
+        return None
+
+    def seconds_until_due(self):
+        """Seconds until the pending batch is due, or None if nothing is pending"""
+        due = self._due_at()
+        return None if due is None else max(due - self.clock(), 0.0)
+
+    def poll(self):
+        """Return the pending batch if it is due, else None; for when no chunk arrives"""
+        due = self._due_at()
+        if due is None or self.clock() < due:
+            return None
+        self.deadline_flushes += 1
+        return self._emit()
+
+    def flush(self):
+        """Return whatever is still buffered"""
+        self.frame_bytes = 1
+        return self._emit()
+
+    def stats(self):
+        elapsed = self.clock() - self._started_at if self._started_at else 0.0
+        return {
+            "chunks_in": self.chunks_in,
+            "updates": self.updates,
+            "bytes": self.bytes_out,
+            "bytes_per_update": self.bytes_out / self.updates if self.updates else 0.0,
+            "updates_per_second": self.updates / elapsed if elapsed > 0 else 0.0,
+            "coalescing_ratio": self.chunks_in / self.updates if self.updates else 0.0,
+            "first_update_seconds": self.first_update_at,
+            "deadline_flushes": self.deadline_flushes,
+        }
+
+
+def coalesce(chunks, **kwargs):
+    """Wrap an iterable of audio chunks, yielding coalesced batches"""
+    coalescer = AdaptiveCoalescer(**kwargs)
+    for chunk in chunks:
+        batch = coalescer.add(chunk)
+        if batch:
+            yield batch
+    batch = coalescer.flush()
+    if batch:
+        yield batch
+
+
+async def acoalesce(chunks, coalescer=None, **kwargs):
+    """Async variant of coalesce; pass a coalescer to read its stats afterwards
+
+    While a batch is pending, the next chunk is awaited only until the batch
+    is due, so a stalled upstream does not hold back audio already received.
+    """
+    if coalescer is None:
+        coalescer = AdaptiveCoalescer(**kwargs)
+    chunks = chunks.__aiter__()
+    pending = None
+    try:
+        while True:
+            timeout = coalescer.seconds_until_due()
+            if pending is None and timeout is None:
+                # Nothing buffered: no deadline to watch
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(chunks.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    batch = coalescer.poll()
+                    if batch:
+                        yield batch
+                    continue
+                next_chunk, pending = pending, None
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+            batch = coalescer.add(chunk)
+            if batch:
+                yield batch
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+    batch = coalescer.flush()
+    if batch:
+        yield batch
+
+
+def simulate(seconds=30, delta_bytes=1200, audio_format="mp3", speed=None, pause_at=None, pause_seconds=0.0,
+             **kwargs):
+    """Feed a synthetic stream of small deltas through a coalescer and return its stats
+
+    With speed (times real time), deltas arrive on a simulated clock and
+    playback of the batches is modelled: "stalls" and "stall_seconds" count
+    the times the client ran out of audio before the next batch. Between
+    deltas the coalescer is polled when a batch falls due, like acoalesce.
+    pause_at (seconds of audio) makes the upstream go quiet for pause_seconds.
+    """
+    clock = [0.0]
+    coalescer = AdaptiveCoalescer(audio_format=audio_format, clock=lambda: clock[0], **kwargs)
+    total = seconds * coalescer.bytes_per_second
+    played_until, stalls, stall_seconds = None, 0, 0.0
+
+    def play(batch):
+        nonlocal played_until, stalls, stall_seconds
+        if not batch:
+            return
+        # Ignore float noise when a batch arrives just as the last one ends
+        if played_until is not None and clock[0] > played_until + 1e-9:
+            stalls += 1
+            stall_seconds += clock[0] - played_until
+        start = clock[0] if played_until is None else max(played_until, clock[0])
+        played_until = start + len(batch) / coalescer.bytes_per_second
+
+    paused = pause_at is None
+    for offset in range(0, total, delta_bytes):
+        if speed:
+            arrival = clock[0] + delta_bytes / coalescer.bytes_per_second / speed
+            if not paused and offset >= pause_at * coalescer.bytes_per_second:
+                arrival += pause_seconds
+                paused = True
+            while coalescer.seconds_until_due() is not None and clock[0] + coalescer.seconds_until_due() < arrival:
+                clock[0] += coalescer.seconds_until_due()
+                play(coalescer.poll())
+            clock[0] = arrival
+        play(coalescer.add(b"\0" * delta_bytes))
+    play(coalescer.flush())
+    stats = coalescer.stats()
+    if speed:
+        stats.update(stalls=stalls, stall_seconds=stall_seconds)
+    return stats
+
+
+if __name__ == "__main__":
+    print("Updates per 30 s clip of 1.2 kB deltas:")
+    for label, options in [
+        ("no batching", {"min_seconds": 0, "max_seconds": 0}),
+        ("default", {}),
+        ("small client buffer", {"max_seconds": 0.5, "max_bytes": 8 * 1024}),
+        ("large batches", {"min_seconds": 0.5, "max_seconds": 4.0, "max_bytes": 128 * 1024}),
+    ]:
+        stats = simulate(**options)
+        print(f"{label:>20}: {stats['updates']:4d} updates, "
+              f"{stats['bytes_per_update'] / 1024:6.1f} kB/update, "
+              f"{stats['coalescing_ratio']:5.1f} chunks/update")
+    print("Playback stalls per 30 s clip, by upstream speed:")
+    for label, options in [
+        ("1.0x", {"speed": 1.0}),
+        ("1.5x", {"speed": 1.5}),
+        ("3.0x", {"speed": 3.0}),
+        ("1.5x, 1 s pause", {"speed": 1.5, "pause_at": 10.0, "pause_seconds": 1.0}),
+    ]:
+        stats = simulate(**options)
+        print(f"{label:>20}: {stats['stalls']:4d} stalls, {stats['stall_seconds']:5.2f} s silent, "
+              f"{stats['updates']:4d} updates")
@@ -0,0 +1,270 @@
+import contextvars
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from audio_result import usage_to_dict
+
+BATCH_SIZE = 4
+# Refill in the background once this many scripts are left
+LOW_WATER = 1
+# Anything shorter is not a usable script (a refusal, a title, "...")
+MIN_SCRIPT_CHARS = 80
+
+BATCH_INSTRUCTIONS = (
+    "Write one script per [id] request below, in the request's language. "
+    'Reply with JSON only: {"scripts": [{"id": "<id>", "script": "<text>"}]}.'
+)
+
+FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class ContentUnavailable(Exception):
+    """Raised by ContentPool.take() when no script could be generated"""
+
+
+@dataclass
+class BatchResult:
+    """Scripts from one gpt-5-nano request, and the use cases that failed"""
+    scripts: List[tuple] = field(default_factory=list)  # (use_case, script)
+    failed: List[tuple] = field(default_factory=list)  # (use_case, reason)
+    usage: Optional[dict] = None
+    elapsed: float = 0.0
+
+
+def batch_messages(use_cases, system_prompt):
+    """One request for a script per use case; ids are the use case types"""
+    requests = "\n\n".join(f"[{use_case['type']}] {use_case['prompt']}" for use_case in use_cases)
+    return [
+        {"role": "system", "content": f"{system_prompt}\n\n{BATCH_INSTRUCTIONS}"},
+        {"role": "user", "content": requests},
+    ]
+
+
+def parse_batch(text, use_cases):
+    """Validate a batch response and split it into per-use-case scripts.
+
+    Returns (scripts, failed): entries that are malformed, unknown, repeated
+    or too short are skipped, and every requested use case without a valid
+    script is reported as failed, so one bad entry does not cost the batch.
+    """
+    wanted = {use_case["type"]: use_case for use_case in use_cases}
+    try:
+        data = json.loads(FENCE.sub("", (text or "").strip()))
+        entries = data["scripts"] if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            raise ValueError("no list of scripts")
+    except (ValueError, KeyError, TypeError) as e:
+        return [], [(use_case, f"invalid JSON: {e}") for use_case in use_cases]
+    scripts = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        script_id, script = entry.get("id"), entry.get("script")
+        if script_id in wanted and script_id not in scripts and isinstance(script, str) \
+                and len(script.strip()) >= MIN_SCRIPT_CHARS:
+            scripts[script_id] = script.strip()
+    return (
+        [(wanted[script_id], script) for script_id, script in scripts.items()],
+        [(use_case, "missing or invalid") for use_case in use_cases if use_case["type"] not in scripts],
+    )
+
+
+def generate_batch(client, model, use_cases, system_prompt):
+    """Ask gpt-5-nano for one script per use case in a single JSON response"""
+    started_at = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=batch_messages(use_cases, system_prompt),
+        response_format={"type": "json_object"},
+    )
+    scripts, failed = parse_batch(response.choices[0].message.content, use_cases)
+    return BatchResult(scripts, failed, usage_to_dict(getattr(response, "usage", None)),
+                       time.perf_counter() - started_at)
+
+
+def generate_single(client, model, use_case, system_prompt):
+    """The one-script-per-request path, as a BatchResult of one"""
+    started_at = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": use_case["prompt"]},
+        ],
+    )
+    script = (response.choices[0].message.content or "").strip()
+    result = BatchResult(usage=usage_to_dict(getattr(response, "usage", None)),
+                         elapsed=time.perf_counter() - started_at)
+    if script:
+        result.scripts.append((use_case, script))
+    else:
+        result.failed.append((use_case, "empty response"))
+    return result
+
+
+class ContentPool:
+    """Generated scripts, requested K at a time and handed out one per click.
+
+    generate is a callable taking a list of use cases and returning a
+    BatchResult. take() waits for a batch only when the pool is empty; when
+    it runs low, the next batch is requested on a background thread. Each
+    batch covers K different use cases, and those that failed in the
+    previous batch are asked for again first.
+    """
+
+    def __init__(self, generate, use_cases, batch_size=BATCH_SIZE, low_water=LOW_WATER, rng=random):
+        self.generate = generate
+        self.use_cases = list(use_cases)
+        self.batch_size = max(1, min(batch_size, len(self.use_cases)))
+        self.low_water = low_water
+        self.rng = rng
+        self.batches = 0
+        self.generated = 0
+        self.failed = 0
+        self.last_error = None
+        self._items = deque()
+        self._retry = []
+        self._refilling = False
+        self._refills = 0
+        self._last_generated = 0
+        self._cond = threading.Condition()
+
+    def _pick(self):
+        """(use cases for the next batch, those among them being retried)"""
+        retry = self._retry[:self.batch_size]
+        self._retry = []
+        others = [use_case for use_case in self.use_cases if use_case not in retry]
+        return retry + self.rng.sample(others, self.batch_size - len(retry)), retry
+
+    def _refill(self):
+        """Request one batch and return the number of scripts it added.
+
+        Called with _refilling set by the caller.
+        """
+        with self._cond:
+            use_cases, retried = self._pick()
+        try:
+            result = self.generate(use_cases)
+            error = None
+        except Exception as e:
+            result, error = BatchResult(failed=[(use_case, str(e)) for use_case in use_cases]), e
+        with self._cond:
+            scripts = list(result.scripts)
+            self.rng.shuffle(scripts)
+            self._items.extend((use_case["description"], script) for use_case, script in scripts)
+            # Failed use cases get one more chance in the next batch
+            self._retry = [use_case for use_case, _ in result.failed if use_case not in retried]
+            self.batches += 1
+            self.generated += len(result.scripts)
+            self.failed += len(result.failed)
+            self.last_error = error or (result.failed[0][1] if result.failed and not result.scripts else None)
+            self._last_generated = len(result.scripts)
+            self._refilling = False
+            self._refills += 1
+            self._cond.notify_all()
+        if result.failed and not result.scripts:
+            print(f"Content batch failed: {result.failed[0][1]}")
+        elif result.failed:
+            failures = ", ".join(f"{use_case['type']} ({reason})" for use_case, reason in result.failed)
+            print(f"Content batch: {len(result.scripts)} scripts, failed: {failures}")
+        return len(result.scripts)
+
+    def take(self, timeout=None):
+        """Return a (description, script) pair, or raise ContentUnavailable"""
+        while True:
+            with self._cond:
+                if self._items:
+                    item = self._items.popleft()
+                    prefetch = len(self._items) <= self.low_water and not self._refilling
+                    if prefetch:
+                        self._refilling = True
+                    break
+                if self._refilling:
+                    # Someone else's batch is on its way; give up only if it brings nothing
+                    refills = self._refills
+                    if not self._cond.wait_for(lambda: self._refills != refills, timeout):
+                        raise ContentUnavailable("timed out waiting for a batch")
+                    if not self._last_generated:
+                        raise ContentUnavailable(self.last_error)
+                    continue
+                self._refilling = True
+            if not self._refill():
+                raise ContentUnavailable(self.last_error)
+        if prefetch:
+            # Run in a copy of the caller's context so the batch is charged,
+            # like a synchronous refill, to the session whose take() drained
+            # the pool (a bare thread starts with an empty context)
+            threading.Thread(target=contextvars.copy_context().run, args=(self._refill,),
+                             name="content-batch", daemon=True).start()
+        return item
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "generated": self.generated,
+            "failed": self.failed,
+            "scripts_per_batch": self.generated / self.batches if self.batches else 0.0,
+            "pooled": len(self._items),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import statistics
+
+    parser = argparse.ArgumentParser(description="Compare one-script-per-request content generation with batches of K")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--rounds", type=int, default=3, help="batches to request (and K times as many single requests)")
+    parser.add_argument("--dry-run", action="store_true", help="only compare prompt sizes, without calling Azure")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        # Nothing is sent, but the soundboard needs credentials to import
+        os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://dry-run.invalid/")
+        os.environ.setdefault("AZURE_OPENAI_API_KEY", "dry-run")
+    import soundboard
+
+    model = os.getenv("AZURE_OPENAI_NANO_DEPLOYMENT_NAME", "gpt-5-nano")
+    use_cases = soundboard.CONTENT_USE_CASES
+    k = min(args.batch_size, len(use_cases))
+    rng = random.Random(0)
+
+    if args.dry_run:
+        # Prompt characters per script: the system prompt is sent once per batch instead of once per script
+        single = statistics.mean(len(soundboard.CONTENT_SYSTEM_PROMPT) + len(u["prompt"]) for u in use_cases)
+        batch = statistics.mean(
+            sum(len(m["content"]) for m in batch_messages(rng.sample(use_cases, k), soundboard.CONTENT_SYSTEM_PROMPT)) / k
+            for _ in range(100))
+        overhead = len(soundboard.CONTENT_SYSTEM_PROMPT)
+        batch_overhead = (overhead + len(BATCH_INSTRUCTIONS)) / k
+        print(f"shared prompt chars per script: single {overhead}, batch of {k} {batch_overhead:.0f} "
+              f"({overhead / batch_overhead:.2f}x less)")
+        print(f"prompt chars per script: single {single:.0f}, batch of {k} {batch:.0f} ({single / batch:.2f}x less)")
+        print(f"requests per script: single 1, batch of {k} {1 / k:.2f}")
+        raise SystemExit
+
+    def run(label, calls):
+        results = [call() for call in calls]
+        scripts = sum(len(r.scripts) for r in results)
+        failed = sum(len(r.failed) for r in results)
+        prompt = sum((r.usage or {}).get("prompt_tokens", 0) for r in results)
+        completion = sum((r.usage or {}).get("completion_tokens", 0) for r in results)
+        elapsed = sum(r.elapsed for r in results)
+        per = max(scripts, 1)
+        print(f"{label:<12} {len(results):>8} {scripts:>8} {failed:>7} {prompt / per:>14.0f} "
+              f"{completion / per:>18.0f} {elapsed / per:>14.2f} {elapsed / len(results):>15.2f}")
+
+    print(f"{'path':<12} {'requests':>8} {'scripts':>8} {'failed':>7} {'prompt tok/scr':>14} "
+          f"{'completion tok/scr':>18} {'latency/scr s':>14} {'latency/req s':>15}")
+    chosen = [rng.sample(use_cases, k) for _ in range(args.rounds)]
+    run("single", [lambda u=u: generate_single(soundboard.azure, model, u, soundboard.CONTENT_SYSTEM_PROMPT)
+                   for batch in chosen for u in batch])
+    run(f"batch of {k}", [lambda b=b: generate_batch(soundboard.azure, model, b, soundboard.CONTENT_SYSTEM_PROMPT)
+                          for b in chosen])
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from replay import http_client_from_env
+
+# Routing defaults. EWMA_ALPHA weighs the newest TTFB sample; an endpoint
+# is ejected after MAX_FAILURES consecutive failures (a response slower than
+# SLOW_TTFB_SECONDS counts as one) and retried after a cooldown that doubles
+# on every ejection, up to MAX_COOLDOWN_SECONDS. When the cooldown ends the
+# endpoint's EWMA is reset to the pool median so it competes again.
+# Non-streamed completions are timed separately (their duration includes the
+# whole render) and never count as slow.
+EWMA_ALPHA = 0.3
+SLOW_TTFB_SECONDS = 15.0
+MAX_FAILURES = 3
+COOLDOWN_SECONDS = 30.0
+MAX_COOLDOWN_SECONDS = 600.0
+ACQUIRE_TIMEOUT_SECONDS = 30.0
+
+
+# The caller stopped consuming or was cancelled (e.g. a superseded
+# speculative render): not the endpoint's fault
+NOT_ENDPOINT_FAILURES = (GeneratorExit, asyncio.CancelledError, KeyboardInterrupt)
+
+
+class NoEndpointAvailable(Exception):
+    pass
+
+
+class Endpoint:
+    """One Azure OpenAI resource/deployment pair with its routing statistics"""
+
+    def __init__(self, endpoint, api_key, deployment, api_version="2025-01-01-preview",
+                 name=None, weight=1.0, max_concurrency=8, max_retries=2):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.deployment = deployment
+        self.api_version = api_version
+        self.name = name or f"{endpoint}#{deployment}"
+        self.weight = float(weight)
+        self.max_concurrency = int(max_concurrency)
+        self.max_retries = int(max_retries)
+        self.inflight = 0
+        self.ewma_ttfb = None
+        self.ewma_completion = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.unhealthy_until = 0.0
+        self._client = None
+        # httpx pools cannot be shared across event loops
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def client(self):
+        if self._client is None:
+            self._client = AzureOpenAI(azure_endpoint=self.endpoint, api_key=self.api_key,
+                                       api_version=self.api_version, max_retries=self.max_retries,
+                                       http_client=http_client_from_env())
+        return self._client
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncAzureOpenAI(azure_endpoint=self.endpoint, api_key=self.api_key,
+                                      api_version=self.api_version, max_retries=self.max_retries,
+                                      http_client=http_client_from_env(async_client=True))
+            self._async_clients[loop] = client
+        return client
+
+    def reset_clients(self):
+        """Drop cached clients so new ones pick up changed settings"""
+        self._client = None
+        self._async_clients.clear()
+
+    async def aclose_clients(self):
+        """Close the async client of the running loop, before that loop is closed.
+
+        Otherwise its keep-alive connections stay open after the loop is gone.
+        """
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "failures": self.failures,
+            "inflight": self.inflight,
+            "ewma_ttfb": self.ewma_ttfb,
+            "ewma_completion": self.ewma_completion,
+            "healthy": self.healthy,
+            "ejections": self.ejections,
+        }
+
+
+class Lease:
+    """An endpoint checked out for one request.
+
+    Call record_ttfb() on the first streamed byte, or record_completion() when
+    a non-streamed response (stream=False) arrives.
+    """
+
+    def __init__(self, pool, endpoint, stream=True):
+        self.pool = pool
+        self.endpoint = endpoint
+        self.stream = stream
+        self.started_at = time.perf_counter()
+        self.ttfb = None
+        self.completion = None
+
+    def record_ttfb(self):
+        if self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.started_at
+
+    def record_completion(self):
+        if self.completion is None:
+            self.completion = time.perf_counter() - self.started_at
+
+    # Convenience pass-throughs so callers can use the lease like the endpoint
+    @property
+    def deployment(self):
+        return self.endpoint.deployment
+
+    def client(self):
+        return self.endpoint.client()
+
+    def async_client(self):
+        return self.endpoint.async_client()
+
+
+class EndpointPool:
+    """Route requests across several endpoints.
+
+    Strategies: "least-latency" picks the healthy endpoint with the lowest
+    EWMA time to first byte, or of whole-completion time for endpoints that
+    have only served non-streamed requests (untried endpoints first, so each
+    gets sampled),
+    "weighted" picks randomly in proportion to the configured weights. Each
+    endpoint has a concurrency cap; failing or slow endpoints are ejected for
+    a cooldown and come back automatically, with their latency reset to the
+    median of the others.
+    """
+
+    def __init__(self, endpoints, strategy="least-latency", slow_ttfb=SLOW_TTFB_SECONDS,
+                 max_failures=MAX_FAILURES, cooldown=COOLDOWN_SECONDS, alpha=EWMA_ALPHA):
+        if not endpoints:
+            raise ValueError("Endpoint pool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.slow_ttfb = slow_ttfb
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    @property
+    def any_healthy(self):
+        """False while every endpoint is ejected"""
+        return any(e.healthy for e in self.endpoints)
+
+    def _readmit(self):
+        """Reset the EWMA of endpoints whose cooldown has just ended.
+
+        Otherwise the slow samples that got an endpoint ejected keep it last
+        in least-latency order and it is never picked again. With nothing to
+        compare against it is treated as untried, so the next request probes it.
+        """
+        for endpoint in self.endpoints:
+            if endpoint.unhealthy_until and endpoint.healthy:
+                endpoint.unhealthy_until = 0.0
+                for metric in ("ewma_ttfb", "ewma_completion"):
+                    others = [getattr(e, metric) for e in self.endpoints
+                              if e is not endpoint and e.healthy and getattr(e, metric) is not None]
+                    setattr(endpoint, metric, statistics.median(others) if others else None)
+
+    def _candidates(self):
+        self._readmit()
+        available = [e for e in self.endpoints if e.inflight < e.max_concurrency]
+        healthy = [e for e in available if e.healthy]
+        # If everything is ejected, still try the one that recovers soonest
+        # rather than failing outright
+        if not healthy and available:
+            healthy = [min(available, key=lambda e: e.unhealthy_until)]
+        return healthy
+
+    def _pick(self):
+        candidates = self._candidates()
+        if not candidates:
+            return None
+        if self.strategy == "weighted":
+            return random.choices(candidates, weights=[e.weight for e in candidates])[0]
+        untried = [e for e in candidates if e.ewma_ttfb is None and e.ewma_completion is None]
+        if untried:
+            return max(untried, key=lambda e: e.weight)
+        # Compare like with like: a completion time includes the whole render
+        for metric in ("ewma_ttfb", "ewma_completion"):
+            if all(getattr(e, metric) is not None for e in candidates):
+                # Normalize by load so a fast but busy endpoint does not take everything
+                return min(candidates, key=lambda e: getattr(e, metric) * (1 + e.inflight / e.max_concurrency)
+                           / e.weight)
+        # Mixed samples: the endpoints without a TTFB have all served whole
+        # completions, so pick the fastest of those and let the next streamed
+        # request sample its TTFB
+        return min((e for e in candidates if e.ewma_ttfb is None),
+                   key=lambda e: e.ewma_completion * (1 + e.inflight / e.max_concurrency) / e.weight)
+
+    def _try_acquire(self):
+        with self._lock:
+            endpoint = self._pick()
+            if endpoint is not None:
+                endpoint.inflight += 1
+                endpoint.requests += 1
+            return endpoint
+
+    def _release(self, lease, error):
+        endpoint = lease.endpoint
+        with self._lock:
+            endpoint.inflight -= 1
+            slow = lease.ttfb is not None and lease.ttfb > self.slow_ttfb
+            # A request that failed before its first byte (or its completion)
+            # is scored as slow in the metric it would have produced, so
+            # least-latency routing moves away from it: slow_ttfb for a
+            # stream, the slowest completion seen in the pool otherwise
+            ttfb, completion = lease.ttfb, lease.completion
+            if error is not None and ttfb is None and completion is None:
+                if lease.stream:
+                    ttfb = self.slow_ttfb
+                else:
+                    completion = max([self.slow_ttfb] + [e.ewma_completion for e in self.endpoints
+                                                         if e.ewma_completion is not None])
+            if ttfb is not None:
+                endpoint.ewma_ttfb = ttfb if endpoint.ewma_ttfb is None else \
+                    self.alpha * ttfb + (1 - self.alpha) * endpoint.ewma_ttfb
+            # A long clip legitimately takes a long time to render in full, so
+            # completion times only steer routing and never eject
+            if completion is not None:
+                endpoint.ewma_completion = completion if endpoint.ewma_completion is None else \
+                    self.alpha * completion + (1 - self.alpha) * endpoint.ewma_completion
+            if error is None and not slow:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.max_failures:
+                cooldown = min(self.cooldown * 2 ** endpoint.ejections, MAX_COOLDOWN_SECONDS)
+                endpoint.unhealthy_until = time.monotonic() + cooldown
+                endpoint.ejections += 1
+                endpoint.consecutive_failures = 0
+                print(f"Endpoint {endpoint.name} ejected for {cooldown:.0f}s "
+                      f"({'slow' if slow else 'failing'}: {error or f'{lease.ttfb:.1f}s TTFB'})")
+
+    @contextmanager
+    def lease(self, timeout=ACQUIRE_TIMEOUT_SECONDS, stream=True):
+        """Check out an endpoint (blocking while all are at their concurrency cap).
+
+        stream=False is for non-streamed requests, timed with record_completion().
+        """
+        deadline = time.monotonic() + timeout
+        endpoint = self._try_acquire()
+        while endpoint is None:
+            if time.monotonic() > deadline:
+                raise NoEndpointAvailable("All endpoints are at their concurrency limit")
+            time.sleep(0.05)
+            endpoint = self._try_acquire()
+        lease = Lease(self, endpoint, stream)
+        try:
+            yield lease
+        except BaseException as e:
+            self._release(lease, None if isinstance(e, NOT_ENDPOINT_FAILURES) else e)
+            raise
+        self._release(lease, None)
+
+    @asynccontextmanager
+    async def alease(self, timeout=ACQUIRE_TIMEOUT_SECONDS, stream=True):
+        """Async variant of lease()"""
+        deadline = time.monotonic() + timeout
+        endpoint = self._try_acquire()
+        while endpoint is None:
+            if time.monotonic() > deadline:
+                raise NoEndpointAvailable("All endpoints are at their concurrency limit")
+            await asyncio.sleep(0.05)
+            endpoint = self._try_acquire()
+        lease = Lease(self, endpoint, stream)
+        try:
+            yield lease
+        except BaseException as e:
+            self._release(lease, None if isinstance(e, NOT_ENDPOINT_FAILURES) else e)
+            raise
+        self._release(lease, None)
+
+    async def aclose_clients(self):
+        for endpoint in self.endpoints:
+            await endpoint.aclose_clients()
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+
+def load_endpoints():
+    """Read the endpoint list from the environment.
+
+    AZURE_OPENAI_ENDPOINTS may hold a JSON list (or the path of a JSON file)
+    of objects with endpoint, api_key, deployment and optional name,
+    api_version, weight and max_concurrency. Without it, the single
+    AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_DEPLOYMENT_NAME pair is used.
+
+    With several endpoints the SDK's own retries default to 0, since the
+    caller fails over to another endpoint instead of retrying the same one.
+    """
+    api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
+    raw = os.getenv("AZURE_OPENAI_ENDPOINTS")
+    if raw:
+        if os.path.exists(raw):
+            with open(raw, "r", encoding="utf-8") as f:
+                raw = f.read()
+        entries = json.loads(raw)
+        return [Endpoint(
+            endpoint=entry["endpoint"],
+            api_key=entry.get("api_key") or os.getenv("AZURE_OPENAI_API_KEY"),
+            deployment=entry.get("deployment") or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
+            api_version=entry.get("api_version", api_version),
+            name=entry.get("name"),
+            weight=entry.get("weight", 1.0),
+            max_concurrency=entry.get("max_concurrency", 8),
+            max_retries=entry.get("max_retries", 0 if len(entries) > 1 else 2),
+        ) for entry in entries]
+    return [Endpoint(
+        endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
+        api_version=api_version,
+    )]
+
+
+def pool_from_env():
+    return EndpointPool(
+        load_endpoints(),
+        strategy=os.getenv("AZURE_OPENAI_ROUTING", "least-latency"),
+        slow_ttfb=float(os.getenv("AZURE_OPENAI_SLOW_TTFB_SECONDS", str(SLOW_TTFB_SECONDS))),
+    )
@@ -0,0 +1,178 @@
+"""Offline, CPU-only speech synthesis used when Azure is unreachable.
+
+Backends wrap small local TTS engines that run without a network or GPU:
+espeak-ng (or espeak), piper (with a downloaded .onnx voice), flite, or any
+command line that writes a WAV file (LOCAL_TTS_COMMAND). Whatever the
+engine produces is converted to the soundboard's pcm16 format: 24 kHz,
+mono, 16-bit.
+"""
+import abc
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+import wave
+import zlib
+
+import numpy as np
+
+SAMPLE_RATE = 24000
+TIMEOUT_SECONDS = 60
+
+
+def wav_to_pcm16(path, sample_rate=SAMPLE_RATE):
+    """Read a 16-bit WAV file as mono pcm16 bytes at sample_rate"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"Expected 16-bit WAV from the local engine, got {8 * f.getsampwidth()}-bit")
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        # Linear interpolation is plenty for a fallback voice
+        positions = np.arange(int(len(samples) * sample_rate / rate)) * (rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.clip(np.round(samples), -32768, 32767).astype("<i2").tobytes()
+
+
+class LocalSynthesizer(abc.ABC):
+    """A local engine: synthesize() returns pcm16 bytes for the given text.
+
+    Subclasses build the command line; engines that read the text from stdin
+    rather than a file set reads_stdin.
+    """
+
+    name = "local"
+    reads_stdin = False
+
+    @abc.abstractmethod
+    def is_available(self):
+        """Whether the engine is installed and configured"""
+
+    @abc.abstractmethod
+    def command(self, text_path, output_path, voice):
+        """Return the argv that writes a WAV of text_path to output_path"""
+
+    def synthesize(self, text, voice="alloy"):
+        with tempfile.TemporaryDirectory() as tmp:
+            text_path = os.path.join(tmp, "input.txt")
+            output_path = os.path.join(tmp, "output.wav")
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            subprocess.run(self.command(text_path, output_path, voice),
+                           input=text.encode("utf-8") if self.reads_stdin else None,
+                           check=True, timeout=TIMEOUT_SECONDS, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            return wav_to_pcm16(output_path)
+
+
+class EspeakSynthesizer(LocalSynthesizer):
+    name = "espeak"
+    # Give each gpt-audio voice a stable espeak variant so voices stay distinguishable
+    VARIANTS = ["m1", "f1", "m3", "f2", "m5", "f3", "m7", "f4", "m2", "f5"]
+
+    def __init__(self, language=None):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        self.language = language or os.getenv("LOCAL_TTS_LANGUAGE", "en")
+
+    def is_available(self):
+        return self.binary is not None
+
+    def command(self, text_path, output_path, voice):
+        variant = self.VARIANTS[zlib.crc32(voice.encode("utf-8")) % len(self.VARIANTS)]
+        return [self.binary, "-v", f"{self.language}+{variant}", "-s", "165", "-f", text_path, "-w", output_path]
+
+
+class PiperSynthesizer(LocalSynthesizer):
+    name = "piper"
+    # piper reads the text from stdin
+    reads_stdin = True
+
+    def __init__(self, model=None):
+        self.binary = shutil.which("piper")
+        self.model = model or os.getenv("LOCAL_TTS_PIPER_MODEL")
+
+    def is_available(self):
+        return self.binary is not None and bool(self.model) and os.path.exists(self.model)
+
+    def command(self, text_path, output_path, voice):
+        return [self.binary, "--model", self.model, "--output_file", output_path]
+
+
+class FliteSynthesizer(LocalSynthesizer):
+    name = "flite"
+
+    def __init__(self):
+        self.binary = shutil.which("flite")
+
+    def is_available(self):
+        return self.binary is not None
+
+    def command(self, text_path, output_path, voice):
+        return [self.binary, "-f", text_path, "-o", output_path]
+
+
+class CommandSynthesizer(LocalSynthesizer):
+    """Any engine with a command line, e.g.
+
+        LOCAL_TTS_COMMAND="mimic3 --voice en_US/vctk_low --output-file {output} --text-file {text_file}"
+
+    {text_file}, {output} and {voice} are substituted; the command is run
+    without a shell.
+    """
+
+    name = "command"
+
+    def __init__(self, template=None):
+        self.template = template or os.getenv("LOCAL_TTS_COMMAND", "")
+
+    def is_available(self):
+        return bool(self.template) and shutil.which(shlex.split(self.template)[0]) is not None
+
+    def command(self, text_path, output_path, voice):
+        return [part.format(text_file=text_path, output=output_path, voice=voice)
+                for part in shlex.split(self.template)]
+
+
+BACKENDS = {
+    "command": CommandSynthesizer,
+    "piper": PiperSynthesizer,
+    "espeak": EspeakSynthesizer,
+    "flite": FliteSynthesizer,
+}
+
+
+def load_synthesizer(spec="auto"):
+    """Return the configured local engine, or None.
+
+    spec is "off", a backend name, or "auto" for the first available one
+    in BACKENDS order (a configured command, then piper, espeak, flite).
+    """
+    if not spec or spec == "off":
+        return None
+    names = list(BACKENDS) if spec == "auto" else [spec]
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown local TTS backend {name!r}, expected one of {list(BACKENDS)}")
+        synthesizer = BACKENDS[name]()
+        if synthesizer.is_available():
+            return synthesizer
+    print(f"No local TTS engine available for LOCAL_TTS={spec}; offline fallback disabled")
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+
+    synthesizer = load_synthesizer(os.getenv("LOCAL_TTS", "auto"))
+    if synthesizer is None:
+        sys.exit("Install espeak-ng, flite or piper, or set LOCAL_TTS_COMMAND")
+    text = " ".join(sys.argv[1:]) or "Azure is unreachable, so this is the offline voice."
+    started_at = time.perf_counter()
+    pcm = synthesizer.synthesize(text)
+    elapsed = time.perf_counter() - started_at
+    seconds = len(pcm) / (2 * SAMPLE_RATE)
+    print(f"{synthesizer.name}: {seconds:.1f}s of audio in {elapsed * 1000:.0f} ms "
+          f"({seconds / elapsed:.0f}x real time)")
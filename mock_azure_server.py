@@ -0,0 +1,162 @@
+"""Local stand-in for Azure OpenAI endpoints with injected latency and failures.
+
+Serves chat completions (streaming and non-streaming) and audio speech
+requests from replay fixtures, after a configurable time to first byte.
+Deployments listed in `deployments` (e.g. the gpt-5-nano one, whose
+responses are JSON rather than audio) get fixtures of their own.
+Running this file starts several such servers and routes requests through
+an EndpointPool to show how traffic shifts between them.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import replay
+from endpoint_pool import Endpoint, EndpointPool
+
+
+class MockAzureServer:
+    """An HTTP server on localhost answering like an Azure OpenAI deployment"""
+
+    def __init__(self, fixtures, latency=0.1, jitter=0.0, fail_rate=0.0, chunk_interval=0.0, deployments=None):
+        self.fixtures = replay.load_fixtures(fixtures)
+        # Deployment name -> fixture directory, for deployments answering differently
+        self.deployments = {name: replay.load_fixtures(directory) for name, directory in (deployments or {}).items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.chunk_interval = chunk_interval
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                server.requests += 1
+                time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0))
+                if random.random() < server.fail_rate:
+                    payload = b'{"error": {"code": "InternalServerError", "message": "injected failure"}}'
+                    self.send_response(500)
+                    self.send_header("content-type", "application/json")
+                    self.send_header("content-length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                request = type("Request", (), {"url": type("URL", (), {"path": self.path.split("?")[0]})(),
+                                               "method": "POST", "content": body})()
+                fixtures = server.fixtures_for(self.path).get(replay.request_key(request))
+                if not fixtures:
+                    self.send_response(404)
+                    self.send_header("content-length", "0")
+                    self.end_headers()
+                    return
+                fixture = fixtures[0]
+                self.send_response(fixture["status"])
+                for name, value in fixture["headers"]:
+                    if name.lower() not in ("transfer-encoding", "content-encoding", "connection"):
+                        self.send_header(name, value)
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                for _, data in fixture["chunks"]:
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                    if server.chunk_interval:
+                        time.sleep(server.chunk_interval)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def fixtures_for(self, path):
+        """Fixtures of the deployment named in an Azure path (/openai/deployments/<name>/...)"""
+        parts = path.split("?")[0].split("/")
+        if "deployments" in parts[:-1]:
+            name = parts[parts.index("deployments") + 1]
+            return self.deployments.get(name, self.fixtures)
+        return self.fixtures
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
+
+
+async def drive(pool, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                async with pool.alease() as lease:
+                    stream = await lease.async_client().chat.completions.create(
+                        model=lease.deployment,
+                        messages=[{"role": "user", "content": "Hello"}],
+                        modalities=["text", "audio"],
+                        audio={"voice": "alloy", "format": "mp3"},
+                        stream=True,
+                    )
+                    async for _ in stream:
+                        lease.record_ttfb()
+            except Exception:
+                pass
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latencies", default="0.05,0.2,0.6", help="comma-separated TTFB per server (s)")
+    parser.add_argument("--fail-rates", default="0,0,0", help="comma-separated failure rate per server")
+    parser.add_argument("--strategy", default="least-latency", choices=["least-latency", "weighted"])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--max-concurrency", type=int, default=4, help="per-endpoint cap")
+    args = parser.parse_args()
+
+    latencies = [float(x) for x in args.latencies.split(",")]
+    fail_rates = [float(x) for x in args.fail_rates.split(",")]
+    fail_rates += [0.0] * (len(latencies) - len(fail_rates))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = replay.synthesize_fixtures(tmp, audio_bytes=24000)
+        servers = [MockAzureServer(fixtures, latency=latency, fail_rate=fail_rate)
+                   for latency, fail_rate in zip(latencies, fail_rates)]
+        for server in servers:
+            server.__enter__()
+        try:
+            pool = EndpointPool([
+                Endpoint(server.url, "mock", "gpt-audio", name=f"mock-{i} ({server.latency * 1000:.0f} ms)",
+                         max_concurrency=args.max_concurrency, max_retries=0)
+                for i, server in enumerate(servers)
+            ], strategy=args.strategy, slow_ttfb=1.0, cooldown=2.0)
+            started_at = time.perf_counter()
+            asyncio.run(drive(pool, args.requests, args.concurrency))
+            elapsed = time.perf_counter() - started_at
+        finally:
+            for server in servers:
+                server.__exit__()
+
+    print(f"{args.requests} requests in {elapsed:.2f}s ({args.strategy})")
+    for stats in pool.stats():
+        ewma = f"{stats['ewma_ttfb'] * 1000:.0f} ms" if stats["ewma_ttfb"] is not None else "-"
+        print(f"  {stats['name']:<22} requests={stats['requests']:<4} failures={stats['failures']:<3} "
+              f"ewma_ttfb={ewma:<8} ejections={stats['ejections']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+# Sample every 5 ms: fine enough to separate client setup, network wait,
+# decoding and file writes in a request of a few seconds
+INTERVAL_SECONDS = 0.005
+PROFILE_DIR = os.path.join(".cache", "profiles")
+FORMATS = ("speedscope", "collapsed")
+
+
+def frame_label(code):
+    # co_qualname is new in Python 3.11
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    """Sampling profiler scoped to one request.
+
+    Entering the profiler records the caller's frame as the root; a
+    background thread then samples every thread's stack and keeps only the
+    stacks that pass through that root frame, cut at the root. That follows
+    the request into asyncio.run() and across the worker threads Gradio
+    uses to resume a streaming generator, while ignoring other sessions.
+    Idle time in the event loop shows up as selector frames, i.e. network
+    wait.
+    """
+
+    def __init__(self, request_id, label="request", interval=INTERVAL_SECONDS,
+                 directory=PROFILE_DIR, output_format="speedscope"):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown profile format {output_format!r}, expected one of {FORMATS}")
+        self.request_id = request_id
+        self.label = label
+        self.interval = interval
+        self.directory = directory
+        self.output_format = output_format
+        self.samples = Counter()
+        self.started_at = None
+        self.elapsed = 0.0
+        self.path = None
+        self._root = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._root = sys._getframe(1)
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.request_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+        self._root = None
+        self.path = self.save()
+        print(f"Profile for request {self.request_id} ({self.label}): {sum(self.samples.values())} samples "
+              f"over {self.elapsed:.2f}s -> {self.path}")
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            root = self._root
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and frame is not root:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if frame is root:
+                    stack.append(frame_label(root.f_code))
+                    self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Brendan Gregg's folded format: one "a;b;c count" line per stack"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self):
+        """Speedscope "sampled" profile (https://www.speedscope.app/file-format-schema.json)"""
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            samples.append(ids)
+            weights.append(count * self.interval)
+        name = f"{self.label} {self.request_id}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "soundboard profiling.py",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.output_format == "collapsed":
+            path = os.path.join(self.directory, f"{self.request_id}.collapsed.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.collapsed())
+        else:
+            path = os.path.join(self.directory, f"{self.request_id}.speedscope.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.speedscope(), f)
+        return path
+
+    def top(self, n=10):
+        """(label, seconds) of the frames with the most self time"""
+        own = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count * self.interval
+        return own.most_common(n)
+
+
+class _Disabled:
+    """Stand-in used when profiling is off: entering it costs one method call"""
+
+    request_id = None
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+DISABLED = _Disabled()
+
+
+def request_id_for(request=None):
+    """Reuse the caller's X-Request-ID when there is one, otherwise make one up"""
+    headers = getattr(request, "headers", None) or {}
+    request_id = headers.get("x-request-id")
+    if request_id:
+        # It becomes a file name
+        return "".join(c for c in request_id if c.isalnum() or c in "-_")[:64] or uuid.uuid4().hex[:12]
+    return uuid.uuid4().hex[:12]
+
+
+def profiling_requested(request=None, enabled=False):
+    """True if profiling is on globally or asked for by this request.
+
+    A request opts in with an "X-Profile: 1" header or a ?profile=1 query
+    parameter on the page URL.
+    """
+    if enabled:
+        return True
+    if request is None:
+        return False
+    headers = getattr(request, "headers", None) or {}
+    query = getattr(request, "query_params", None) or {}
+    flag = headers.get("x-profile") or query.get("profile")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def profile_request(request=None, label="request", enabled=False, **options):
+    """Return a profiler context for this request, or a no-op one"""
+    if not profiling_requested(request, enabled):
+        return DISABLED
+    return RequestProfiler(request_id_for(request), label=label, **options)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import tempfile
+
+    import replay
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Replay synthetic fixtures at recorded speed so network wait shows up
+        os.environ["TTS_REPLAY_DIR"] = str(replay.synthesize_fixtures(os.path.join(tmp, "fixtures")))
+        os.environ["TTS_REPLAY_SPEED"] = "1"
+        os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://replay.invalid/")
+        os.environ.setdefault("AZURE_OPENAI_API_KEY", "replay")
+        import soundboard
+
+        output = os.path.join(tmp, f"profile.{soundboard.AUDIO_FILE_EXT}")
+        with profile_request(label="generate_audio_file", enabled=True) as profiler:
+            asyncio.run(soundboard.generate_audio_file("Profiling run", output, "alloy", "Calm"))
+        for label, seconds in profiler.top():
+            print(f"{seconds * 1000:>8.0f} ms  {label}")
+
+        started_at = time.perf_counter()
+        for _ in range(100000):
+            with profile_request(None):
+                pass
+        print(f"Disabled overhead: {(time.perf_counter() - started_at) * 10:.2f} us per request")
@@ -0,0 +1,322 @@
+"""Record and replay Azure OpenAI HTTP traffic for offline benchmarking.
+
+Set TTS_RECORD_DIR to capture every response (streaming or not) to JSON
+fixtures while talking to the real service, or TTS_REPLAY_DIR to serve those
+fixtures back without network access. TTS_REPLAY_SPEED scales the recorded
+timing: 1 replays in real time, 10 is ten times faster, 0 drops all delays.
+"""
+import asyncio
+import base64
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+FIXTURE_VERSION = 1
+
+
+def request_key(request):
+    """Key used to match a request to fixtures: endpoint and stream flag"""
+    # Azure paths embed the deployment name, so match on the operation only
+    operation = "/".join(request.url.path.rstrip("/").split("/")[-2:])
+    stream = False
+    try:
+        body = json.loads(request.content or b"{}")
+        stream = bool(body.get("stream", False))
+    except ValueError:
+        pass
+    return f"{request.method} {operation} stream={stream}"
+
+
+class _Recorder:
+    """Collect the raw body chunks of one response and write them on close"""
+
+    def __init__(self, directory, request, response, started_at):
+        self.directory = Path(directory)
+        self.request = request
+        self.response = response
+        self.started_at = started_at
+        self.chunks = []
+
+    def record(self, chunk):
+        self.chunks.append([time.perf_counter() - self.started_at, base64.b64encode(chunk).decode("ascii")])
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = len(list(self.directory.glob("*.json")))
+        fixture = {
+            "version": FIXTURE_VERSION,
+            "key": request_key(self.request),
+            "request": json.loads(self.request.content or b"{}"),
+            "status": self.response.status_code,
+            "headers": [[k, v] for k, v in self.response.headers.items()
+                        if k.lower() not in ("content-length", "set-cookie")],
+            "chunks": self.chunks,
+        }
+        name = fixture["key"].split()[1].replace("/", "-")
+        stream = "stream" if fixture["key"].endswith("True") else "complete"
+        path = self.directory / f"{index:03d}-{name}-{stream}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+        print(f"Recorded fixture {path}")
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def __iter__(self):
+        for chunk in self.inner:
+            self.recorder.record(chunk)
+            yield chunk
+
+    def close(self):
+        self.inner.close()
+        self.recorder.save()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self.recorder.record(chunk)
+            yield chunk
+
+    async def aclose(self):
+        await self.inner.aclose()
+        self.recorder.save()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Pass requests through to the network and save each response as a fixture"""
+
+    def __init__(self, directory, inner=None):
+        self.directory = directory
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        started_at = time.perf_counter()
+        response = self.inner.handle_request(request)
+        recorder = _Recorder(self.directory, request, response, started_at)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, recorder),
+                              extensions=response.extensions)
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Async variant of RecordingTransport"""
+
+    def __init__(self, directory, inner=None):
+        self.directory = directory
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        started_at = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        recorder = _Recorder(self.directory, request, response, started_at)
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncRecordingStream(response.stream, recorder),
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def load_fixtures(directory):
+    """Load fixtures from a directory, grouped by request key in file order"""
+    fixtures = {}
+    for path in sorted(Path(directory).glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            fixture = json.load(f)
+        fixture["chunks"] = [(t, base64.b64decode(data)) for t, data in fixture["chunks"]]
+        fixtures.setdefault(fixture["key"], []).append(fixture)
+    if not fixtures:
+        raise FileNotFoundError(f"No replay fixtures found in {directory}")
+    return fixtures
+
+
+class ReplayTrace:
+    """perf_counter() timings of the responses replayed while tracing() is active.
+
+    Each response records when it was requested and when its first body
+    chunk was handed to the client, so a benchmark can time an entry point
+    from its first request, leaving out imports and client setup.
+    """
+
+    def __init__(self):
+        self.responses = []
+
+    def start(self):
+        timings = {"requested_at": time.perf_counter(), "first_chunk_at": None}
+        self.responses.append(timings)
+        return timings
+
+    def time_to_first_chunk(self):
+        """Seconds from the first request to the first body chunk of any response"""
+        first = [r["first_chunk_at"] for r in self.responses if r["first_chunk_at"] is not None]
+        return min(first) - self.started_at if first else None
+
+    @property
+    def started_at(self):
+        return self.responses[0]["requested_at"] if self.responses else None
+
+
+_trace = None
+
+
+@contextmanager
+def tracing():
+    """Record the timings of every replayed response in a ReplayTrace"""
+    global _trace
+    previous, _trace = _trace, ReplayTrace()
+    try:
+        yield _trace
+    finally:
+        _trace = previous
+
+
+def _first_chunk_seen(timings):
+    if timings is not None and timings["first_chunk_at"] is None:
+        timings["first_chunk_at"] = time.perf_counter()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks, speed, timings=None):
+        self.chunks = chunks
+        self.speed = speed
+        self.timings = timings
+
+    def __iter__(self):
+        started_at = time.perf_counter()
+        for offset, data in self.chunks:
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+            _first_chunk_seen(self.timings)
+            yield data
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, speed, timings=None):
+        self.chunks = chunks
+        self.speed = speed
+        self.timings = timings
+
+    async def __aiter__(self):
+        started_at = time.perf_counter()
+        for offset, data in self.chunks:
+            if self.speed:
+                delay = offset / self.speed - (time.perf_counter() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            _first_chunk_seen(self.timings)
+            yield data
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Serve recorded fixtures instead of calling the network.
+
+    Fixtures with the same key are served round-robin, so a benchmark can
+    replay a single recording as many times as it needs.
+    """
+
+    def __init__(self, directory, speed=1.0):
+        self.speed = speed
+        self._fixtures = {key: itertools.cycle(items) for key, items in load_fixtures(directory).items()}
+
+    def _next(self, request):
+        key = request_key(request)
+        if key not in self._fixtures:
+            raise httpx.ConnectError(f"No replay fixture for {key}", request=request)
+        return next(self._fixtures[key])
+
+    def handle_request(self, request):
+        fixture = self._next(request)
+        timings = _trace.start() if _trace is not None else None
+        return httpx.Response(fixture["status"], headers=fixture["headers"],
+                              stream=_ReplayStream(fixture["chunks"], self.speed, timings))
+
+    async def handle_async_request(self, request):
+        fixture = self._next(request)
+        timings = _trace.start() if _trace is not None else None
+        return httpx.Response(fixture["status"], headers=fixture["headers"],
+                              stream=_AsyncReplayStream(fixture["chunks"], self.speed, timings))
+
+
+def http_client_from_env(async_client=False):
+    """Return an httpx client for the OpenAI SDK when recording or replaying.
+
+    Returns None otherwise, which lets the SDK use its default client.
+    """
+    replay_dir = os.getenv("TTS_REPLAY_DIR")
+    record_dir = os.getenv("TTS_RECORD_DIR")
+    if replay_dir:
+        transport = ReplayTransport(replay_dir, speed=float(os.getenv("TTS_REPLAY_SPEED", "1")))
+    elif record_dir:
+        transport = AsyncRecordingTransport(record_dir) if async_client else RecordingTransport(record_dir)
+    else:
+        return None
+    return httpx.AsyncClient(transport=transport) if async_client else httpx.Client(transport=transport)
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def synthesize_fixtures(directory, audio_bytes=96000, delta_bytes=2400, interval=0.02, ttfb=0.4):
+    """Write synthetic streaming and non-streaming chat completion fixtures.
+
+    Handy for smoke-testing the replay path when no recording is available;
+    real recordings should be preferred for benchmark numbers.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    audio = bytes(range(256)) * (audio_bytes // 256)
+    base = {"id": "chatcmpl-replay", "created": 0, "model": "gpt-audio"}
+
+    chunks = []
+    for i, offset in enumerate(range(0, len(audio), delta_bytes)):
+        delta = {"audio": {"data": base64.b64encode(audio[offset:offset + delta_bytes]).decode("ascii"),
+                           "transcript": "word "}}
+        payload = dict(base, object="chat.completion.chunk",
+                       choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+        chunks.append([ttfb + i * interval, _sse(payload)])
+    usage = {"prompt_tokens": 50, "completion_tokens": 400, "total_tokens": 450}
+    chunks.append([chunks[-1][0], _sse(dict(base, object="chat.completion.chunk", choices=[], usage=usage))])
+    chunks.append([chunks[-1][0], b"data: [DONE]\n\n"])
+
+    complete = dict(base, object="chat.completion", usage=usage, choices=[{
+        "index": 0, "finish_reason": "stop",
+        "message": {"role": "assistant", "content": None, "audio": {
+            "id": "audio-replay", "expires_at": 0, "transcript": "word " * (len(audio) // delta_bytes),
+            "data": base64.b64encode(audio).decode("ascii")}}}])
+
+    headers = [["content-type", "text/event-stream"]]
+    for name, key, body, hdrs in [
+        ("000-chat-completions-stream.json", "POST chat/completions stream=True", chunks, headers),
+        ("001-chat-completions-complete.json", "POST chat/completions stream=False",
+         [[chunks[-1][0], json.dumps(complete).encode("utf-8")]], [["content-type", "application/json"]]),
+    ]:
+        fixture = {"version": FIXTURE_VERSION, "key": key, "request": {}, "status": 200, "headers": hdrs,
+                   "chunks": [[t, base64.b64encode(data).decode("ascii")] for t, data in body]}
+        with open(directory / name, "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+    return directory
+
+
+if __name__ == "__main__":
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else "fixtures/synthetic"
+    print(f"Synthetic fixtures written to {synthesize_fixtures(target)}")
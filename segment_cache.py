@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from audio_processing import join_segments
+from audio_result import AudioChunk, AudioResult
+
+# Sentence boundaries for the languages used by the demo (Latin scripts and
+# Arabic), plus blank lines between paragraphs
+SENTENCE_END = re.compile(r"(?<=[.!?…؟])\s+|\n\s*\n")
+
+MAX_ENTRIES = 5000
+
+
+def split_sentences(text):
+    """Split a script into sentences, keeping their original punctuation"""
+    return [part.strip() for part in SENTENCE_END.split(text) if part and part.strip()]
+
+
+def normalize_sentence(sentence):
+    """Normalize a sentence for cache lookup (Unicode form, case, whitespace)"""
+    sentence = unicodedata.normalize("NFKC", sentence)
+    return " ".join(sentence.split()).casefold()
+
+
+def segment_key(voice, instructions, sentence, audio_format):
+    raw = "\x1f".join([voice.lower(), " ".join(instructions.split()), normalize_sentence(sentence), audio_format])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SegmentCache:
+    """Disk-backed cache of synthesized sentences.
+
+    Each entry is an audio file plus a small JSON sidecar with the
+    transcript and the time the model took to render it, which is what a
+    cache hit saves. The index is shared by the UI handlers, the speculative
+    render thread and the preview executor, so it is guarded by a lock;
+    file I/O happens outside it.
+    """
+
+    def __init__(self, directory, max_entries=MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                path = os.path.join(directory, name)
+                entries.append((os.path.getmtime(path), name[:-5]))
+        for _, key in sorted(entries):
+            self._index[key] = None
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return f"{base}.audio", f"{base}.json"
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def get(self, key):
+        """Return (audio_bytes, metadata) or None"""
+        with self._lock:
+            if key not in self._index:
+                return None
+        audio_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            with open(audio_path, "rb") as f:
+                audio = f.read()
+        except OSError:
+            # Evicted meanwhile, or removed from disk
+            with self._lock:
+                self._index.pop(key, None)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        return audio, metadata
+
+    def put(self, key, audio, metadata):
+        audio_path, meta_path = self._paths(key)
+        # Write under temp names so a concurrent reader never sees half an entry
+        for path, data, mode in ((audio_path, audio, "wb"), (meta_path, json.dumps(metadata), "w")):
+            with open(f"{path}.part", mode) as f:
+                f.write(data)
+            os.replace(f"{path}.part", path)
+        with self._lock:
+            self._index[key] = None
+            self._index.move_to_end(key)
+            evicted = []
+            while len(self._index) > self.max_entries:
+                evicted.append(self._index.popitem(last=False)[0])
+        for oldest in evicted:
+            for path in self._paths(oldest):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _merge_usage(total, usage):
+    for name, value in (usage or {}).items():
+        if isinstance(value, (int, float)):
+            total[name] = total.get(name, 0) + value
+        elif isinstance(value, dict):
+            total[name] = _merge_usage(total.get(name, {}), value)
+    return total
+
+
+async def synthesize_segments(script, voice, instructions, render, cache, audio_format="mp3", concurrency=4):
+    """Assemble a script's audio from cached sentences, rendering only the misses.
+
+    render is an async callable (sentence, voice, instructions) returning an
+    AudioResult. Misses are rendered concurrently (at most `concurrency` at a
+    time); duplicate sentences in the script are rendered once. Returns the
+    combined AudioResult and a stats dict with the reuse ratio and the model
+    seconds saved.
+    """
+    started_at = time.perf_counter()
+    sentences = split_sentences(script) or [script]
+    keys = [segment_key(voice, instructions, sentence, audio_format) for sentence in sentences]
+
+    segments, seconds_saved = {}, 0.0
+    for key in set(keys):
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            segments[key] = cached
+            seconds_saved += cached[1].get("render_seconds", 0.0)
+
+    misses = {key: sentence for key, sentence in zip(keys, sentences) if key not in segments}
+    # Repeated sentences within the script are reused too
+    hits = len(keys) - len(misses)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render_miss(key, sentence):
+        async with semaphore:
+            rendered_at = time.perf_counter()
+            result = await render(sentence, voice, instructions)
+            metadata = {
+                "transcript": result.transcript or sentence,
+                "model": result.model,
+                "fallback": result.fallback,
+                "usage": result.usage,
+                "render_seconds": time.perf_counter() - rendered_at,
+            }
+            audio = bytes(result.audio)
+            # The tts-1 fallback ignores the vibe instructions, so it must
+            # not be served later as if it were the styled rendering
+            if cache is not None and not result.fallback:
+                cache.put(key, audio, metadata)
+            segments[key] = (audio, metadata)
+
+    tasks = [asyncio.ensure_future(render_miss(key, sentence)) for key, sentence in misses.items()]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # The script cannot be assembled without every segment: stop the
+        # other renders and wait for them to release their endpoints
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    combined = AudioResult(voice=voice, format=audio_format, started_at=started_at)
+    usage = {}
+    for key in keys:
+        audio, metadata = segments[key]
+        combined.chunks.append(AudioChunk(byte_offset=combined.size, size=len(audio),
+                                          elapsed=0.0, transcript=metadata["transcript"]))
+        combined.size += len(audio)
+        combined.fallback = combined.fallback or metadata.get("fallback", False)
+        if not combined.model and metadata.get("model"):
+            combined.model = metadata["model"]
+    # Only the segments rendered now consumed tokens
+    for key in misses:
+        _merge_usage(usage, segments[key][1].get("usage"))
+    combined.transcript = " ".join(metadata["transcript"] for _, metadata in (segments[key] for key in keys))
+    combined.usage = usage or None
+    if audio_format == "pcm16":
+        combined.audio = bytearray(join_segments([segments[key][0] for key in keys]))
+        combined.size = len(combined.audio)
+    else:
+        # MP3 frames are self-contained, so segments can simply be concatenated
+        combined.audio = bytearray(b"".join(segments[key][0] for key in keys))
+
+    stats = {
+        "segments": len(keys),
+        "hits": hits,
+        "rendered": len(misses),
+        "reuse_ratio": hits / len(keys) if keys else 0.0,
+        "model_seconds_saved": seconds_saved,
+        "elapsed": time.perf_counter() - started_at,
+    }
+    return combined, stats
@@ -0,0 +1,265 @@
+"""Soak test for the soundboard: long runs of simulated sessions against mock endpoints.
+
+Drives soundboard.py's handlers the way the UI does (vibe search, paging
+and shuffle, vibe selection, GPT-5 Nano content generation, audio
+generation and stop) from many concurrent sessions, with the Azure
+endpoints replaced by mock_azure_server.py. RSS, open file descriptors, threads, pending asyncio
+tasks, open event loops, the size of the soundboard's temp directory and the
+content pool are sampled over time; the run fails if any of them keeps
+growing. The mock answers the gpt-5-nano deployment with a valid JSON batch,
+so batched content generation and its background refill are exercised too.
+
+    python soak_test.py --duration 14400 --concurrency 8 --report soak.json
+    python soak_test.py --duration 120       # quick smoke run
+
+Set the usual soundboard variables (UI_STREAMING, STREAM_TO_FILE,
+SEGMENT_CACHE, SPECULATIVE_RENDER, LOCAL_PREVIEW...) to soak a particular configuration.
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import replay
+from mock_azure_server import MockAzureServer
+
+# Growth allowed between the start and the end of the measured window
+# (after warm-up) before a resource counts as leaking
+TOLERANCES = {
+    "rss_mb": 64.0,
+    "gc_objects": 50000,
+    "open_fds": 16,
+    "threads": 8,
+    "asyncio_tasks": 16,
+    "event_loops": 8,
+    "temp_dir_mb": 16.0,
+    # Scripts waiting in the content pool; bounded by the batch size
+    "content_pooled": 8,
+}
+
+
+class SimulatedRequest:
+    """Just enough of gr.Request for the handlers"""
+
+    def __init__(self, session_hash):
+        self.session_hash = session_hash
+        self.headers = {}
+        self.query_params = {}
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        # Not Linux: ru_maxrss is the peak rather than the current size
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def open_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(path):
+            return len(os.listdir(path))
+    return 0
+
+
+def directory_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / 1e6
+
+
+def synthesize_content_fixtures(directory, use_cases):
+    """A gpt-5-nano batch response with a valid script for every use case"""
+    os.makedirs(directory, exist_ok=True)
+    scripts = [{"id": use_case["type"], "script": f"This is the soak test script for {use_case['type']}. " * 3}
+               for use_case in use_cases]
+    completion = {"id": "chatcmpl-soak", "created": 0, "model": "gpt-5-nano", "object": "chat.completion",
+                  "usage": {"prompt_tokens": 300, "completion_tokens": 600, "total_tokens": 900},
+                  "choices": [{"index": 0, "finish_reason": "stop",
+                               "message": {"role": "assistant", "content": json.dumps({"scripts": scripts})}}]}
+    body = base64.b64encode(json.dumps(completion).encode("utf-8")).decode("ascii")
+    with open(os.path.join(directory, "000-content-batch.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": replay.FIXTURE_VERSION, "key": "POST chat/completions stream=False", "request": {},
+                   "status": 200, "headers": [["content-type", "application/json"]], "chunks": [[0.0, body]]}, f)
+    return directory
+
+
+def sample_resources(temp_dir, content_pool=None):
+    tasks = loops = 0
+    objects = gc.get_objects()
+    for obj in objects:
+        if isinstance(obj, asyncio.Task):
+            tasks += not obj.done()
+        elif isinstance(obj, asyncio.AbstractEventLoop):
+            loops += not obj.is_closed()
+    return {
+        "rss_mb": rss_mb(),
+        # Python-level growth, separate from allocator fragmentation in RSS
+        "gc_objects": len(objects),
+        "open_fds": open_fds(),
+        "threads": threading.active_count(),
+        "asyncio_tasks": tasks,
+        "event_loops": loops,
+        "temp_dir_mb": directory_mb(temp_dir),
+        **content_stats(content_pool),
+    }
+
+
+def content_stats(content_pool):
+    stats = content_pool.stats() if content_pool is not None else {}
+    return {f"content_{name}": stats.get(name, 0) for name in ("pooled", "batches", "generated", "failed")}
+
+
+def run_session(soundboard, session_id, rng):
+    """One simulated visitor: search, page or shuffle, pick vibes or generate content, play, stop"""
+    request = SimulatedRequest(f"soak-{session_id}")
+    query = rng.choice(["", "", "calm", "pi", "news story"])
+    page = soundboard.browse_vibes(query, "all")
+    if rng.random() < 0.5:
+        page = soundboard.next_vibes(query, "all", page[-1])
+    if rng.random() < 0.5:
+        page = soundboard.shuffle_vibes(query, "all")
+    visible = [value for _, value in page[0].choices] or [rng.choice(soundboard.vibe_catalog.search())]
+    for _ in range(rng.randint(1, 3)):
+        voice = rng.choice(soundboard.VOICES)
+        if rng.random() < 0.25:
+            desc, script = asyncio.run(soundboard.handle_generate_content())
+        else:
+            desc, script = soundboard.select_vibe(rng.choice(visible), voice, request)
+        if soundboard.UI_STREAMING:
+            for _ in soundboard.stream_play_stop(voice, desc, script, request):
+                pass
+        elif soundboard.LOCAL_PREVIEW:
+            for _ in soundboard.preview_play_stop(voice, desc, script, request):
+                pass
+        else:
+            soundboard.toggle_play_stop(voice, desc, script, request)
+        soundboard.handle_stop()
+
+
+def find_leaks(samples, tolerances=TOLERANCES, warmup=0.2):
+    """Compare the start and end of the run after warm-up, per resource.
+
+    Caches and pools legitimately grow at first, so the first `warmup`
+    fraction of samples is ignored. A resource leaks if the median of the
+    last quarter exceeds the median of the first quarter by more than its
+    tolerance.
+    """
+    measured = samples[int(len(samples) * warmup):]
+    window = max(len(measured) // 4, 1)
+    report = {}
+    for name, tolerance in tolerances.items():
+        start = statistics.median(s[name] for s in measured[:window])
+        end = statistics.median(s[name] for s in measured[-window:])
+        hours = (measured[-1]["elapsed"] - measured[0]["elapsed"]) / 3600 if len(measured) > 1 else 0
+        report[name] = {
+            "start": start,
+            "end": end,
+            "peak": max(s[name] for s in samples),
+            "growth_per_hour": (end - start) / hours if hours else 0.0,
+            "leaking": end - start > tolerance,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3600, help="seconds to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous sessions")
+    parser.add_argument("--sample-interval", type=float, default=10, help="seconds between samples")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock time to first byte (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.02, help="mock failure rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="write samples and the leak report to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = replay.synthesize_fixtures(tmp, audio_bytes=48000)
+        with MockAzureServer(fixtures, latency=args.latency, jitter=args.latency / 2,
+                             fail_rate=args.fail_rate) as server:
+            # The soundboard reads its configuration at import time
+            for name in ("TTS_REPLAY_DIR", "TTS_RECORD_DIR", "AZURE_OPENAI_ENDPOINTS"):
+                os.environ.pop(name, None)
+            os.environ["AZURE_OPENAI_ENDPOINT"] = server.url
+            os.environ["AZURE_OPENAI_API_KEY"] = "soak"
+            import soundboard
+            # Content requests go to the gpt-5-nano deployment, which answers with JSON
+            server.deployments[soundboard.NANO_MODEL] = replay.load_fixtures(
+                synthesize_content_fixtures(os.path.join(tmp, "content"), soundboard.CONTENT_USE_CASES))
+
+            rng = random.Random(args.seed)
+            stop = threading.Event()
+            sessions = {"completed": 0, "failed": 0}
+            lock = threading.Lock()
+
+            def worker(worker_id):
+                worker_rng = random.Random(rng.random())
+                while not stop.is_set():
+                    with lock:
+                        session_id = sessions["completed"] + sessions["failed"]
+                    try:
+                        run_session(soundboard, f"{worker_id}-{session_id}", worker_rng)
+                        outcome = "completed"
+                    except Exception as e:
+                        print(f"Session failed: {e}")
+                        outcome = "failed"
+                    with lock:
+                        sessions[outcome] += 1
+
+            samples = []
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for worker_id in range(args.concurrency):
+                    pool.submit(worker, worker_id)
+                try:
+                    while time.perf_counter() - started_at < args.duration:
+                        time.sleep(min(args.sample_interval, args.duration))
+                        sample = sample_resources(soundboard.temp_dir, soundboard.content_pool)
+                        sample.update(elapsed=time.perf_counter() - started_at, **sessions)
+                        samples.append(sample)
+                        print(f"[{sample['elapsed']:>7.0f}s] sessions={sessions['completed']:<6} "
+                              f"failed={sessions['failed']:<4} rss={sample['rss_mb']:.0f}MB objects={sample['gc_objects']} "
+                              f"fds={sample['open_fds']} threads={sample['threads']} "
+                              f"tasks={sample['asyncio_tasks']} loops={sample['event_loops']} "
+                              f"temp={sample['temp_dir_mb']:.1f}MB content={sample['content_generated']}"
+                              f"/{sample['content_failed']} ok/failed pooled={sample['content_pooled']}")
+                finally:
+                    stop.set()
+
+    report = find_leaks(samples)
+    print(f"\n{sessions['completed']} sessions completed, {sessions['failed']} failed "
+          f"in {samples[-1]['elapsed']:.0f}s")
+    print(f"{'resource':<14} {'start':>9} {'end':>9} {'peak':>9} {'per hour':>10}")
+    for name, r in report.items():
+        flag = "  LEAK" if r["leaking"] else ""
+        print(f"{name:<14} {r['start']:>9.1f} {r['end']:>9.1f} {r['peak']:>9.1f} {r['growth_per_hour']:>10.1f}{flag}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"samples": samples, "report": report, "sessions": sessions}, f, indent=2)
+    if soundboard.content_pool is not None and not samples[-1]["content_generated"]:
+        print("Content pool generated no scripts: batched content generation was not exercised")
+        sys.exit(1)
+    if any(r["leaking"] for r in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,32 @@ import gradio as gr
 import random
 import json
 import asyncio
+import contextvars
 import os
 import io
 import tempfile
 import time
+import wave
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from openai import AzureOpenAI
 
+import audio_processing
+from replay import http_client_from_env
+from endpoint_pool import ACQUIRE_TIMEOUT_SECONDS, NoEndpointAvailable, pool_from_env
+from audio_result import AudioResult, apply_stream_chunk, result_from_completion
+from chunk_batching import AdaptiveCoalescer, acoalesce
+from speculation import SpeculativeRenderer
+from audio_writer import AtomicAudioWriter
+from segment_cache import SegmentCache, segment_key, synthesize_segments
+from profiling import profile_request
+from vibe_catalog import FIELDS, VibeCatalog
+from local_tts import load_synthesizer
+from usage_budget import UsageLedger, audio_seconds, current_session
+from content_batch import ContentPool, ContentUnavailable, generate_batch, generate_single
+from audio_delivery import MEDIA_TYPES, ClipStore, OpusTranscoder, mount, player_html
+
 load_dotenv()
 
 # Global state
@@ -20,83 +38,168 @@ current_vibe = None
 # Available voices for the gpt-audio model
 VOICES = ["alloy", "ash", "ballad", "cedar", "coral", "echo", "marin", "sage", "shimmer", "verse"]
 
+# Audio output format: "mp3" (default) or "pcm16" (24 kHz mono, required for post-processing)
+AUDIO_FORMAT = os.getenv("AZURE_OPENAI_AUDIO_FORMAT", "mp3")
+AUDIO_FILE_EXT = "wav" if AUDIO_FORMAT == "pcm16" else AUDIO_FORMAT
+
+# Optional post-processing of PCM output (loudness normalization, silence trim)
+AUDIO_POSTPROCESS = os.getenv("AUDIO_POSTPROCESS", "false").lower() == "true"
+
+# Stream audio to the browser as it is generated instead of waiting for the full file
+UI_STREAMING = os.getenv("UI_STREAMING", "false").lower() == "true"
+STREAM_MIN_BATCH_SECONDS = float(os.getenv("STREAM_MIN_BATCH_SECONDS", "0.25"))
+STREAM_MAX_BATCH_SECONDS = float(os.getenv("STREAM_MAX_BATCH_SECONDS", "2.0"))
+STREAM_MAX_BATCH_BYTES = int(os.getenv("STREAM_MAX_BATCH_BYTES", str(64 * 1024)))
+
+# Stream audio deltas straight to disk instead of buffering the whole clip
+STREAM_TO_FILE = os.getenv("STREAM_TO_FILE", "false").lower() == "true"
+AUDIO_FILE_FSYNC = os.getenv("AUDIO_FILE_FSYNC", "false").lower() == "true"
+
+# Synthesize scripts sentence by sentence and reuse segments shared across scripts
+SEGMENT_CACHE = os.getenv("SEGMENT_CACHE", "false").lower() == "true"
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", os.path.join(".cache", "segments"))
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", "4"))
+
+# Opt-in: start rendering as soon as a vibe or voice is selected, before "Generate" is clicked
+SPECULATIVE_RENDER = os.getenv("SPECULATIVE_RENDER", "false").lower() == "true"
+SPECULATIVE_MAX_PER_SESSION = int(os.getenv("SPECULATIVE_MAX_PER_SESSION", "5"))
+SPECULATIVE_TTL_SECONDS = float(os.getenv("SPECULATIVE_TTL_SECONDS", "60"))
+
+# Optional: profile generations and save flame graphs. PROFILE_REQUESTS=true
+# profiles every click; otherwise a request opts in with an "X-Profile: 1"
+# header or by opening the page with ?profile=1
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# Offline fallback: when Azure cannot serve a request, speak it with a local
+# engine (espeak-ng, piper, flite or LOCAL_TTS_COMMAND; see local_tts.py).
+# "auto" uses the first one installed, "off" disables the tier.
+LOCAL_TTS = os.getenv("LOCAL_TTS", "auto")
+# Go local instead of waiting longer than this for a free endpoint
+LOCAL_TTS_MAX_WAIT_SECONDS = float(os.getenv("LOCAL_TTS_MAX_WAIT_SECONDS", "5"))
+# Play the local voice at once and swap in the gpt-audio render when it is ready
+LOCAL_PREVIEW = os.getenv("LOCAL_PREVIEW", "false").lower() == "true"
+
+# Optional usage budgets, per session and for the whole server, over a rolling
+# window (0 = unlimited). Over budget, clips are shortened to the sentences
+# that fit (cached segments are free), then spoken by the local voice.
+USAGE_WINDOW_SECONDS = float(os.getenv("USAGE_WINDOW_SECONDS", "60"))
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+GLOBAL_TOKEN_BUDGET = int(os.getenv("GLOBAL_TOKEN_BUDGET", "0"))
+SESSION_AUDIO_SECONDS_BUDGET = float(os.getenv("SESSION_AUDIO_SECONDS_BUDGET", "0"))
+GLOBAL_AUDIO_SECONDS_BUDGET = float(os.getenv("GLOBAL_AUDIO_SECONDS_BUDGET", "0"))
+# Assumed cost of a gpt-5-nano content request until one has been seen
+NANO_TOKENS_ESTIMATE = 1500
+
+# Scripts requested per gpt-5-nano call by the content button (1 = one per click)
+CONTENT_BATCH_SIZE = int(os.getenv("CONTENT_BATCH_SIZE", "4"))
+
+# Serve finished clips from /audio/<id> with ETag/Last-Modified caching and
+# Range requests, plus a low-bitrate Opus variant for mobile and Save-Data
+# clients when ffmpeg is installed (see audio_delivery.py). Clips then play
+# in an HTML player instead of gr.Audio. Not used with UI_STREAMING.
+AUDIO_DELIVERY = os.getenv("AUDIO_DELIVERY", "false").lower() == "true"
+AUDIO_DELIVERY_DIR = os.getenv("AUDIO_DELIVERY_DIR", os.path.join(".cache", "clips"))
+AUDIO_DELIVERY_MAX_CLIPS = int(os.getenv("AUDIO_DELIVERY_MAX_CLIPS", "500"))
+AUDIO_DELIVERY_OPUS_BITRATE = os.getenv("AUDIO_DELIVERY_OPUS_BITRATE", "32k")
+
 # Create temporary directory to store audio files
 temp_dir = tempfile.mkdtemp()
+# Only the newest files are kept: Gradio copies each one into its own cache
+# when it is returned, and a long-running server would otherwise fill the disk
+TEMP_AUDIO_MAX_FILES = int(os.getenv("TEMP_AUDIO_MAX_FILES", "200"))
+
+segment_cache = SegmentCache(SEGMENT_CACHE_DIR) if SEGMENT_CACHE else None
 
 azure = AzureOpenAI(
     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
     api_key=os.getenv("AZURE_OPENAI_API_KEY"),
     api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview"),
+    http_client=http_client_from_env(),
+)
+
+# gpt-audio requests are routed across one or more endpoints/deployments
+# (AZURE_OPENAI_ENDPOINTS), by EWMA time to first byte or by weight. The pool
+# keeps one async client per endpoint and event loop.
+endpoint_pool = pool_from_env()
+
+# With several endpoints, a failed request is retried once on another one
+# before falling back to tts-1
+GPT_AUDIO_ATTEMPTS = min(len(endpoint_pool), 2)
+
+local_synthesizer = load_synthesizer(LOCAL_TTS)
+if LOCAL_PREVIEW and local_synthesizer is None:
+    print("LOCAL_PREVIEW needs a local TTS engine; previews disabled")
+    LOCAL_PREVIEW = False
+# Streamed clips can only switch to the local voice when they are raw PCM too
+LOCAL_STREAMING = local_synthesizer is not None and AUDIO_FORMAT == "pcm16"
+# How long a request queues for a free endpoint before giving up (and going local)
+ENDPOINT_WAIT_SECONDS = LOCAL_TTS_MAX_WAIT_SECONDS if local_synthesizer is not None else ACQUIRE_TIMEOUT_SECONDS
+
+# Tokens, audio seconds and wall time of every response, per session and model
+usage_ledger = UsageLedger(
+    window=USAGE_WINDOW_SECONDS,
+    session_tokens=SESSION_TOKEN_BUDGET,
+    global_tokens=GLOBAL_TOKEN_BUDGET,
+    session_audio_seconds=SESSION_AUDIO_SECONDS_BUDGET,
+    global_audio_seconds=GLOBAL_AUDIO_SECONDS_BUDGET,
 )
 
-def update_voice(selected_voice):
-    global current_voice
-    current_voice = selected_voice.lower()
-    return selected_voice, gr.Button(variant="primary")
+# Final renders behind a local preview run here, off the request thread
+preview_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="final-render") if LOCAL_PREVIEW else None
+
+if AUDIO_DELIVERY and UI_STREAMING:
+    print("AUDIO_DELIVERY serves finished clips, so it is not used with UI_STREAMING")
+    AUDIO_DELIVERY = False
+clip_store = None
+if AUDIO_DELIVERY:
+    transcoder = OpusTranscoder(AUDIO_DELIVERY_OPUS_BITRATE)
+    if not transcoder.is_available():
+        print("ffmpeg not found; clips are delivered without an Opus variant")
+    clip_store = ClipStore(AUDIO_DELIVERY_DIR, AUDIO_DELIVERY_MAX_CLIPS, transcoder)
+
+# All vibes, indexed for search. VIBE_CATALOG_PATHS adds more JSON files or
+# directories of them (os.pathsep-separated) to the built-in vibe.json.
+vibe_catalog = VibeCatalog.from_files(
+    ["vibe.json", *filter(None, os.getenv("VIBE_CATALOG_PATHS", "").split(os.pathsep))]
+)
 
-def reset_buttons():
-    return [gr.Button(variant="secondary") for _ in range(11)]
+VIBE_FIELDS = {"all": FIELDS, "name": ("Vibe",), "description": ("Description",), "script": ("Script",)}
 
-def update_random_button():
-    buttons = reset_buttons()
-    random_index = random.randint(0, 10)  # Randomly select one button index
-    buttons[random_index] = gr.Button(variant="primary")
-    selected_voice = "Alloy Ash Ballad Coral Echo Fable Nova Onyx Sage Shimmer Verse".split()[random_index]
-    return f"Voice: {selected_voice}", *buttons
+def vibe_page_caption(page):
+    heading = f"{'Shuffled · ' if page.seed is not None else ''}Page {page.page + 1} of {page.pages}"
+    return f"{heading} · {page.total} vibe{'s' if page.total != 1 else ''}" if page.total else "No vibes match"
 
-def load_vibes():
-    with open("vibe.json", "r", encoding="utf-8") as file:
-        vibes = json.load(file)
-    return [vibe["Vibe"] for vibe in vibes]
+def vibe_page_update(page):
+    """Radio and caption for one page of vibes: the payload is the page, not the catalog
 
-def update_vibe_buttons(all_vibes=None):
-    global current_vibe
-    if all_vibes is None:
-        all_vibes = load_vibes()
-    visible_vibes = random.sample(all_vibes, 5)
-    current_vibe = None  # Reset current vibe when shuffling
-    return [gr.Button(vibe, variant="secondary", visible=(vibe in visible_vibes)) for vibe in all_vibes], visible_vibes
+    The page state is (page number, shuffle seed), so paging after a
+    shuffle continues the shuffled order.
+    """
+    return gr.Radio(choices=page.names, value=None), vibe_page_caption(page), (page.page, page.seed)
 
-def get_vibe_description(vibe_name):
-    global current_vibe
-    current_vibe = vibe_name
-    with open("vibe.json", "r", encoding="utf-8") as file:
-        vibes = json.load(file)
-        for vibe in vibes:
-            if vibe["Vibe"] == vibe_name:
-                # Replace escaped newlines with actual newlines while preserving other characters
-                description = vibe["Description"].replace('\\n', '\n')
-                return description
-    return ""
-
-def update_selected_vibe(selected_vibe, visible_vibes):
-    global current_vibe
-    current_vibe = selected_vibe
-    all_vibes = load_vibes()
-    description = get_vibe_description(selected_vibe)
-    return [gr.Button(vibe, 
-            variant="primary" if vibe == selected_vibe else "secondary",
-            visible=(vibe in visible_vibes)) 
-            for vibe in all_vibes], visible_vibes
-
-def shuffle_vibes():
+def browse_vibes(query, field, page=0, seed=None):
+    """Show one page of the vibes matching the search"""
+    return vibe_page_update(vibe_catalog.page(query, VIBE_FIELDS.get(field, FIELDS), page, seed=seed))
+
+def previous_vibes(query, field, state):
+    page, seed = state
+    return browse_vibes(query, field, page - 1, seed)
+
+def next_vibes(query, field, state):
+    page, seed = state
+    return browse_vibes(query, field, page + 1, seed)
+
+def shuffle_vibes(query="", field="all"):
+    """The first page of a new shuffled order of the vibes matching the search"""
     global current_vibe
     current_vibe = None  # Reset current vibe when shuffling
-    all_vibes = load_vibes()
-    visible_vibes = random.sample(all_vibes, 5)
-    buttons = [gr.Button(vibe, variant="secondary", visible=(vibe in visible_vibes)) for vibe in all_vibes]
-    return *buttons, visible_vibes
+    return vibe_page_update(vibe_catalog.sample(query=query, fields=VIBE_FIELDS.get(field, FIELDS)))
 
 def get_vibe_info(vibe_name):
-    with open("vibe.json", "r", encoding="utf-8") as file:
-        vibes = json.load(file)
-        for vibe in vibes:
-            if vibe["Vibe"] == vibe_name:
-                # Replace escaped newlines with actual newlines while preserving other characters
-                description = vibe["Description"].replace('\\n', '\n')
-                script = vibe["Script"].replace('\\n', '\n')
-                return description, script
-    return "", ""
+    return vibe_catalog.get(vibe_name)
 
 def check_api_key():
     api_key = os.getenv("AZURE_OPENAI_API_KEY")
@@ -104,112 +207,442 @@ def check_api_key():
         raise ValueError("Azure OpenAI API key not found. Please set the AZURE_OPENAI_API_KEY environment variable.")
     return api_key
 
-async def generate_streaming_audio(voice_name, text, instructions):
-    """Generate audio chunks from OpenAI gpt-audio model via chat completions"""
-    try:
-        # Combine text and instructions for the audio generation
-        full_prompt = f"{instructions}\n\nText to speak: {text}" if instructions else text
-        
-        response = await azure.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
-            messages=[
-                {
-                    "role": "user", 
-                    "content": full_prompt
-                }
-            ],
-            modalities=["text", "audio"],
-            audio={
-                "voice": voice_name,
-                "format": "mp3"
-            },
-            stream=True
-        )
-        
-        async for chunk in response:
-            if hasattr(chunk, 'choices') and chunk.choices:
-                choice = chunk.choices[0]
-                if hasattr(choice, 'delta') and hasattr(choice.delta, 'audio') and choice.delta.audio:
-                    if hasattr(choice.delta.audio, 'data') and choice.delta.audio.data:
-                        # Decode base64 audio data
-                        import base64
-                        audio_bytes = base64.b64decode(choice.delta.audio.data)
-                        yield audio_bytes
-    except Exception as e:
-        # Fallback to traditional TTS if gpt-audio doesn't work as expected
-        print(f"Trying fallback TTS approach: {e}")
-        async with azure.audio.speech.with_streaming_response.create(
+async def generate_streaming_audio(voice_name, text, instructions, result=None):
+    """Generate audio chunks from OpenAI gpt-audio model via chat completions
+
+    If an AudioResult is passed, it is filled with the transcript, chunk
+    timings, model and usage as the stream is consumed. With pcm16 output and
+    a local engine, the clip is spoken offline instead when every endpoint is
+    ejected, or when Azure fails before any audio was sent.
+    """
+    if result is None:
+        result = AudioResult()
+    if LOCAL_STREAMING and not endpoint_pool.any_healthy:
+        print("All endpoints are ejected, using the local voice")
+    else:
+        try:
+            async for audio_bytes in generate_upstream_streaming_audio(voice_name, text, instructions, result):
+                yield audio_bytes
+            return
+        except Exception as e:
+            # Once audio has been played, the local voice would start over
+            if not LOCAL_STREAMING or result.size:
+                raise
+            print(f"Azure audio failed, using the local voice: {e}")
+        finally:
+            # Stopped or failed streams count for what they delivered
+            if result.size or result.usage:
+                record_usage(result, text)
+    local = await synthesize_locally(text, voice_name)
+    result.model, result.fallback, result.usage, result.format = local.model, True, None, local.format
+    result.add_chunk(local.audio, "" if result.transcript else text)
+    yield bytes(local.audio)
+
+async def generate_upstream_streaming_audio(voice_name, text, instructions, result):
+    """gpt-audio, retried on another endpoint, then tts-1"""
+    result.voice, result.format = voice_name, AUDIO_FORMAT
+    # Combine text and instructions for the audio generation
+    full_prompt = f"{instructions}\n\nText to speak: {text}" if instructions else text
+    error = None
+    for attempt in range(GPT_AUDIO_ATTEMPTS):
+        yielded = False
+        try:
+            async with endpoint_pool.alease(ENDPOINT_WAIT_SECONDS) as endpoint:
+                response = await endpoint.async_client().chat.completions.create(
+                    model=endpoint.deployment,
+                    messages=[
+                        {
+                            "role": "user", 
+                            "content": full_prompt
+                        }
+                    ],
+                    modalities=["text", "audio"],
+                    audio={
+                        "voice": voice_name,
+                        "format": AUDIO_FORMAT
+                    },
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                
+                chunks = iter_audio_deltas(response, result, on_audio=endpoint.record_ttfb)
+                if AUDIO_POSTPROCESS and AUDIO_FORMAT == "pcm16":
+                    chunks = audio_processing.aprocess_stream(
+                        chunks, on_trim=lambda trimmed: setattr(result, "lead_trim", trimmed))
+                async for audio_bytes in chunks:
+                    yielded = True
+                    yield audio_bytes
+                if not yielded:
+                    # Like request_audio: retry, then fall back to tts-1
+                    raise Exception("No audio data found in response")
+                return
+        except NoEndpointAvailable:
+            # Waited long enough already; tts-1 would queue for the same endpoints
+            raise
+        except Exception as e:
+            error = e
+            print(f"gpt-audio stream failed (attempt {attempt + 1}/{GPT_AUDIO_ATTEMPTS}): {e}")
+            # Once audio has been played, retrying or falling back to tts-1
+            # would repeat it: the caller gets the error with a partial clip
+            if yielded:
+                raise
+
+    # Fallback to traditional TTS if gpt-audio doesn't work as expected
+    print(f"Trying fallback TTS approach: {error}")
+    result.model, result.fallback, result.usage = "tts-1", True, None
+    async with endpoint_pool.alease(ENDPOINT_WAIT_SECONDS) as endpoint:
+        async with endpoint.async_client().audio.speech.with_streaming_response.create(
             model="tts-1",  # fallback model
             voice=voice_name,
             input=text,
-            response_format="mp3"
+            response_format="pcm" if AUDIO_FORMAT == "pcm16" else "mp3"
         ) as response:
             async for chunk in response.iter_bytes():
+                endpoint.record_ttfb()
+                # tts-1 speaks the input verbatim, so the script is the transcript
+                result.add_chunk(chunk, "" if result.transcript else text)
                 yield chunk
 
-async def generate_audio_file(input, output_path, voice_name="coral", instructions=None):
-    """Generate audio file from OpenAI gpt-audio model and save to the given path"""
-    try:
-        # Combine text and instructions for the audio generation
-        full_prompt = f"{instructions}\n\nText to speak: {input}" if instructions else input
-        
-        response = await azure.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
-            messages=[
-                {
-                    "role": "user", 
-                    "content": full_prompt
-                }
-            ],
-            modalities=["text", "audio"],
-            audio={
-                "voice": voice_name,
-                "format": "mp3"
-            }
-        )
-        
-        # Extract audio data from response
-        if hasattr(response, 'choices') and response.choices:
-            choice = response.choices[0]
-            if hasattr(choice, 'message') and hasattr(choice.message, 'audio') and choice.message.audio:
-                if hasattr(choice.message.audio, 'data') and choice.message.audio.data:
-                    import base64
-                    audio_bytes = base64.b64decode(choice.message.audio.data)
-                    with open(output_path, 'wb') as f:
-                        f.write(audio_bytes)
-                    return
-        
-        raise Exception("No audio data found in response")
-        
-    except Exception as e:
-        # Fallback to traditional TTS if gpt-audio doesn't work as expected
-        print(f"Trying fallback TTS approach: {e}")
-        async with azure.audio.speech.with_streaming_response.create(
+async def iter_audio_deltas(response, result, on_audio=None):
+    """Yield decoded audio bytes from a streaming chat completion"""
+    async for chunk in response:
+        audio_bytes = apply_stream_chunk(result, chunk)
+        if audio_bytes:
+            if on_audio is not None:
+                on_audio()
+            yield audio_bytes
+
+def record_usage(result, text):
+    """Count a response against its session's and the global usage"""
+    model = result.model or "gpt-audio"
+    usage_ledger.record(model, result.usage, characters=len(text), audio_seconds=audio_seconds(result),
+                        wall_seconds=time.perf_counter() - result.started_at,
+                        billable=not model.startswith("local:"))
+
+def write_audio_file(audio_bytes, output_path, audio_format=None):
+    """Write generated audio to disk, wrapping raw PCM in a WAV container
+
+    Returns the bytes of leading silence post-processing cut, to be stored as
+    the result's lead_trim so its captions line up with the file.
+    """
+    lead_trim = 0
+    if (audio_format or AUDIO_FORMAT) == "pcm16":
+        if AUDIO_POSTPROCESS:
+            lead_trim = audio_processing.leading_trim_bytes(audio_bytes)
+            audio_bytes = audio_processing.postprocess_pcm16(audio_bytes)
+        with wave.open(output_path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(audio_processing.SAMPLE_WIDTH)
+            f.setframerate(audio_processing.SAMPLE_RATE)
+            f.writeframes(audio_bytes)
+    else:
+        with open(output_path, 'wb') as f:
+            f.write(audio_bytes)
+    return lead_trim
+
+async def stream_audio_to_file(input, output_path, voice_name="coral", instructions=None):
+    """Stream audio deltas to output_path as they arrive, in constant memory
+
+    The file is written under a temporary name and renamed on completion.
+    Returns an AudioResult with metadata only (keep_audio=False).
+    """
+    result = AudioResult(keep_audio=False)
+    with AtomicAudioWriter(output_path, AUDIO_FORMAT, fsync=AUDIO_FILE_FSYNC) as writer:
+        async for audio_bytes in generate_streaming_audio(voice_name, input, instructions, result):
+            writer.write(audio_bytes)
+    print(f"Streamed {writer.bytes_written} bytes to {output_path} ({writer.bytes_per_second / 1024:.0f} KiB/s)")
+    return result
+
+async def request_audio(input, voice_name="coral", instructions=None):
+    """Request a complete clip from gpt-audio (falling back to tts-1) as an AudioResult"""
+    started_at = time.perf_counter()
+    # Combine text and instructions for the audio generation
+    full_prompt = f"{instructions}\n\nText to speak: {input}" if instructions else input
+    error = None
+    for attempt in range(GPT_AUDIO_ATTEMPTS):
+        try:
+            async with endpoint_pool.alease(ENDPOINT_WAIT_SECONDS, stream=False) as endpoint:
+                response = await endpoint.async_client().chat.completions.create(
+                    model=endpoint.deployment,
+                    messages=[
+                        {
+                            "role": "user", 
+                            "content": full_prompt
+                        }
+                    ],
+                    modalities=["text", "audio"],
+                    audio={
+                        "voice": voice_name,
+                        "format": AUDIO_FORMAT
+                    }
+                )
+                endpoint.record_completion()
+                
+                # Extract audio data from response
+                result = result_from_completion(response, voice_name, AUDIO_FORMAT, started_at)
+                if result is None:
+                    raise Exception("No audio data found in response")
+                record_usage(result, input)
+                return result
+        except NoEndpointAvailable:
+            raise
+        except Exception as e:
+            error = e
+            print(f"gpt-audio request failed (attempt {attempt + 1}/{GPT_AUDIO_ATTEMPTS}): {e}")
+
+    # Fallback to traditional TTS if gpt-audio doesn't work as expected
+    print(f"Trying fallback TTS approach: {error}")
+    result = AudioResult(voice=voice_name, model="tts-1", fallback=True,
+                         format=AUDIO_FORMAT, started_at=started_at)
+    async with endpoint_pool.alease(ENDPOINT_WAIT_SECONDS) as endpoint:
+        async with endpoint.async_client().audio.speech.with_streaming_response.create(
             model="tts-1",  # fallback model
             voice=voice_name,
             input=input,
-            response_format="mp3",
+            # Raw PCM so the fallback is handled exactly like gpt-audio pcm16
+            response_format="pcm" if AUDIO_FORMAT == "pcm16" else "mp3",
         ) as response:
-            await response.stream_to_file(output_path)
-
-def stream_audio(voice_name, text, instructions):
-    """Stream audio chunks from OpenAI TTS to the Gradio Audio component"""
-    def generate():
-        """Generator function that yields audio chunks as they're received"""
-        # We need to accumulate bytes for proper MP3 playback
-        audio_bytes = b""
-        
-        # Run the async function and collect audio chunks
-        for chunk in asyncio.run(generate_streaming_audio(voice_name, text, instructions)):
-            # Add the new chunk to our accumulated audio
-            audio_bytes += chunk
-            # Yield the accumulated audio so far
-            yield audio_bytes
-    
-    # Return the generator function itself
-    return generate
-
+            async for chunk in response.iter_bytes():
+                endpoint.record_ttfb()
+                result.add_chunk(chunk)
+    result.transcript = input
+    # tts-1 reports no usage: the ledger charges it an estimate by the character
+    record_usage(result, input)
+    return result
+
+async def synthesize_locally(input, voice_name="coral"):
+    """Speak input with the offline engine; returns a pcm16 AudioResult"""
+    result = AudioResult(voice=voice_name, model=f"local:{local_synthesizer.name}", fallback=True, format="pcm16")
+    # The engines run as subprocesses: keep the event loop free meanwhile
+    audio = await asyncio.to_thread(local_synthesizer.synthesize, input, voice_name)
+    result.add_chunk(audio, input)
+    record_usage(result, input)
+    return result
+
+def audio_file_path(result, output_path):
+    """Where generate_audio_file wrote result: local audio is always WAV"""
+    if result.format == "pcm16":
+        return os.path.splitext(output_path)[0] + ".wav"
+    return output_path
+
+async def generate_local_audio_file(input, output_path, voice_name="coral"):
+    result = await synthesize_locally(input, voice_name)
+    result.lead_trim = write_audio_file(result.audio, audio_file_path(result, output_path), result.format)
+    return result
 
+async def generate_audio_file(input, output_path, voice_name="coral", instructions=None):
+    """Generate audio file from OpenAI gpt-audio model and save to the given path
+
+    Returns an AudioResult with the audio, transcript, model and usage.
+    With a local engine, the clip is synthesized offline when Azure cannot
+    serve it: every endpoint ejected, no free endpoint within
+    LOCAL_TTS_MAX_WAIT_SECONDS, or gpt-audio and tts-1 both failing. That
+    clip is WAV even for mp3 output; audio_file_path() gives its path.
+    """
+    if local_synthesizer is not None and not endpoint_pool.any_healthy:
+        print("All endpoints are ejected, using the local voice")
+        return await generate_local_audio_file(input, output_path, voice_name)
+    try:
+        return await generate_upstream_audio_file(input, output_path, voice_name, instructions)
+    except Exception as e:
+        if local_synthesizer is None:
+            raise
+        print(f"Azure audio failed, using the local voice: {e}")
+        return await generate_local_audio_file(input, output_path, voice_name)
+
+def budget_plan(script, voice_name, instructions):
+    """Fit the script to what is left of the caller's usage budget
+
+    Sentences already in the segment cache cost nothing. Raises gr.Error
+    when nothing fits and there is no local voice to fall back to.
+    """
+    is_cached = None
+    if segment_cache is not None:
+        def is_cached(sentence):
+            return segment_key(voice_name, instructions, sentence, AUDIO_FORMAT) in segment_cache
+    # Segmented renders send every uncached sentence as its own request
+    plan = usage_ledger.plan(script, is_cached=is_cached, segmented=SEGMENT_CACHE)
+    if plan.action == "shorter":
+        gr.Warning(f"Usage budget: playing the first {plan.kept} of {plan.sentences} sentences")
+    elif plan.action == "exhausted":
+        if local_synthesizer is None:
+            raise gr.Error(f"Usage budget reached, please try again in {plan.retry_after:.0f}s")
+        gr.Warning("Usage budget reached: using the local voice")
+    return plan
+
+async def generate_planned_audio_file(plan, input, output_path, voice_name="coral", instructions=None):
+    """generate_audio_file for a budget plan: the local voice once the budget is spent"""
+    if plan.action == "exhausted":
+        return await generate_local_audio_file(input, output_path, voice_name)
+    return await generate_audio_file(plan.text, output_path, voice_name, instructions)
+
+def usage_report() -> dict:
+    """Usage accounting for capacity planning (also served as the /usage API)"""
+    return usage_ledger.report()
+
+def delivery_report() -> dict:
+    """Clip delivery counters: responses by status, bytes sent per variant, transcodes"""
+    return clip_store.report() if clip_store is not None else {}
+
+async def generate_upstream_audio_file(input, output_path, voice_name="coral", instructions=None):
+    if SEGMENT_CACHE:
+        return await generate_segmented_audio_file(input, output_path, voice_name, instructions)
+    if STREAM_TO_FILE:
+        return await stream_audio_to_file(input, output_path, voice_name, instructions)
+    result = await request_audio(input, voice_name, instructions)
+    result.lead_trim = write_audio_file(result.audio, output_path)
+    return result
+
+async def generate_segmented_audio_file(input, output_path, voice_name="coral", instructions=None):
+    """Build the clip sentence by sentence, reusing cached segments
+
+    Only sentences missing from the segment cache are synthesized, and those
+    run concurrently; the segments are then joined into one file.
+    """
+    result, stats = await synthesize_segments(
+        input, voice_name, instructions or "",
+        render=request_audio,
+        cache=segment_cache,
+        audio_format=AUDIO_FORMAT,
+        concurrency=SEGMENT_CONCURRENCY,
+    )
+    print(f"Segment cache: {stats}")
+    result.lead_trim = write_audio_file(result.audio, output_path)
+    return result
+
+def speculation_key(voice_name, vibe_desc, vibe_script):
+    """Key identifying a render: what toggle_play_stop would send to the model"""
+    description = vibe_desc if vibe_desc and vibe_desc.strip() else "Custom content"
+    return (voice_name or current_voice).strip().lower(), description, vibe_script
+
+async def render_speculatively(key):
+    """Render a (voice, description, script) key to a temp file in the background"""
+    voice_name, description, script = key
+    output_path = os.path.join(temp_dir, f"speculative_{voice_name}_{time.time_ns()}.{AUDIO_FILE_EXT}")
+    result = await generate_audio_file(script, output_path, voice_name, description)
+    return audio_file_path(result, output_path), result
+
+def discard_speculative_render(rendered):
+    output_path, _ = rendered
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+speculator = SpeculativeRenderer(
+    render_speculatively,
+    discard=discard_speculative_render,
+    max_per_session=SPECULATIVE_MAX_PER_SESSION,
+    ttl=SPECULATIVE_TTL_SECONDS,
+) if SPECULATIVE_RENDER else None
+
+def speculate(voice_name, vibe_desc, vibe_script, request):
+    """Start a speculative render for the current selection, if enabled"""
+    if speculator is None or request is None:
+        return
+    current_session.set(request.session_hash)
+    if not vibe_script or not vibe_script.strip() or voice_name not in VOICES:
+        speculator.cancel(request.session_hash)
+        return
+    # Only speculate with budget to spare: the render may never be played
+    if usage_ledger.enabled and usage_ledger.remaining()["total_tokens"] < usage_ledger.estimate_tokens(len(vibe_script)):
+        speculator.cancel(request.session_hash)
+        return
+    speculator.start(request.session_hash, speculation_key(voice_name, vibe_desc, vibe_script))
+
+def request_profiler(request, label):
+    """Profiler context for a UI request; a no-op unless profiling was asked for"""
+    return profile_request(request, label, enabled=PROFILE_REQUESTS, interval=PROFILE_INTERVAL_MS / 1000,
+                           directory=PROFILE_DIR, output_format=PROFILE_FORMAT)
+
+def prune_temp_dir(keep=None):
+    """Delete all but the newest `keep` files from temp_dir"""
+    keep = TEMP_AUDIO_MAX_FILES if keep is None else keep
+    entries = []
+    for entry in os.scandir(temp_dir):
+        try:
+            entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            pass
+    for _, path in sorted(entries, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def deliver_audio(path, request=None):
+    """Values for the audio outputs: the clip at path, or None to clear them
+
+    Without AUDIO_DELIVERY that is just the file for gr.Audio. With it, the
+    clip goes into the clip store and plays from /audio in an HTML player,
+    its Opus variant first for clients that prefer small responses.
+    """
+    if clip_store is None:
+        return (path,)
+    if path is None:
+        return None, ""
+    clip_id = clip_store.add(path)
+    variants = [variant for variant in clip_store.variants if clip_store.has_variant(clip_id, variant)]
+    media_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "audio/mpeg")
+    return None, player_html(clip_id, getattr(request, "headers", None), variants=variants, media_type=media_type)
+
+def skip_audio():
+    """deliver_audio() counterpart for updates that leave the audio outputs alone"""
+    return (gr.skip(),) * (2 if clip_store is not None else 1)
+
+def run_async(coro):
+    """asyncio.run() for the sync handlers
+
+    Every call gets a fresh event loop, so the async clients created on it
+    are closed before it goes away; left open, their connections (and the
+    sockets behind them) would accumulate with every click.
+    """
+    async def run():
+        try:
+            return await coro
+        finally:
+            await endpoint_pool.aclose_clients()
+    return asyncio.run(run())
+
+def iter_async_generator(agen):
+    """Drive an async generator from sync code on a private event loop
+
+    Each step runs in the context this was started from, so context
+    variables (the usage session) survive Gradio resuming the caller on
+    another thread.
+    """
+    loop = asyncio.new_event_loop()
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                yield context.run(loop.run_until_complete, agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        context.run(loop.run_until_complete, agen.aclose())
+        loop.run_until_complete(endpoint_pool.aclose_clients())
+        loop.close()
+
+def stream_audio(voice_name, text, instructions, result=None, coalescer=None):
+    """Stream audio from gpt-audio to the Gradio Audio component
+
+    Small deltas are coalesced into fewer, larger updates: the first chunk
+    is sent immediately, later ones are batched by target duration/size.
+    """
+    if coalescer is None:
+        coalescer = AdaptiveCoalescer(
+            audio_format=AUDIO_FORMAT,
+            min_seconds=STREAM_MIN_BATCH_SECONDS,
+            max_seconds=STREAM_MAX_BATCH_SECONDS,
+            max_bytes=STREAM_MAX_BATCH_BYTES,
+        )
+    batches = acoalesce(generate_streaming_audio(voice_name, text, instructions, result), coalescer)
+    for batch in iter_async_generator(batches):
+        if AUDIO_FORMAT == "pcm16":
+            # Raw PCM has no container, so hand Gradio the samples directly
+            yield audio_processing.SAMPLE_RATE, np.frombuffer(batch, dtype="<i2")
+        else:
+            yield batch
+    print(f"Streaming stats: {coalescer.stats()}")
 
 def stop_audio():
     global is_playing
@@ -294,85 +727,58 @@ body, html, .gradio-app {
     box-shadow: 0 12px 24px rgba(0, 0, 0, 0.2) !important;
 }
 
-.voice-button {
-    min-height: 80px !important;
-    display: flex !important;
-    align-items: center !important;
+/* Voice selector (radio rendered as buttons) */
+.voice-selector {
+    background: transparent !important;
+    border: none !important;
+}
+
+.voice-selector .wrap {
+    display: grid !important;
+    grid-template-columns: repeat(auto-fit, minmax(140px, 1fr)) !important;
+    gap: 1rem !important;
+}
+
+.voice-selector label {
+    min-height: 64px !important;
     justify-content: center !important;
-    position: relative !important;
     border-radius: 1rem !important;
-    transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1) !important;
-    padding: 1.2rem !important;
     border: 2px solid #475569 !important;
     background: linear-gradient(135deg, #1e293b, #334155) !important;
     box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3) !important;
+    transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1) !important;
+    color: #f1f5f9 !important;
+    font-weight: 700 !important;
     cursor: pointer !important;
-    font-size: 1.1rem !important;
-    font-weight: 600 !important;
 }
 
-.voice-button:hover {
+.voice-selector label:hover {
     transform: translateY(-3px) scale(1.02) !important;
-    box-shadow: 0 12px 24px rgba(59, 130, 246, 0.4) !important;
     border-color: #3b82f6 !important;
     background: linear-gradient(135deg, #1e40af, #3b82f6) !important;
 }
 
-.voice-button[data-variant="primary"] {
+.voice-selector label.selected {
     background: linear-gradient(135deg, #dc2626, #ef4444) !important;
     border-color: #dc2626 !important;
     color: #ffffff !important;
     box-shadow: 0 8px 20px rgba(220, 38, 38, 0.4) !important;
 }
 
-.voice-button[data-variant="primary"]:hover {
-    background: linear-gradient(135deg, #b91c1c, #dc2626) !important;
-    transform: translateY(-4px) scale(1.03) !important;
-    box-shadow: 0 16px 32px rgba(220, 38, 38, 0.5) !important;
-}
-
-/* Voice button text - High contrast */
-.voice-button span,
-.voice-button > div > span,
-button.voice-button span,
-button.voice-button > div > span {
-    font-size: 1.1rem !important;
-    font-weight: 700 !important;
-    margin: 0 !important;
-    padding: 0 !important;
-    color: #f1f5f9 !important;
-    text-transform: capitalize !important;
-    display: block !important;
-    visibility: visible !important;
-    text-shadow: 0 2px 4px rgba(0, 0, 0, 0.3) !important;
-    letter-spacing: 0.5px !important;
+.voice-selector input[type="radio"] {
+    display: none !important;
 }
 
-.voice-button[data-variant="primary"] span,
-.voice-button[data-variant="primary"] > div > span,
-button.voice-button[data-variant="primary"] span,
-button.voice-button[data-variant="primary"] > div > span {
-    color: #ffffff !important;
-    text-shadow: 0 2px 4px rgba(0, 0, 0, 0.5) !important;
+/* Vibe catalog: search box, one page of vibes as a radio, pager - Dark theme */
+.vibe-search {
+    gap: 1rem !important;
+    margin-top: 1rem !important;
 }
 
-.voice-button > div {
-    display: flex !important;
-    align-items: center !important;
-    justify-content: center !important;
-    width: 100% !important;
-    margin: 0 !important;
-    padding: 0 !important;
-}
-
-/* Vibe buttons layout - Dark theme */
-.vibe-buttons {
-    display: grid !important;
-    grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)) !important;
-    gap: 1.5rem !important;
+.vibe-selector {
     width: 100% !important;
     padding: 2rem !important;
-    margin: 2rem 0 !important;
+    margin: 1rem 0 !important;
     background: rgba(15, 23, 42, 0.8) !important;
     backdrop-filter: blur(10px) !important;
     border-radius: 1.5rem !important;
@@ -380,8 +786,15 @@ button.voice-button[data-variant="primary"] > div > span {
     box-shadow: 0 12px 24px rgba(0, 0, 0, 0.2) !important;
 }
 
-.vibe-buttons button {
+.vibe-selector .wrap {
+    display: grid !important;
+    grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)) !important;
+    gap: 1.5rem !important;
+}
+
+.vibe-selector label {
     min-height: 70px !important;
+    justify-content: center !important;
     border-radius: 1rem !important;
     border: 2px solid #475569 !important;
     background: linear-gradient(135deg, #1e293b, #334155) !important;
@@ -390,35 +803,38 @@ button.voice-button[data-variant="primary"] > div > span {
     color: #f1f5f9 !important;
     font-weight: 600 !important;
     font-size: 1rem !important;
-    cursor: pointer !important;
-}
-
-.vibe-buttons button span,
-.vibe-buttons button > div > span {
-    color: #f1f5f9 !important;
-    visibility: visible !important;
-    font-weight: 600 !important;
     text-shadow: 0 2px 4px rgba(0, 0, 0, 0.3) !important;
+    cursor: pointer !important;
 }
 
-.vibe-buttons button:hover {
+.vibe-selector label:hover {
     transform: translateY(-2px) scale(1.02) !important;
     box-shadow: 0 8px 20px rgba(34, 197, 94, 0.4) !important;
     border-color: #22c55e !important;
     background: linear-gradient(135deg, #15803d, #22c55e) !important;
 }
 
-.vibe-buttons button[data-variant="primary"] {
+.vibe-selector label.selected {
     background: linear-gradient(135deg, #7c3aed, #a855f7) !important;
     border-color: #7c3aed !important;
     color: #ffffff !important;
     box-shadow: 0 8px 20px rgba(124, 58, 237, 0.4) !important;
 }
 
-.vibe-buttons button[data-variant="primary"] span,
-.vibe-buttons button[data-variant="primary"] > div > span {
-    color: #ffffff !important;
-    text-shadow: 0 2px 4px rgba(0, 0, 0, 0.5) !important;
+.vibe-selector input[type="radio"] {
+    display: none !important;
+}
+
+.vibe-pager {
+    align-items: center !important;
+    justify-content: center !important;
+    gap: 1rem !important;
+    margin-bottom: 1rem !important;
+}
+
+.vibe-pager p {
+    text-align: center !important;
+    color: #cbd5e1 !important;
 }
 
 /* Random button styling - Dark theme */
@@ -567,12 +983,7 @@ button[data-variant="stop"]:hover, .gradio-button[data-variant="stop"]:hover {
         gap: 2rem !important;
     }
     
-    .voice-button {
-        min-height: 100px !important;
-        font-size: 1.2rem !important;
-    }
-    
-    .vibe-buttons {
+    .vibe-selector .wrap {
         grid-template-columns: repeat(5, 1fr) !important;
         gap: 2rem !important;
     }
@@ -583,7 +994,7 @@ button[data-variant="stop"]:hover, .gradio-button[data-variant="stop"]:hover {
         grid-template-columns: repeat(5, 1fr) !important;
     }
     
-    .vibe-buttons {
+    .vibe-selector .wrap {
         grid-template-columns: repeat(4, 1fr) !important;
     }
 }
@@ -593,7 +1004,7 @@ button[data-variant="stop"]:hover, .gradio-button[data-variant="stop"]:hover {
         grid-template-columns: repeat(4, 1fr) !important;
     }
     
-    .vibe-buttons {
+    .vibe-selector .wrap {
         grid-template-columns: repeat(3, 1fr) !important;
     }
 }
@@ -608,7 +1019,7 @@ button[data-variant="stop"]:hover, .gradio-button[data-variant="stop"]:hover {
         gap: 1rem !important;
     }
     
-    .vibe-buttons {
+    .vibe-selector .wrap {
         grid-template-columns: repeat(2, 1fr) !important;
         gap: 1rem !important;
     }
@@ -623,7 +1034,7 @@ button[data-variant="stop"]:hover, .gradio-button[data-variant="stop"]:hover {
         grid-template-columns: repeat(2, 1fr) !important;
     }
     
-    .vibe-buttons {
+    .vibe-selector .wrap {
         grid-template-columns: repeat(1, 1fr) !important;
     }
 }
@@ -656,79 +1067,92 @@ brand_theme = gr.themes.Soft(
         input_border_color_focus="#3b82f6"
 )
 
-def update_vibe_and_global(vibe, current_vibes):
+def update_vibe_and_global(vibe):
     """Update the selected vibe and global state"""
     global current_vibe
     current_vibe = vibe
-    desc, script = get_vibe_info(vibe)
-    updated_buttons, updated_state = update_selected_vibe(vibe, current_vibes)
-    return (desc, *updated_buttons, updated_state, script)
+    return get_vibe_info(vibe)
+
+# Define the use cases for GPT-5 Nano (including multilingual options)
+CONTENT_USE_CASES = [
+    {
+        "type": "kids_story",
+        "prompt": "Create a short, engaging children's story (2-3 paragraphs) with a clear moral lesson. Include friendly characters and simple language that would be perfect for text-to-speech. Make it warm and educational.",
+        "description": "🧸 Children's Story\n\nTone: Warm, enthusiastic, and child-friendly with varied pacing to keep young listeners engaged\n\nThis content was generated by GPT-5 Nano to showcase dynamic AI-powered storytelling."
+    },
+    {
+        "type": "financial_report", 
+        "prompt": "Generate a realistic quarterly financial report summary for a tech company. Include specific numbers, percentages, and business metrics. Make it sound professional and authoritative, suitable for investor presentation via text-to-speech.",
+        "description": "📊 Financial Report\n\nTone: Professional, confident, and authoritative with clear articulation of financial data and business insights\n\nThis content was generated by GPT-5 Nano to showcase dynamic business communication."
+    },
+    {
+        "type": "tech_podcast",
+        "prompt": "Create an engaging tech podcast segment about emerging technology trends. Make it conversational, informative, and enthusiastic. Include specific examples and make it sound like a real podcast host speaking naturally.",
+        "description": "🎧 Tech Podcast\n\nTone: Conversational yet knowledgeable, with enthusiasm for technology and a casual podcast style that's informative but engaging\n\nThis content was generated by GPT-5 Nano to showcase dynamic content creation."
+    },
+    {
+        "type": "insurance_talk_with_agent",
+        "prompt": "Create a friendly and informative conversation between an insurance agent and a potential client",
+        "description": "📞 Insurance Talk with Agent\n\nTone: Friendly, empathetic, and reassuring with a clear and professional communication style suitable for an insurance consultation\n\nThis content was generated by GPT-5 Nano to showcase dynamic customer service interactions."
+    },
+    {
+        "type": "french_news",
+        "prompt": "Créez un bulletin d'actualités français professionnel (2-3 paragraphes) couvrant des événements récents en France ou en Europe. Utilisez un langage clair, informatif et approprié pour une diffusion audio. Incluez des faits spécifiques et adoptez un ton journalistique neutre.",
+        "description": "🇫🇷 Actualités Françaises\n\nTone: Professionnel, informatif et neutre avec une articulation claire typique des journalistes français\n\nCe contenu a été généré par GPT-5 Nano pour démontrer la création de contenu dynamique en français."
+    },
+    {
+        "type": "spanish_cooking",
+        "prompt": "Crea una receta de cocina española tradicional (2-3 párrafos) con instrucciones claras y consejos culinarios. Hazlo cálido, apasionado y perfecto para ser narrado en audio. Incluye ingredientes específicos y técnicas de cocina tradicionales españolas.",
+        "description": "🇪🇸 Receta Española\n\nTono: Cálido, apasionado y acogedor con el entusiasmo típico de la cocina española tradicional\n\nEste contenido fue generado por GPT-5 Nano para mostrar la creación dinámica de contenido en español."
+    },
+    {
+        "type": "moroccan_story",
+        "prompt": "اكتب قصة مغربية قصيرة (2-3 فقرات) تتضمن تقاليد وثقافة مغربية أصيلة. استخدم لغة عربية واضحة ومناسبة للصوت، مع إشارات إلى المدن المغربية والتقاليد المحلية. اجعلها دافئة ومليئة بالحكمة.",
+        "description": "🇲🇦 حكاية مغربية\n\nالنبرة: دافئة وتقليدية مع الحكمة المغربية الأصيلة وإيقاع مناسب للاستماع\n\nتم إنشاء هذا المحتوى بواسطة GPT-5 Nano لإظهار إنشاء المحتوى الديناميكي باللغة العربية المغربية."
+    }
+]
+
+CONTENT_SYSTEM_PROMPT = "You are an expert multilingual content creator specializing in audio content. Generate engaging, well-structured content optimized for text-to-speech conversion in any language requested. Focus on clear, natural language that sounds great when spoken aloud. Maintain cultural authenticity and appropriate tone for each language and context."
+
+NANO_MODEL = os.getenv("AZURE_OPENAI_NANO_DEPLOYMENT_NAME", "gpt-5-nano")
+
+def generate_content_batch(use_cases):
+    """One gpt-5-nano request for a script per use case (see content_batch.py)"""
+    if not usage_ledger.can_spend(usage_ledger.average_tokens(NANO_MODEL, NANO_TOKENS_ESTIMATE * len(use_cases))):
+        raise ContentUnavailable("usage budget reached")
+    print(f"Generate {len(use_cases)} scripts using GPT-5 Nano via Azure OpenAI....")
+    result = generate_batch(azure, NANO_MODEL, use_cases, CONTENT_SYSTEM_PROMPT)
+    usage_ledger.record(NANO_MODEL, result.usage, wall_seconds=result.elapsed)
+    return result
+
+# Scripts are generated CONTENT_BATCH_SIZE at a time and handed out one per
+# click; 1 makes one request per click
+content_pool = ContentPool(generate_content_batch, CONTENT_USE_CASES, CONTENT_BATCH_SIZE) \
+    if CONTENT_BATCH_SIZE > 1 else None
 
 async def generate_random_content():
     """Generate random audio content using GPT-5 Nano with 3 different use cases"""
+    if content_pool is not None:
+        try:
+            return await asyncio.to_thread(content_pool.take)
+        except ContentUnavailable as e:
+            print(f"GPT-5 Nano not available, using fallback content: {e}")
+            return generate_fallback_content()
     try:
-        import random
-        
-        # Define the use cases for GPT-5 Nano (including multilingual options)
-        use_cases = [
-            {
-                "type": "kids_story",
-                "prompt": "Create a short, engaging children's story (2-3 paragraphs) with a clear moral lesson. Include friendly characters and simple language that would be perfect for text-to-speech. Make it warm and educational.",
-                "description": "🧸 Children's Story\n\nTone: Warm, enthusiastic, and child-friendly with varied pacing to keep young listeners engaged\n\nThis content was generated by GPT-5 Nano to showcase dynamic AI-powered storytelling."
-            },
-            {
-                "type": "financial_report", 
-                "prompt": "Generate a realistic quarterly financial report summary for a tech company. Include specific numbers, percentages, and business metrics. Make it sound professional and authoritative, suitable for investor presentation via text-to-speech.",
-                "description": "📊 Financial Report\n\nTone: Professional, confident, and authoritative with clear articulation of financial data and business insights\n\nThis content was generated by GPT-5 Nano to showcase dynamic business communication."
-            },
-            {
-                "type": "tech_podcast",
-                "prompt": "Create an engaging tech podcast segment about emerging technology trends. Make it conversational, informative, and enthusiastic. Include specific examples and make it sound like a real podcast host speaking naturally.",
-                "description": "🎧 Tech Podcast\n\nTone: Conversational yet knowledgeable, with enthusiasm for technology and a casual podcast style that's informative but engaging\n\nThis content was generated by GPT-5 Nano to showcase dynamic content creation."
-            },
-            {
-                "type": "insurance_talk_with_agent",
-                "prompt": "Create a friendly and informative conversation between an insurance agent and a potential client",
-                "description": "📞 Insurance Talk with Agent\n\nTone: Friendly, empathetic, and reassuring with a clear and professional communication style suitable for an insurance consultation\n\nThis content was generated by GPT-5 Nano to showcase dynamic customer service interactions."
-            },
-            {
-                "type": "french_news",
-                "prompt": "Créez un bulletin d'actualités français professionnel (2-3 paragraphes) couvrant des événements récents en France ou en Europe. Utilisez un langage clair, informatif et approprié pour une diffusion audio. Incluez des faits spécifiques et adoptez un ton journalistique neutre.",
-                "description": "🇫🇷 Actualités Françaises\n\nTone: Professionnel, informatif et neutre avec une articulation claire typique des journalistes français\n\nCe contenu a été généré par GPT-5 Nano pour démontrer la création de contenu dynamique en français."
-            },
-            {
-                "type": "spanish_cooking",
-                "prompt": "Crea una receta de cocina española tradicional (2-3 párrafos) con instrucciones claras y consejos culinarios. Hazlo cálido, apasionado y perfecto para ser narrado en audio. Incluye ingredientes específicos y técnicas de cocina tradicionales españolas.",
-                "description": "🇪🇸 Receta Española\n\nTono: Cálido, apasionado y acogedor con el entusiasmo típico de la cocina española tradicional\n\nEste contenido fue generado por GPT-5 Nano para mostrar la creación dinámica de contenido en español."
-            },
-            {
-                "type": "moroccan_story",
-                "prompt": "اكتب قصة مغربية قصيرة (2-3 فقرات) تتضمن تقاليد وثقافة مغربية أصيلة. استخدم لغة عربية واضحة ومناسبة للصوت، مع إشارات إلى المدن المغربية والتقاليد المحلية. اجعلها دافئة ومليئة بالحكمة.",
-                "description": "🇲🇦 حكاية مغربية\n\nالنبرة: دافئة وتقليدية مع الحكمة المغربية الأصيلة وإيقاع مناسب للاستماع\n\nتم إنشاء هذا المحتوى بواسطة GPT-5 Nano لإظهار إنشاء المحتوى الديناميكي باللغة العربية المغربية."
-            }
-        ]
-        
         # Randomly select one of the available use cases
-        selected_use_case = random.choice(use_cases)
+        selected_use_case = random.choice(CONTENT_USE_CASES)
         
+        if not usage_ledger.can_spend(usage_ledger.average_tokens(NANO_MODEL, NANO_TOKENS_ESTIMATE)):
+            print("Usage budget reached, using fallback content")
+            return generate_fallback_content()
+
         print ("Generate content using GPT-5 Nano via Azure OpenAI....")
-        response = azure.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_NANO_DEPLOYMENT_NAME", "gpt-5-nano"),
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert multilingual content creator specializing in audio content. Generate engaging, well-structured content optimized for text-to-speech conversion in any language requested. Focus on clear, natural language that sounds great when spoken aloud. Maintain cultural authenticity and appropriate tone for each language and context."
-                },
-                {
-                    "role": "user", 
-                    "content": selected_use_case["prompt"]
-                }
-            ]
-        )
-        
-        generated_content = response.choices[0].message.content.strip()
+        result = generate_single(azure, NANO_MODEL, selected_use_case, CONTENT_SYSTEM_PROMPT)
+        usage_ledger.record(NANO_MODEL, result.usage, wall_seconds=result.elapsed)
+        if not result.scripts:
+            raise Exception(result.failed[0][1])
         
-        return selected_use_case["description"], generated_content
+        return selected_use_case["description"], result.scripts[0][1]
         
     except Exception as e:
         # Fallback to static content if GPT-5 Nano is not available
@@ -764,7 +1188,9 @@ def generate_fallback_content():
 with gr.Blocks(
     css=css,
     theme=brand_theme,
-    title="Azure OpenAI GPT-Audio TTS Soundboard"
+    title="Azure OpenAI GPT-Audio TTS Soundboard",
+    # Hourly, drop files older than a day from Gradio's own upload/output cache
+    delete_cache=(3600, 86400),
 ) as demo:
     with gr.Row():
         gr.HTML(
@@ -777,64 +1203,47 @@ with gr.Blocks(
         )
     
     # Voice Selection Section
-    with gr.Row():
-        with gr.Column():
-            voice_label = gr.Label("Current Voice: Alloy", show_label=False, container=False)
-    
-    # Voice Buttons
+    # A single radio generated from VOICES: selecting a voice is handled in the
+    # browser and only the chosen value is sent with the generate request.
     with gr.Row(elem_classes="voice-buttons"):
-        alloy = gr.Button("Alloy", variant="primary", elem_classes="voice-button")
-        ash = gr.Button("Ash", variant="secondary", icon="assets/ic_fluent_sound_wave_circle_sparkle_24_regular.svg", elem_classes="voice-button")
-        ballad = gr.Button("Ballad", variant="secondary", icon="assets/ic_fluent_sound_wave_circle_sparkle_24_regular.svg", elem_classes="voice-button")
-        coral = gr.Button("Coral", variant="secondary", icon="assets/ic_fluent_sound_wave_circle_sparkle_24_regular.svg", elem_classes="voice-button")
-        echo = gr.Button("Echo", variant="secondary", elem_classes="voice-button")
-        fable = gr.Button("Fable", variant="secondary", elem_classes="voice-button")
-        nova = gr.Button("Nova", variant="secondary", elem_classes="voice-button")
-        onyx = gr.Button("Onyx", variant="secondary", elem_classes="voice-button")
-        sage = gr.Button("Sage", variant="secondary", icon="assets/ic_fluent_sound_wave_circle_sparkle_24_regular.svg", elem_classes="voice-button")
-        shimmer = gr.Button("Shimmer", variant="secondary", elem_classes="voice-button")
-        verse = gr.Button("Verse", variant="secondary", icon="assets/ic_fluent_sound_wave_circle_sparkle_24_regular.svg", elem_classes="voice-button")
+        voice_selector = gr.Radio(
+            choices=[(voice.title(), voice) for voice in VOICES],
+            value=current_voice,
+            label="Current Voice",
+            elem_classes="voice-selector",
+            scale=5,
+        )
         random_btn = gr.Button("🎲 Random Voice", variant="primary", elem_classes="random-button")
 
-    def update_button_and_reset(selected_voice):
-        global current_voice
-        current_voice = selected_voice.lower()
-        buttons = reset_buttons()
-        buttons["Alloy Ash Ballad Coral Echo Fable Nova Onyx Sage Shimmer Verse".split().index(selected_voice)] = gr.Button(variant="primary")
-        return f"Current Voice: {selected_voice}", *buttons
-
-    def update_random_button_enhanced():
-        buttons = reset_buttons()
-        random_index = random.randint(0, 10)  # Randomly select one button index
-        buttons[random_index] = gr.Button(variant="primary")
-        selected_voice = "Alloy Ash Ballad Coral Echo Fable Nova Onyx Sage Shimmer Verse".split()[random_index]
-        global current_voice
-        current_voice = selected_voice.lower()
-        return f"Current Voice: {selected_voice}", *buttons
-
-    # Voice button event handlers
-    alloy.click(lambda: update_button_and_reset("Alloy"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    ash.click(lambda: update_button_and_reset("Ash"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    ballad.click(lambda: update_button_and_reset("Ballad"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    coral.click(lambda: update_button_and_reset("Coral"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    echo.click(lambda: update_button_and_reset("Echo"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    fable.click(lambda: update_button_and_reset("Fable"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    nova.click(lambda: update_button_and_reset("Nova"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    onyx.click(lambda: update_button_and_reset("Onyx"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    sage.click(lambda: update_button_and_reset("Sage"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    shimmer.click(lambda: update_button_and_reset("Shimmer"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-    verse.click(lambda: update_button_and_reset("Verse"), outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
-
-    random_btn.click(update_random_button_enhanced, outputs=[voice_label, alloy, ash, ballad, coral, echo, fable, nova, onyx, sage, shimmer, verse])
+    # Client-side only: no server round trip to pick a random voice
+    random_btn.click(
+        None,
+        outputs=[voice_selector],
+        js=f"() => {{ const voices = {json.dumps(VOICES)}; return voices[Math.floor(Math.random() * voices.length)]; }}",
+    )
     
     # Content Generation Section
     with gr.Row():
         with gr.Column():
             gr.Label("Vibe", container=False)
-            with gr.Row(elem_classes="vibe-buttons"):
-                all_vibes = load_vibes()
-                vibe_buttons, visible_vibes = update_vibe_buttons(all_vibes)
-                visible_vibes_state = gr.State(value=visible_vibes)
+            # Only the visible page of the catalog is sent to the browser, so
+            # searching, paging and shuffling cost the same with 30 or 30,000 vibes
+            with gr.Row(elem_classes="vibe-search"):
+                vibe_query = gr.Textbox(placeholder="Search vibes by name, description or script...",
+                                        show_label=False, container=False, scale=4)
+                vibe_field = gr.Dropdown(
+                    choices=[("All fields", "all"), ("Name", "name"), ("Description", "description"), ("Script", "script")],
+                    value="all", show_label=False, container=False, scale=1,
+                )
+            initial_page = vibe_catalog.sample()
+            vibe_selector = gr.Radio(choices=initial_page.names, value=None, show_label=False,
+                                     container=False, elem_classes="vibe-selector")
+            vibe_page_state = gr.State(value=(initial_page.page, initial_page.seed))
+            with gr.Row(elem_classes="vibe-pager"):
+                previous_btn = gr.Button("◀", size="sm", scale=0, min_width=48)
+                vibe_caption = gr.Markdown(vibe_page_caption(initial_page))
+                next_btn = gr.Button("▶", size="sm", scale=0, min_width=48)
+            with gr.Row():
                 shuffle_btn = gr.Button("Shuffle", variant="huggingface", visible=True)
                 generate_content_btn = gr.Button("🤖 Generate Random Content (GPT-5 Nano)", variant="secondary", elem_classes="random-button", visible=True)
             vibe_desc = gr.Textbox(show_label=False, container=False, lines=8, max_lines=20)
@@ -842,23 +1251,53 @@ with gr.Blocks(
         with gr.Column():
             gr.Label("Script", container=False)
             vibe_script = gr.Textbox(show_label=False, container=False, lines=8, max_lines=20)
-            audio_output = gr.Audio(autoplay=True, streaming=True)
+            audio_output = gr.Audio(autoplay=True, streaming=True, visible=not AUDIO_DELIVERY)
+            # With AUDIO_DELIVERY, finished clips play here from /audio instead
+            clip_player = gr.HTML(visible=AUDIO_DELIVERY)
+            # The local-voice preview plays here until the final render replaces it
+            preview_output = gr.Audio(label="Preview (local voice)", autoplay=True, visible=False)
+            transcript_box = gr.Textbox(label="Transcript", lines=4, max_lines=12, interactive=False)
             play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=True)
             stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=False)
 
-        for vibe_button in vibe_buttons:
-            vibe_button.click(
-                lambda vibe, current_vibes: update_vibe_and_global(vibe, current_vibes),
-                inputs=[vibe_button, visible_vibes_state],
-                outputs=[vibe_desc, *vibe_buttons, visible_vibes_state, vibe_script]
+        def select_vibe(vibe, voice, request: gr.Request):
+            desc, script = update_vibe_and_global(vibe)
+            speculate(voice, desc, script, request)
+            return desc, script
+
+        # input (not change) so that swapping the page's choices does not select anything
+        vibe_selector.input(
+            select_vibe,
+            inputs=[vibe_selector, voice_selector],
+            outputs=[vibe_desc, vibe_script]
+        )
+
+        page_outputs = [vibe_selector, vibe_caption, vibe_page_state]
+        vibe_query.change(browse_vibes, inputs=[vibe_query, vibe_field], outputs=page_outputs,
+                          trigger_mode="always_last", show_progress="hidden")
+        vibe_field.change(browse_vibes, inputs=[vibe_query, vibe_field], outputs=page_outputs,
+                          show_progress="hidden")
+        previous_btn.click(previous_vibes, inputs=[vibe_query, vibe_field, vibe_page_state],
+                           outputs=page_outputs, show_progress="hidden")
+        next_btn.click(next_vibes, inputs=[vibe_query, vibe_field, vibe_page_state],
+                       outputs=page_outputs, show_progress="hidden")
+
+        if SPECULATIVE_RENDER:
+            # Only needed for speculation; otherwise voice changes stay client-side
+            voice_selector.change(
+                speculate,
+                inputs=[voice_selector, vibe_desc, vibe_script],
+                outputs=None,
             )
             
         shuffle_btn.click(shuffle_vibes,
-            outputs=[*vibe_buttons, visible_vibes_state]
+            inputs=[vibe_query, vibe_field],
+            outputs=page_outputs
         )
         
         # Generate random content button handler
-        async def handle_generate_content():
+        async def handle_generate_content(request: gr.Request = None):
+            current_session.set(request.session_hash if request is not None else None)
             try:
                 return await generate_random_content()
             except Exception as e:
@@ -869,47 +1308,133 @@ with gr.Blocks(
             outputs=[vibe_desc, vibe_script]
         )
 
-    def toggle_play_stop(voice_name, vibe_desc, vibe_script):
+    def resolve_generation_inputs(voice_name, vibe_desc, vibe_script):
+        """Validate the UI inputs and return (voice, instructions, vibe name)"""
+        check_api_key()
+        
+        voice_to_use = (voice_name or current_voice).strip().lower()
+        if voice_to_use not in VOICES:
+            raise ValueError("Invalid voice name. Please select a valid voice.")
+        
+        # Check if we have content to generate audio from
+        if not vibe_script or vibe_script.strip() == "":
+            raise ValueError("Please add some content to generate audio. You can select a vibe or use the Generate Random Content button.")
+        
+        # Use vibe description if available, otherwise use a default
+        description_to_use = vibe_desc if vibe_desc and vibe_desc.strip() else "Custom content"
+        vibe_name = current_vibe if current_vibe else "custom"
+        return voice_to_use, description_to_use, vibe_name
+
+    def toggle_play_stop(voice_name, vibe_desc, vibe_script, request: gr.Request):
         """Handle the play button click and toggle button visibility"""
-        global is_playing, current_voice, current_vibe
+        global is_playing
         is_playing = True
         try:            
-            api_key = check_api_key()
-            
-            # Use global current_voice if available, otherwise parse from voice_name
-            if current_voice:
-                voice_to_use = current_voice
-            elif voice_name and isinstance(voice_name, str):
-                voice_to_use = voice_name.replace("Voice: ", "").strip().lower()
-            else:
-                voice_to_use = "alloy"  # default voice
+            with request_profiler(request, "toggle_play_stop"):
+                voice_to_use, description_to_use, vibe_name = resolve_generation_inputs(voice_name, vibe_desc, vibe_script)
+                current_session.set(request.session_hash if request is not None else None)
             
-            if not voice_to_use:
-                raise ValueError("Invalid voice name. Please select a valid voice.")
+                # Attach to a speculative render of the same selection, if one was started
+                rendered = None
+                if speculator is not None and request is not None:
+                    rendered = speculator.claim(request.session_hash, speculation_key(voice_name, vibe_desc, vibe_script))
+                    print(f"Speculative render stats: {speculator.stats()}")
             
-            # Check if we have content to generate audio from
-            if not vibe_script or vibe_script.strip() == "":
-                raise ValueError("Please add some content to generate audio. You can select a vibe or use the Generate Random Content button.")
+                if rendered is not None:
+                    temp_file, result = rendered
+                else:
+                    # Create a temporary file path
+                    temp_file = os.path.join(temp_dir, f"{voice_to_use}_{vibe_name}_{int(time.time())}.{AUDIO_FILE_EXT}")
+                
+                    # Generate and save audio to temp file, within the usage budget
+                    plan = budget_plan(vibe_script, voice_to_use, description_to_use)
+                    result = run_async(generate_planned_audio_file(plan, vibe_script, temp_file, voice_to_use, description_to_use))
+                    temp_file = audio_file_path(result, temp_file)
+                prune_temp_dir()
             
-            # Use vibe description if available, otherwise use a default
-            description_to_use = vibe_desc if vibe_desc and vibe_desc.strip() else "Custom content"
-            vibe_name = current_vibe if current_vibe else "custom"
-            
-            # Create a temporary file path
-            temp_file = os.path.join(temp_dir, f"{voice_to_use}_{vibe_name}_{int(time.time())}.mp3")
-            
-            # Generate and save audio to temp file
-            asyncio.run(generate_audio_file(vibe_script, temp_file, voice_to_use, description_to_use))
-            
-            gr.Info(f"Audio playing with {voice_to_use.title()} voice...")
-            play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=False)
-            stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=True)
-            return play_btn, stop_btn, temp_file  # Return the path to the temp file
+                gr.Info(f"Audio playing with {voice_to_use.title()} voice ({result.model})...")
+                play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=False)
+                stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=True)
+                return play_btn, stop_btn, *deliver_audio(temp_file, request), result.transcript
             
         except Exception as e:
             is_playing = False
-            play_btn = gr.Button(value="Play", variant="primary", icon=os.path.join("assets", "ic_fluent_play_24_filled.svg"), visible=True)
-            stop_btn = gr.Button(value="Stop", variant="stop", icon=os.path.join("assets", "ic_fluent_stop_24_filled.svg"), visible=False)            
+            raise gr.Error(f"Error playing audio: {str(e)}")
+
+    def stream_play_stop(voice_name, vibe_desc, vibe_script, request: gr.Request):
+        """Streaming variant of toggle_play_stop: push audio batches as they arrive"""
+        global is_playing
+        is_playing = True
+        try:
+            # Time spent in Gradio between batches is not sampled: the
+            # generator is suspended then
+            with request_profiler(request, "stream_play_stop"):
+                voice_to_use, description_to_use, vibe_name = resolve_generation_inputs(voice_name, vibe_desc, vibe_script)
+                current_session.set(request.session_hash if request is not None else None)
+                play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=False)
+                stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=True)
+                plan = budget_plan(vibe_script, voice_to_use, description_to_use)
+                if plan.action == "exhausted":
+                    result = run_async(synthesize_locally(vibe_script, voice_to_use))
+                    yield play_btn, stop_btn, (audio_processing.SAMPLE_RATE, np.frombuffer(result.audio, dtype="<i2")), result.transcript
+                    return
+                result = AudioResult()
+                for batch in stream_audio(voice_to_use, plan.text, description_to_use, result):
+                    if not is_playing:
+                        break
+                    yield play_btn, stop_btn, batch, result.transcript
+                yield play_btn, stop_btn, gr.skip(), result.transcript
+        except Exception as e:
+            is_playing = False
+            raise gr.Error(f"Error playing audio: {str(e)}")
+
+    def preview_play_stop(voice_name, vibe_desc, vibe_script, request: gr.Request):
+        """toggle_play_stop with an instant preview in the local voice
+
+        The full render starts in the background first; the offline preview
+        plays while it runs and is replaced by it once it is ready.
+        """
+        global is_playing
+        is_playing = True
+        try:
+            with request_profiler(request, "preview_play_stop"):
+                voice_to_use, description_to_use, vibe_name = resolve_generation_inputs(voice_name, vibe_desc, vibe_script)
+                current_session.set(request.session_hash if request is not None else None)
+                play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=False)
+                stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=True)
+
+                rendered = None
+                if speculator is not None and request is not None:
+                    rendered = speculator.claim(request.session_hash, speculation_key(voice_name, vibe_desc, vibe_script))
+                if rendered is not None:
+                    temp_file, result = rendered
+                elif (plan := budget_plan(vibe_script, voice_to_use, description_to_use)).action == "exhausted":
+                    # Out of budget: the local voice is all there is, no need for a preview
+                    temp_file = os.path.join(temp_dir, f"{voice_to_use}_{vibe_name}_{time.time_ns()}.wav")
+                    result = run_async(generate_local_audio_file(vibe_script, temp_file, voice_to_use))
+                else:
+                    stem = os.path.join(temp_dir, f"{voice_to_use}_{vibe_name}_{time.time_ns()}")
+                    # The render thread does not inherit the request's context by itself
+                    final = preview_executor.submit(contextvars.copy_context().run, run_async, generate_audio_file(
+                        plan.text, f"{stem}.{AUDIO_FILE_EXT}", voice_to_use, description_to_use))
+                    preview_file = f"{stem}_preview.wav"
+                    preview = run_async(synthesize_locally(plan.text, voice_to_use))
+                    preview.lead_trim = write_audio_file(preview.audio, preview_file, "pcm16")
+                    yield play_btn, stop_btn, *skip_audio(), "Playing a preview while the full render finishes...", \
+                        gr.Audio(value=preview_file, visible=True)
+                    result = final.result()
+                    temp_file = audio_file_path(result, f"{stem}.{AUDIO_FILE_EXT}")
+                prune_temp_dir()
+
+                hide_preview = gr.Audio(value=None, visible=False)
+                if not is_playing:
+                    # Stopped during the preview: do not start the final clip
+                    yield gr.skip(), gr.skip(), *skip_audio(), result.transcript, hide_preview
+                    return
+                gr.Info(f"Audio playing with {voice_to_use.title()} voice ({result.model})...")
+                yield play_btn, stop_btn, *deliver_audio(temp_file, request), result.transcript, hide_preview
+        except Exception as e:
+            is_playing = False
             raise gr.Error(f"Error playing audio: {str(e)}")
 
     def handle_stop():
@@ -919,18 +1444,42 @@ with gr.Blocks(
         gr.Info("Audio stopped")
         play_btn = gr.Button(value="🎵 Generate Audio", variant="primary", elem_classes="generate-button", visible=True)
         stop_btn = gr.Button(value="⏹️ Stop", variant="stop", visible=False)
-        return play_btn, stop_btn, None
-
-    play_btn.click(
-        toggle_play_stop,
-        inputs=[voice_label, vibe_desc, vibe_script],
-        outputs=[play_btn, stop_btn, audio_output]
-    )
+        return play_btn, stop_btn, *deliver_audio(None)
+
+    audio_outputs = [audio_output, clip_player] if AUDIO_DELIVERY else [audio_output]
+    if LOCAL_PREVIEW and not UI_STREAMING:
+        play_btn.click(
+            preview_play_stop,
+            inputs=[voice_selector, vibe_desc, vibe_script],
+            outputs=[play_btn, stop_btn, *audio_outputs, transcript_box, preview_output]
+        )
+        stop_btn.click(lambda: gr.Audio(value=None, visible=False), outputs=[preview_output])
+    else:
+        play_btn.click(
+            stream_play_stop if UI_STREAMING else toggle_play_stop,
+            inputs=[voice_selector, vibe_desc, vibe_script],
+            outputs=[play_btn, stop_btn, *audio_outputs, transcript_box]
+        )
     
     stop_btn.click(
         handle_stop,
-        outputs=[play_btn, stop_btn, audio_output]
+        outputs=[play_btn, stop_btn, *audio_outputs]
     )
+
+    # Usage accounting for capacity planning, e.g. gradio_client's Client(url).predict(api_name="/usage")
+    gr.api(usage_report, api_name="usage")
+    if clip_store is not None:
+        gr.api(delivery_report, api_name="delivery")
         
 if __name__ == "__main__":
-    asyncio.run(demo.launch(favicon_path="assets/ai_studio_icon_color.png"))
\ No newline at end of file
+    if clip_store is not None:
+        import uvicorn
+        from fastapi import FastAPI
+
+        # /audio is routed before Gradio's app, which is mounted at the root
+        app = gr.mount_gradio_app(mount(FastAPI(), clip_store), demo, path="/",
+                                  favicon_path="assets/ai_studio_icon_color.png")
+        uvicorn.run(app, host=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"),
+                    port=int(os.getenv("GRADIO_SERVER_PORT", "7860")))
+    else:
+        asyncio.run(demo.launch(favicon_path="assets/ai_studio_icon_color.png"))
\ No newline at end of file
@@ -0,0 +1,177 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+# Defaults: at most 5 speculative renders per session, finished buffers are
+# kept for a minute before being discarded, and a session unseen for an
+# hour is forgotten along with its render count.
+MAX_PER_SESSION = 5
+TTL_SECONDS = 60.0
+SESSION_TTL_SECONDS = 3600.0
+
+
+class _Speculation:
+    def __init__(self, key, future):
+        self.key = key
+        self.future = future
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+
+class SpeculativeRenderer:
+    """Start renders in the background before the user asks for them.
+
+    start() is called when a selection changes; it cancels any earlier
+    speculation for the session and begins rendering the new key on a
+    dedicated event loop thread. claim() is called on "Generate": if the key
+    matches, it waits for the in-progress render (or takes the finished one)
+    instead of starting from scratch.
+
+    render is an async callable taking the key; discard is called with the
+    result of renders that are never claimed so their files can be removed.
+    """
+
+    def __init__(self, render, discard=None, max_per_session=MAX_PER_SESSION, ttl=TTL_SECONDS,
+                 session_ttl=SESSION_TTL_SECONDS):
+        self.render = render
+        self.discard = discard
+        self.max_per_session = max_per_session
+        self.ttl = ttl
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._spent = {}
+        # Last start/claim/cancel per session; idle sessions expire from
+        # _sessions and _spent together
+        self._last_seen = {}
+        self._loop = None
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.budget_refusals = 0
+        self.seconds_saved = 0.0
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="speculative-render", daemon=True).start()
+            # Expire idle sessions even when no one starts or claims anything
+            self._loop.call_soon_threadsafe(self._purge_periodically)
+        return self._loop
+
+    def _purge_periodically(self):
+        with self._lock:
+            self._purge_expired()
+        self._loop.call_later(self.ttl, self._purge_periodically)
+
+    def _drop(self, speculation):
+        """Cancel a speculation, or discard its result if it already finished"""
+        if speculation.future.cancel():
+            self.cancelled += 1
+            return
+        if self.discard is None:
+            return
+        def discard_result(future):
+            if not future.cancelled() and future.exception() is None:
+                self.discard(future.result())
+        speculation.future.add_done_callback(discard_result)
+
+    def _on_done(self, speculation):
+        def done(future):
+            speculation.finished_at = time.perf_counter()
+        return done
+
+    def _purge_expired(self):
+        """Drop unclaimed results older than ttl and sessions idle for session_ttl"""
+        now = time.perf_counter()
+        for session, speculation in list(self._sessions.items()):
+            if speculation.finished_at and now - speculation.finished_at > self.ttl:
+                del self._sessions[session]
+                self.expired += 1
+                self._drop(speculation)
+        for session, last_seen in list(self._last_seen.items()):
+            if now - last_seen > self.session_ttl:
+                del self._last_seen[session]
+                self._spent.pop(session, None)
+                speculation = self._sessions.pop(session, None)
+                if speculation is not None:
+                    self.expired += 1
+                    self._drop(speculation)
+
+    def start(self, session, key):
+        """Begin rendering key for session, replacing any earlier speculation"""
+        with self._lock:
+            self._purge_expired()
+            self._last_seen[session] = time.perf_counter()
+            previous = self._sessions.get(session)
+            if previous is not None:
+                if previous.key == key:
+                    return
+                del self._sessions[session]
+                self._drop(previous)
+            if self._spent.get(session, 0) >= self.max_per_session:
+                self.budget_refusals += 1
+                return
+            self._spent[session] = self._spent.get(session, 0) + 1
+            self.started += 1
+            future = asyncio.run_coroutine_threadsafe(self.render(key), self._ensure_loop())
+            speculation = _Speculation(key, future)
+            future.add_done_callback(self._on_done(speculation))
+            self._sessions[session] = speculation
+
+    def cancel(self, session):
+        """Cancel the session's speculation (e.g. when the selection is cleared)"""
+        with self._lock:
+            speculation = self._sessions.pop(session, None)
+            if session in self._last_seen:
+                self._last_seen[session] = time.perf_counter()
+            if speculation is not None:
+                self._drop(speculation)
+
+    def claim(self, session, key, timeout=None):
+        """Return the speculative result for key, or None on a miss.
+
+        A matching in-progress render is awaited; a render for a different
+        key is cancelled since the user has moved on.
+        """
+        with self._lock:
+            self._purge_expired()
+            if session in self._last_seen:
+                self._last_seen[session] = time.perf_counter()
+            speculation = self._sessions.pop(session, None)
+            if speculation is None:
+                self.misses += 1
+                return None
+            if speculation.key != key:
+                self.misses += 1
+                self._drop(speculation)
+                return None
+        claimed_at = time.perf_counter()
+        finished_at = speculation.finished_at or claimed_at
+        try:
+            result = speculation.future.result(timeout=timeout)
+        except (concurrent.futures.CancelledError, concurrent.futures.TimeoutError, Exception) as e:
+            print(f"Speculative render not usable: {e}")
+            self.misses += 1
+            return None
+        # Time the render had already spent before the user clicked
+        self.hits += 1
+        self.seconds_saved += finished_at - speculation.started_at
+        return result
+
+    def stats(self):
+        claims = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / claims if claims else 0.0,
+            "cancelled": self.cancelled,
+            "expired": self.expired,
+            "budget_refusals": self.budget_refusals,
+            "seconds_saved": self.seconds_saved,
+            "tracked_sessions": len(self._last_seen),
+        }
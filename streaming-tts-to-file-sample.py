@@ -3,59 +3,94 @@ import os
 import base64
 
 from pathlib import Path
-from openai import AzureOpenAI
 
 from dotenv import load_dotenv
 
+from audio_writer import AtomicAudioWriter
+from endpoint_pool import pool_from_env
+
 load_dotenv()
 
-client = AzureOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
-)
+# One or more Azure OpenAI endpoints (see AZURE_OPENAI_ENDPOINTS)
+endpoint_pool = pool_from_env()
 
 speech_file_path = Path(__file__).parent / "speech.mp3"
 
+# Set STREAM_TO_FILE=true to write the audio incrementally as it is generated
+STREAM_TO_FILE = os.getenv("STREAM_TO_FILE", "false").lower() == "true"
+
 try:
-    # Try gpt-audio model approach first
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-audio"),
-        messages=[
-            {
-                "role": "user", 
-                "content": "Speak in a cheerful and positive tone.\n\nText to speak: Today is a wonderful day to build something people love!"
-            }
-        ],
-        modalities=["text", "audio"],
-        audio={
-            "voice": "coral",
-            "format": "mp3"
-        }
-    )
+    if STREAM_TO_FILE:
+        # Stream the audio deltas straight to disk: memory stays flat however
+        # long the clip is, and the file only appears once it is complete
+        with endpoint_pool.lease() as endpoint:
+            stream = endpoint.client().chat.completions.create(
+                model=endpoint.deployment,
+                messages=[
+                    {
+                        "role": "user", 
+                        "content": "Speak in a cheerful and positive tone.\n\nText to speak: Today is a wonderful day to build something people love!"
+                    }
+                ],
+                modalities=["text", "audio"],
+                audio={
+                    "voice": "coral",
+                    "format": "mp3"
+                },
+                stream=True
+            )
+        
+            with AtomicAudioWriter(speech_file_path, fsync=os.getenv("AUDIO_FILE_FSYNC", "false").lower() == "true") as writer:
+                for chunk in stream:
+                    if hasattr(chunk, 'choices') and chunk.choices:
+                        choice = chunk.choices[0]
+                        if hasattr(choice, 'delta') and hasattr(choice.delta, 'audio') and choice.delta.audio:
+                            if hasattr(choice.delta.audio, 'data') and choice.delta.audio.data:
+                                endpoint.record_ttfb()
+                                writer.write_base64(choice.delta.audio.data)
+        # A stream without audio raises EmptyAudioError and goes to the fallback below
+        print(f"Audio streamed to {speech_file_path} ({writer.bytes_written} bytes, {writer.bytes_per_second / 1024:.0f} KiB/s)")
+    else:
+        # Try gpt-audio model approach first
+        with endpoint_pool.lease(stream=False) as endpoint:
+            response = endpoint.client().chat.completions.create(
+                model=endpoint.deployment,
+                messages=[
+                    {
+                        "role": "user", 
+                        "content": "Speak in a cheerful and positive tone.\n\nText to speak: Today is a wonderful day to build something people love!"
+                    }
+                ],
+                modalities=["text", "audio"],
+                audio={
+                    "voice": "coral",
+                    "format": "mp3"
+                }
+            )
+            endpoint.record_completion()
     
-    # Extract and save audio data
-    if hasattr(response, 'choices') and response.choices:
-        choice = response.choices[0]
-        if hasattr(choice, 'message') and hasattr(choice.message, 'audio') and choice.message.audio:
-            if hasattr(choice.message.audio, 'data') and choice.message.audio.data:
-                audio_bytes = base64.b64decode(choice.message.audio.data)
-                with open(speech_file_path, 'wb') as f:
-                    f.write(audio_bytes)
-                print(f"Audio saved to {speech_file_path}")
+        # Extract and save audio data
+        if hasattr(response, 'choices') and response.choices:
+            choice = response.choices[0]
+            if hasattr(choice, 'message') and hasattr(choice.message, 'audio') and choice.message.audio:
+                if hasattr(choice.message.audio, 'data') and choice.message.audio.data:
+                    audio_bytes = base64.b64decode(choice.message.audio.data)
+                    with open(speech_file_path, 'wb') as f:
+                        f.write(audio_bytes)
+                    print(f"Audio saved to {speech_file_path}")
+                else:
+                    print("No audio data found in response")
             else:
-                print("No audio data found in response")
+                print("No audio in message")
         else:
-            print("No audio in message")
-    else:
-        print("No choices in response")
+            print("No choices in response")
 
 except Exception as e:
     print(f"gpt-audio approach failed: {e}")
     print("Trying fallback TTS approach...")
     
     # Fallback to traditional TTS
-    with client.audio.speech.with_streaming_response.create(
+    with endpoint_pool.lease() as endpoint, endpoint.client().audio.speech.with_streaming_response.create(
         model="tts-1",
         voice="coral",
         input="Today is a wonderful day to build something people love!",
@@ -0,0 +1,337 @@
+import contextvars
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+
+from chunk_batching import BYTES_PER_SECOND
+from segment_cache import split_sentences
+
+# Budgets are enforced over a rolling window, like the deployment's
+# tokens-per-minute quota
+WINDOW_SECONDS = 60.0
+# Starting estimates of what a script costs, refined from observed usage:
+# every gpt-audio request pays for its prompt (mostly the vibe instructions,
+# about 150 tokens) plus roughly 1.5 output tokens (text and audio) per
+# script character, and speech runs at about 15 characters per second
+PROMPT_TOKENS = 150
+TOKENS_PER_CHAR = 1.5
+SECONDS_PER_CHAR = 1 / 15
+ESTIMATE_ALPHA = 0.2
+# Idle sessions are forgotten after an hour, and at most this many are tracked
+SESSION_TTL_SECONDS = 3600.0
+MAX_SESSIONS = 10000
+LATENCY_SAMPLES = 1000
+
+METRICS = ("requests", "input_tokens", "output_tokens", "audio_tokens", "total_tokens", "estimated_tokens",
+           "characters", "audio_seconds", "wall_seconds")
+
+# The session a request is made for. Handlers set it; the async tasks and
+# threads a render runs on inherit it, so recording sites need no argument.
+current_session = contextvars.ContextVar("usage_session", default=None)
+
+
+def usage_amounts(usage):
+    """Token counts from a chat completion usage dict (see usage_to_dict)"""
+    usage = usage or {}
+    prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    audio = sum((usage.get(details) or {}).get("audio_tokens") or 0
+                for details in ("prompt_tokens_details", "completion_tokens_details"))
+    return {
+        "input_tokens": prompt,
+        "output_tokens": completion,
+        "audio_tokens": audio,
+        "total_tokens": usage.get("total_tokens", prompt + completion),
+    }
+
+
+def audio_seconds(result):
+    """Playback length of an AudioResult; estimated from the size for MP3"""
+    if result.duration is not None:
+        return result.duration
+    return result.size / BYTES_PER_SECOND.get(result.format, BYTES_PER_SECOND["mp3"])
+
+
+class RollingWindow:
+    """Totals over the last `window` seconds, kept in one-second buckets"""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self.buckets = deque()
+        self.totals = defaultdict(float)
+        self.last_used = 0.0
+
+    def add(self, amounts, now):
+        second = math.floor(now)
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append((second, defaultdict(float)))
+        bucket = self.buckets[-1][1]
+        for name, value in amounts.items():
+            bucket[name] += value
+            self.totals[name] += value
+        self.last_used = now
+
+    def expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            _, bucket = self.buckets.popleft()
+            for name, value in bucket.items():
+                self.totals[name] -= value
+        if not self.buckets:
+            # Start from exact zeros again rather than accumulate float error
+            self.totals.clear()
+
+    def get(self, name, now):
+        self.expire(now)
+        return self.totals.get(name, 0.0)
+
+    def freed_after(self, name, amount, now):
+        """Seconds until at least `amount` of name has left the window"""
+        self.expire(now)
+        freed = 0.0
+        for second, bucket in self.buckets:
+            freed += bucket.get(name, 0.0)
+            if freed >= amount:
+                return max(second + self.window - now, 0.0)
+        return self.window
+
+
+@dataclass
+class Plan:
+    """What to render for a request given the remaining budget.
+
+    action is "full" (the whole script), "shorter" (its first sentences) or
+    "exhausted" (nothing fits; retry_after says when something will).
+    """
+    action: str
+    text: str = ""
+    sentences: int = 0
+    kept: int = 0
+    cached: int = 0
+    retry_after: float = 0.0
+
+
+class UsageLedger:
+    """Usage accounting and budgets, per session and for the whole server.
+
+    record() is called with every response: gpt-audio token usage, tts-1
+    characters, audio seconds and wall time. Responses without usage (tts-1)
+    are charged an estimate from their characters, counted in
+    estimated_tokens as well as total_tokens. Rolling totals over `window`
+    seconds are kept per session and globally and checked against the
+    budgets (0 means unlimited); lifetime totals and latencies are kept per
+    model for capacity planning (report()).
+    """
+
+    def __init__(self, window=WINDOW_SECONDS, session_tokens=0, global_tokens=0,
+                 session_audio_seconds=0, global_audio_seconds=0,
+                 session_ttl=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS, clock=time.monotonic):
+        self.window = window
+        self.budgets = {
+            ("session", "total_tokens"): session_tokens,
+            ("global", "total_tokens"): global_tokens,
+            ("session", "audio_seconds"): session_audio_seconds,
+            ("global", "audio_seconds"): global_audio_seconds,
+        }
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.prompt_tokens = PROMPT_TOKENS
+        self.tokens_per_char = TOKENS_PER_CHAR
+        self.seconds_per_char = SECONDS_PER_CHAR
+        self.plans = Counter()
+        self._lock = threading.Lock()
+        self._global = RollingWindow(window)
+        self._sessions = OrderedDict()
+        self._models = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    @property
+    def enabled(self):
+        return any(self.budgets.values())
+
+    def _session_window(self, session, now):
+        window = self._sessions.get(session)
+        if window is None:
+            window = self._sessions[session] = RollingWindow(self.window)
+        self._sessions.move_to_end(session)
+        # Oldest first: stop at the first session still in use
+        while self._sessions:
+            oldest, oldest_window = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - oldest_window.last_used < self.session_ttl:
+                break
+            if oldest == session:
+                break
+            del self._sessions[oldest]
+        return window
+
+    def record(self, model, usage=None, characters=0, audio_seconds=0.0, wall_seconds=0.0, session=None,
+               billable=True):
+        """Add one response to the counters; non-billable ones (local renders) skip the budgets"""
+        if session is None:
+            session = current_session.get()
+        amounts = {"requests": 1, **usage_amounts(usage), "estimated_tokens": 0, "characters": characters,
+                   "audio_seconds": audio_seconds, "wall_seconds": wall_seconds}
+        now = self.clock()
+        with self._lock:
+            if usage is None and characters and billable:
+                # tts-1 reports no usage but still draws on the deployment:
+                # charge it like the audio of a gpt-audio response (it has no prompt)
+                amounts["estimated_tokens"] = amounts["total_tokens"] = round(characters * self.tokens_per_char)
+            if billable:
+                self._global.add(amounts, now)
+                if session is not None:
+                    self._session_window(session, now).add(amounts, now)
+            totals = self._models[model]
+            for name, value in amounts.items():
+                totals[name] += value
+            self._latencies[model].append(wall_seconds)
+            if characters and billable:
+                # Learn the cost of a character from the models that report
+                # tokens. The prompt is paid once per request whatever the
+                # script length, so it is learned separately from the output,
+                # which scales with the characters.
+                if usage is not None and amounts["output_tokens"]:
+                    self.prompt_tokens += ESTIMATE_ALPHA * (amounts["input_tokens"] - self.prompt_tokens)
+                    self.tokens_per_char += ESTIMATE_ALPHA * (amounts["output_tokens"] / characters - self.tokens_per_char)
+                if audio_seconds:
+                    self.seconds_per_char += ESTIMATE_ALPHA * (audio_seconds / characters - self.seconds_per_char)
+
+    def remaining(self, session=None):
+        """{"total_tokens": n, "audio_seconds": s} left in the window; inf when unlimited"""
+        if session is None:
+            session = current_session.get()
+        now = self.clock()
+        left = {"total_tokens": math.inf, "audio_seconds": math.inf}
+        with self._lock:
+            for (scope, name), budget in self.budgets.items():
+                if not budget:
+                    continue
+                window = self._global if scope == "global" else self._sessions.get(session)
+                used = window.get(name, now) if window is not None else 0.0
+                left[name] = min(left[name], budget - used)
+        return left
+
+    def _retry_after(self, session, tokens, seconds):
+        """Seconds until a request needing tokens/seconds fits every budget"""
+        now = self.clock()
+        wait = 0.0
+        with self._lock:
+            for (scope, name), budget in self.budgets.items():
+                window = self._global if scope == "global" else self._sessions.get(session)
+                if not budget or window is None:
+                    continue
+                need = tokens if name == "total_tokens" else seconds
+                excess = window.get(name, now) + need - budget
+                if excess > 0:
+                    wait = max(wait, window.freed_after(name, excess, now))
+        return wait
+
+    def estimate_tokens(self, characters, requests=1):
+        """Expected tokens for `characters` script characters sent in `requests` requests"""
+        return requests * self.prompt_tokens + characters * self.tokens_per_char
+
+    def can_spend(self, tokens, session=None):
+        """True if a request of about `tokens` tokens fits the token budgets"""
+        return self.remaining(session)["total_tokens"] >= tokens
+
+    def average_tokens(self, model, default):
+        """Mean tokens per request seen for model, for estimating its next request"""
+        with self._lock:
+            totals = self._models.get(model)
+            if not totals or not totals["requests"]:
+                return default
+            return totals["total_tokens"] / totals["requests"]
+
+    def plan(self, text, session=None, is_cached=None, segmented=False):
+        """Fit a script to the remaining budget.
+
+        Sentences are kept in order while their estimated cost fits; those
+        for which is_cached(sentence) is true cost nothing. A script that
+        does not fit entirely is cut after the last sentence that does.
+        segmented means every sentence is its own request and pays for its
+        own prompt; otherwise the prompt is paid once.
+        """
+        if session is None:
+            session = current_session.get()
+        left = self.remaining(session)
+        sentences = split_sentences(text) or [text]
+        if math.isinf(left["total_tokens"]) and math.isinf(left["audio_seconds"]):
+            self.plans["full"] += 1
+            return Plan("full", text, len(sentences), len(sentences))
+        kept, cached, tokens, seconds, rendered = [], 0, 0.0, 0.0, 0
+        for sentence in sentences:
+            if is_cached is not None and is_cached(sentence):
+                kept.append(sentence)
+                cached += 1
+                continue
+            cost_tokens = self.estimate_tokens(len(sentence), requests=1 if segmented or not rendered else 0)
+            cost_seconds = len(sentence) * self.seconds_per_char
+            if tokens + cost_tokens > left["total_tokens"] or seconds + cost_seconds > left["audio_seconds"]:
+                break
+            kept.append(sentence)
+            rendered += 1
+            tokens, seconds = tokens + cost_tokens, seconds + cost_seconds
+        if len(kept) == len(sentences):
+            plan = Plan("full", text, len(sentences), len(kept), cached)
+        elif kept:
+            plan = Plan("shorter", " ".join(kept), len(sentences), len(kept), cached)
+        else:
+            first = len(sentences[0])
+            plan = Plan("exhausted", "", len(sentences), 0, 0,
+                        self._retry_after(session, self.estimate_tokens(first), first * self.seconds_per_char))
+        self.plans[plan.action] += 1
+        return plan
+
+    def report(self, top=5):
+        """Current accounting: window totals, busiest sessions, per-model lifetime totals and latency"""
+        now = self.clock()
+        with self._lock:
+            window = {name: self._global.get(name, now) for name in METRICS}
+            sessions = [(session, w.get("total_tokens", now), w.get("audio_seconds", now))
+                        for session, w in self._sessions.items()]
+            models = {}
+            for model, totals in self._models.items():
+                latencies = sorted(self._latencies[model])
+                models[model] = {
+                    **totals,
+                    "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+                    "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+                }
+            estimates = {"prompt_tokens": self.prompt_tokens, "tokens_per_char": self.tokens_per_char,
+                         "seconds_per_char": self.seconds_per_char}
+        sessions.sort(key=lambda s: (-s[1], -s[2]))
+        return {
+            "window_seconds": self.window,
+            "budgets": {f"{scope}_{name}": budget for (scope, name), budget in self.budgets.items()},
+            "window": window,
+            # Rate per minute over the window, comparable to the deployment's TPM quota
+            "tokens_per_minute": window["total_tokens"] * 60 / self.window,
+            "active_sessions": len(sessions),
+            "top_sessions": [{"session": s, "total_tokens": t, "audio_seconds": a} for s, t, a in sessions[:top]],
+            "models": models,
+            "plans": dict(self.plans),
+            "estimates": estimates,
+        }
+
+
+if __name__ == "__main__":
+    import json
+    import random
+
+    # Simulated minute of traffic: one heavy user among light ones, with a
+    # per-session budget of 2,000 tokens/min and a global one of 10,000
+    clock = [0.0]
+    ledger = UsageLedger(session_tokens=2000, global_tokens=10000, clock=lambda: clock[0])
+    rng = random.Random(0)
+    script = "Welcome to the show. " * 8
+    for step in range(120):
+        clock[0] = step * 0.5
+        session = "heavy" if step % 2 == 0 else f"light-{rng.randrange(20)}"
+        plan = ledger.plan(script, session=session)
+        if plan.action != "exhausted":
+            chars = len(plan.text)
+            tokens = int(chars * rng.uniform(1.2, 1.8))
+            ledger.record("gpt-audio", {"prompt_tokens": 40, "completion_tokens": tokens, "total_tokens": tokens + 40},
+                          characters=chars, audio_seconds=chars / 15, wall_seconds=rng.uniform(1, 3), session=session)
+    print(json.dumps(ledger.report(), indent=2))
@@ -0,0 +1,250 @@
+import bisect
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+FIELDS = ("Vibe", "Description", "Script")
+# A match in the vibe's name outranks one in its description or script
+FIELD_WEIGHTS = {"Vibe": 4.0, "Description": 2.0, "Script": 1.0}
+PAGE_SIZE = 5
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def unescape(text):
+    # vibe.json stores newlines as literal "\n" sequences
+    return text.replace("\\n", "\n")
+
+
+@dataclass
+class VibePage:
+    names: list = field(default_factory=list)
+    total: int = 0
+    page: int = 0
+    pages: int = 1
+    # Set for a shuffled order: paging with the same seed continues it
+    seed: Optional[int] = None
+
+
+def shuffled_position(i, n, seed):
+    """Where position i of range(n) lands in a seeded pseudo-random permutation.
+
+    A small Feistel network over the next power of four with cycle walking,
+    so a page of a shuffled order costs O(page size) whatever n is.
+    """
+    half = (max((n - 1).bit_length(), 2) + 1) // 2
+    mask = (1 << half) - 1
+    while True:
+        left, right = i >> half, i & mask
+        for step in range(4):
+            left, right = right, left ^ (zlib.crc32(f"{seed}:{step}:{right}".encode("ascii")) & mask)
+        i = (left << half) | right
+        if i < n:
+            return i
+
+
+class VibeCatalog:
+    """In-memory vibe catalog with a prefix-matching inverted index.
+
+    Each field has its own postings (token -> vibe ids) and a sorted
+    vocabulary, so a query token matches every indexed word it is a prefix
+    of ("cal" finds "Calm" and "calming"). Query tokens are ANDed and results
+    are ranked by field weight. Matching and ranking are set operations on
+    the postings, grouped by score, so a query costs about as much as the
+    page it shows rather than the catalog. Lookups by name are a dict access
+    instead of a re-read of vibe.json.
+    """
+
+    def __init__(self, vibes=()):
+        self._vibes = {}
+        # Vibe ids are catalog positions; a replaced vibe keeps its id
+        self._ids = {}
+        self._names = []
+        self._postings = {name: defaultdict(set) for name in FIELDS}
+        self._vocabulary = {name: [] for name in FIELDS}
+        self._dirty = False
+        for vibe in vibes:
+            self.add(vibe)
+
+    @classmethod
+    def from_files(cls, paths):
+        """Load vibe lists from JSON files; directories contribute their *.json files"""
+        catalog = cls()
+        for path in paths:
+            files = [path]
+            if os.path.isdir(path):
+                files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json"))
+            for file in files:
+                with open(file, "r", encoding="utf-8") as f:
+                    for vibe in json.load(f):
+                        catalog.add(vibe)
+        return catalog
+
+    def __len__(self):
+        return len(self._vibes)
+
+    def __contains__(self, name):
+        return name in self._vibes
+
+    def add(self, vibe):
+        """Add a {"Vibe", "Description", "Script"} entry; a later entry with the same name replaces it"""
+        name = vibe["Vibe"]
+        if name in self._vibes:
+            self._unindex(name)
+        else:
+            self._ids[name] = len(self._names)
+            self._names.append(name)
+        entry = {key: unescape(vibe.get(key, "")) for key in FIELDS}
+        self._vibes[name] = entry
+        for key in FIELDS:
+            for token in set(tokenize(entry[key])):
+                self._postings[key][token].add(self._ids[name])
+        self._dirty = True
+
+    def _unindex(self, name):
+        for key in FIELDS:
+            for token in set(tokenize(self._vibes[name][key])):
+                ids = self._postings[key][token]
+                ids.discard(self._ids[name])
+                if not ids:
+                    del self._postings[key][token]
+
+    def _refresh(self):
+        if self._dirty:
+            self._vocabulary = {key: sorted(self._postings[key]) for key in FIELDS}
+            self._dirty = False
+
+    def get(self, name):
+        """Return (description, script) for a vibe, or empty strings"""
+        entry = self._vibes.get(name)
+        return (entry["Description"], entry["Script"]) if entry else ("", "")
+
+    def _tiers(self, token, fields):
+        """[(weight, ids)] for one query token, best first, each id in its best tier only"""
+        levels = defaultdict(set)
+        for key in fields:
+            vocabulary = self._vocabulary[key]
+            first = bisect.bisect_left(vocabulary, token)
+            last = bisect.bisect_left(vocabulary, token + "\U0010ffff", first)
+            exact = first < last and vocabulary[first] == token
+            if exact:
+                levels[FIELD_WEIGHTS[key]] |= self._postings[key][token]
+            # Exact words count more than prefix matches
+            prefixed = [self._postings[key][word] for word in vocabulary[first + exact:last]]
+            if prefixed:
+                levels[FIELD_WEIGHTS[key] * 0.5] |= set().union(*prefixed)
+        tiers, seen = [], set()
+        for weight in sorted(levels, reverse=True):
+            ids = levels[weight] - seen
+            if ids:
+                tiers.append((weight, ids))
+                seen |= ids
+        return tiers
+
+    def _groups(self, query, fields):
+        """[(score, ids)] of vibes matching every query token, best first; None for an empty query"""
+        tokens = tokenize(query or "")
+        if not tokens:
+            return None
+        self._refresh()
+        # A vibe's score is the sum over tokens of its best tier; vibes are
+        # grouped by score so each step is a handful of set intersections
+        groups = {0.0: None}
+        for token in tokens:
+            tiers = self._tiers(token, fields)
+            combined = defaultdict(set)
+            for score, ids in groups.items():
+                for weight, tier in tiers:
+                    matched = tier if ids is None else ids & tier
+                    if matched:
+                        combined[score + weight] |= matched
+            groups = combined
+            if not groups:
+                break
+        return sorted(groups.items(), reverse=True)
+
+    def _matches(self, groups):
+        """All matching ids in catalog order, for a shuffled order of the matches"""
+        if groups is None:
+            return range(len(self._names))
+        return sorted(set().union(*(ids for _, ids in groups)))
+
+    def search(self, query="", fields=FIELDS):
+        """Names matching every token of the query, best first"""
+        groups = self._groups(query, fields)
+        if groups is None:
+            return list(self._names)
+        # Equal scores keep catalog order
+        return [self._names[i] for _, ids in groups for i in sorted(ids)]
+
+    def page(self, query="", fields=FIELDS, page=0, page_size=PAGE_SIZE, seed=None):
+        """One page of the matches, ranked, or in the shuffled order given by seed"""
+        groups = self._groups(query, fields)
+        total = len(self._names) if groups is None else sum(len(ids) for _, ids in groups)
+        pages = max((total + page_size - 1) // page_size, 1)
+        page = min(max(page, 0), pages - 1)
+        start, end = page * page_size, min((page + 1) * page_size, total)
+        if seed is not None:
+            matches = self._matches(groups)
+            ids = [matches[shuffled_position(i, total, seed)] for i in range(start, end)]
+        elif groups is None:
+            ids = range(start, end)
+        else:
+            # Only sort the score groups the requested page falls in
+            ids, offset = [], 0
+            for _, group in groups:
+                if offset + len(group) > start:
+                    ids.extend(sorted(group)[max(start - offset, 0):end - offset])
+                offset += len(group)
+                if offset >= end:
+                    break
+        return VibePage([self._names[i] for i in ids], total, page, pages, seed)
+
+    def sample(self, k=PAGE_SIZE, query="", fields=FIELDS, rng=random):
+        """The first page of a new shuffled order of the vibes matching the query"""
+        return self.page(query, fields, 0, k, seed=rng.getrandbits(32))
+
+
+def synthetic_vibes(n, seed=0):
+    rng = random.Random(seed)
+    words = ["calm", "bright", "noir", "cheerful", "serene", "urgent", "warm", "dry", "epic", "gentle",
+             "pirate", "news", "coach", "story", "sports", "whisper", "formal", "playful", "robot", "poet"]
+    return [{
+        "Vibe": f"{rng.choice(words).title()} {rng.choice(words).title()} {i}",
+        "Description": " ".join(rng.choices(words, k=60)),
+        "Script": " ".join(rng.choices(words, k=120)),
+    } for i in range(n)]
+
+
+if __name__ == "__main__":
+    # Per-interaction cost: the old UI re-sent one button update per vibe on
+    # every shuffle/selection; the catalog sends one page of names
+    print(f"{'vibes':>7} {'index s':>8} {'search ms':>10} {'shuffle ms':>11} {'page bytes':>11} {'old payload bytes':>18}")
+    for n in (30, 1000, 10000):
+        vibes = synthetic_vibes(n)
+        started_at = time.perf_counter()
+        catalog = VibeCatalog(vibes)
+        catalog.search("warm")
+        indexed = time.perf_counter() - started_at
+        started_at = time.perf_counter()
+        for query in ("calm", "pi", "warm story", "", "noir whisper"):
+            result = catalog.page(query, page=1)
+        search_ms = (time.perf_counter() - started_at) / 5 * 1000
+        started_at = time.perf_counter()
+        shuffled = catalog.sample()
+        catalog.page(page=1, seed=shuffled.seed)
+        shuffle_ms = (time.perf_counter() - started_at) / 2 * 1000
+        page_bytes = len(json.dumps(result.names))
+        old_bytes = len(json.dumps([{"value": v["Vibe"], "variant": "secondary", "visible": False} for v in vibes]))
+        print(f"{n:>7} {indexed:>8.2f} {search_ms:>10.2f} {shuffle_ms:>11.3f} {page_bytes:>11} {old_bytes:>18}")